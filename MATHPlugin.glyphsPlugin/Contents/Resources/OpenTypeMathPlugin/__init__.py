@@ -1,24 +1,27 @@
-import AppKit
-import objc
-from GlyphsApp import GSGlyphReference
+try:
+    import AppKit
+    import objc
+    from GlyphsApp import GSGlyphReference, Message
+except ImportError:
+    # Running outside of Glyphs, e.g. OpenTypeMathPlugin.headless.
+    AppKit = None
 
+if AppKit is not None:
 
-def __GSGlyphReference__str__(self):
-    return self.glyph.name
+    def __GSGlyphReference__str__(self):
+        return self.glyph.name
 
+    GSGlyphReference.__str__ = objc.python_method(__GSGlyphReference__str__)
 
-GSGlyphReference.__str__ = objc.python_method(__GSGlyphReference__str__)
+    def __GSGlyphReference__eq__(self, other):
+        return self.glyph.name == other.glyph.name
 
-
-def __GSGlyphReference__eq__(self, other):
-    return self.glyph.name == other.glyph.name
-
-
-GSGlyphReference.__eq__ = objc.python_method(__GSGlyphReference__eq__)
+    GSGlyphReference.__eq__ = objc.python_method(__GSGlyphReference__eq__)
 
 pluginBundle = None
-path = __file__[: __file__.rfind("Contents/Resources/")]
-pluginBundle = AppKit.NSBundle.bundleWithPath_(path)
+if AppKit is not None:
+    path = __file__[: __file__.rfind("Contents/Resources/")]
+    pluginBundle = AppKit.NSBundle.bundleWithPath_(path)
 
 """
     when you add more `NSLocalizedString()`, run this from the command line (with the
@@ -34,4 +37,12 @@ pluginBundle = AppKit.NSBundle.bundleWithPath_(path)
 
 
 def NSLocalizedString(string, comment):
+    if pluginBundle is None:
+        return string
     return pluginBundle.localizedStringForKey_value_table_(string, string, None)
+
+
+def _message(message):
+    from OpenTypeMathPlugin.constants import NAME
+
+    Message(message, NAME)
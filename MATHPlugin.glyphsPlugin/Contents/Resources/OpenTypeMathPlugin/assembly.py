@@ -0,0 +1,131 @@
+"""Layout of glyph assemblies, following the algorithm of MathML Core
+(https://w3c.github.io/mathml-core/#shaping-of-the-glyph-assembly), without
+any Glyphs objects, so it can be used and measured anywhere."""
+
+import math
+from collections import namedtuple
+from itertools import accumulate
+
+# GlyphPartRecord.PartFlags
+EXTENDER_FLAG = 0x0001
+
+AssemblyPart = namedtuple("AssemblyPart", ["advance", "start", "end", "extender"])
+AssemblyPart.__doc__ = """One part of an assembly: its full advance in the
+direction of the assembly, its start and end connector lengths, and whether
+it is an extender."""
+
+AssemblyLayout = namedtuple(
+    "AssemblyLayout", ["repeats", "overlap", "size", "positions"]
+)
+AssemblyLayout.__doc__ = """An assembly stretched to some size: the number of
+times each extender is repeated, the overlap between all adjacent parts, the
+resulting size, and the offset of every placed part as (index, offset)."""
+
+
+def assemblyParts(assembly, advances):
+    """AssemblyParts from assembly userData records, which are (glyph, flags,
+    start, end), and the advance of each part."""
+    return [
+        AssemblyPart(advance, start, end, bool(flags & EXTENDER_FLAG))
+        for (_, flags, start, end), advance in zip(assembly, advances)
+    ]
+
+
+class AssemblyEngine:
+    """Stretches an assembly of `parts` with the given MinConnectorOverlap.
+
+    The sums the layout depends on are computed once, so solving for a target
+    size takes constant time and placing the parts is linear in their
+    number."""
+
+    def __init__(self, parts, minOverlap=0):
+        self.parts = list(parts)
+        self.minOverlap = minOverlap
+
+        extenders = [p for p in self.parts if p.extender]
+        self.extenderCount = len(extenders)
+        self.nonExtenderCount = len(self.parts) - self.extenderCount
+        self.extenderAdvance = sum(p.advance for p in extenders)
+        self.nonExtenderAdvance = sum(p.advance for p in self.parts) - (
+            self.extenderAdvance
+        )
+
+        # The largest overlap the connectors allow, which depends on which
+        # parts end up adjacent: without extenders, with each extender once,
+        # or with extenders repeated next to themselves.
+        self.connectorLimits = [
+            self._connectorLimit(self._sequence(r)) for r in range(3)
+        ]
+
+    def _sequence(self, repeats):
+        sequence = []
+        for i, part in enumerate(self.parts):
+            sequence.extend([i] * (repeats if part.extender else 1))
+        return sequence
+
+    def _connectorLimit(self, sequence):
+        limits = [
+            min(self.parts[a].end, self.parts[b].start)
+            for a, b in zip(sequence, sequence[1:])
+        ]
+        return min(limits, default=0)
+
+    @property
+    def stretchable(self):
+        """Whether repeating the extenders makes the assembly larger."""
+        return self.extenderAdvance - self.minOverlap * self.extenderCount > 0
+
+    def count(self, repeats):
+        """The number of parts placed when each extender is repeated
+        `repeats` times."""
+        return self.nonExtenderCount + repeats * self.extenderCount
+
+    def advance(self, repeats):
+        return self.nonExtenderAdvance + repeats * self.extenderAdvance
+
+    def maxOverlap(self, repeats):
+        return max(self.minOverlap, self.connectorLimits[min(repeats, 2)])
+
+    def size(self, repeats, overlap):
+        """The size of the assembly with `repeats` and `overlap`."""
+        return self.advance(repeats) - max(self.count(repeats) - 1, 0) * overlap
+
+    def solve(self, target):
+        """The (repeats, overlap) that stretch the assembly to at least
+        `target`, with as few parts as possible and then the overlap as
+        large as possible."""
+        minOverlap = self.minOverlap
+        repeats = 0
+        if self.extenderCount and not self.stretchable:
+            # Repeating the extenders does not help, show them once.
+            repeats = 1
+        elif self.extenderCount:
+            needed = target - self.nonExtenderAdvance
+            needed += minOverlap * (self.nonExtenderCount - 1)
+            step = self.extenderAdvance - minOverlap * self.extenderCount
+            repeats = max(0, math.ceil(needed / step))
+            if not self.nonExtenderCount:
+                repeats = max(1, repeats)
+
+        count = self.count(repeats)
+        if count < 2:
+            return repeats, minOverlap
+        overlap = (self.advance(repeats) - target) / (count - 1)
+        overlap = min(overlap, self.connectorLimits[min(repeats, 2)])
+        return repeats, max(minOverlap, overlap)
+
+    def arrange(self, repeats, overlap):
+        """The AssemblyLayout with `repeats` and `overlap`."""
+        sequence = self._sequence(repeats)
+        advances = [self.parts[i].advance - overlap for i in sequence]
+        offsets = accumulate(advances[:-1], initial=0)
+        return AssemblyLayout(
+            repeats,
+            overlap,
+            self.size(repeats, overlap),
+            list(zip(sequence, offsets)),
+        )
+
+    def layout(self, target):
+        """The AssemblyLayout stretched to `target`."""
+        return self.arrange(*self.solve(target))
@@ -1,127 +1,246 @@
+import hashlib
+from collections import namedtuple
+
 from OpenTypeMathPlugin.constants import (
     CONSTANTS_ID,
     EXTENDED_SHAPE_ID,
-    ITALIC_CORRECTION_ANCHOR,
     KERN_BOTTOM_LEFT_ANCHOR,
     KERN_BOTTOM_RIGHT_ANCHOR,
     KERN_TOP_LEFT_ANCHOR,
     KERN_TOP_RIGHT_ANCHOR,
-    TOP_ACCENT_ANCHOR,
+    MATH_ANCHOR_PREFIX,
     H_ASSEMBLY_ID,
     H_VARIANTS_ID,
     VARIANTS_ID,
     V_ASSEMBLY_ID,
     V_VARIANTS_ID,
 )
-from OpenTypeMathPlugin.helpers import _bboxHeight, _bboxWidth
+from OpenTypeMathPlugin.helpers import MetricsIndex, anchorKey, parseMathAnchors
+from OpenTypeMathPlugin.sfnt import canSpliceTable, spliceTable
+
+KERNING_SIDES = {
+    KERN_TOP_RIGHT_ANCHOR: "TopRight",
+    KERN_TOP_LEFT_ANCHOR: "TopLeft",
+    KERN_BOTTOM_RIGHT_ANCHOR: "BottomRight",
+    KERN_BOTTOM_LEFT_ANCHOR: "BottomLeft",
+}
+
+GlyphMathData = namedtuple(
+    "GlyphMathData",
+    [
+        "italic",
+        "accent",
+        "kerns",
+        "extended",
+        "vVariants",
+        "hVariants",
+        "vAssembly",
+        "hAssembly",
+    ],
+)
+
+
+def _glyphKey(glyph):
+    """The MATH data stored on the glyph itself, shared by all its layers."""
+    varData = glyph.userData.get(VARIANTS_ID) or {}
+    return (
+        bool(glyph.userData[EXTENDED_SHAPE_ID]),
+        tuple(str(n) for n in varData.get(V_VARIANTS_ID) or ()),
+        tuple(str(n) for n in varData.get(H_VARIANTS_ID) or ()),
+    )
+
+
+def _fingerprint(glyphKey, layer):
+    """Everything in a glyph that its MATH data is derived from."""
+    layerData = layer.userData.get(VARIANTS_ID) or {}
+    return (
+        layer.width,
+        anchorKey(layer),
+        *glyphKey,
+        tuple((str(p[0]), *p[1:]) for p in layerData.get(V_ASSEMBLY_ID) or ()),
+        tuple((str(p[0]), *p[1:]) for p in layerData.get(H_ASSEMBLY_ID) or ()),
+    )
+
+
+def _glyphMathData(fingerprint):
+    width, anchors, extended, vVars, hVars, vAssembly, hAssembly = fingerprint
+
+    anchors = parseMathAnchors(anchors)
+    italic = None if anchors.italic is None else anchors.italic - width
+    accent = anchors.accent
+
+    kerns = {}
+    for corner, pts in anchors.kerns.items():
+        side = KERNING_SIDES[corner]
+        if side.endswith("Right"):
+            kernValues = [x - width for x, _ in pts]
+        else:
+            kernValues = [-x for x, _ in pts]
+        correctionHeights = [y for _, y in pts[:-1]]
+        kerns[side] = (correctionHeights, kernValues)
+
+    return GlyphMathData(
+        italic, accent, kerns, extended, vVars, hVars, vAssembly, hAssembly
+    )
+
+
+def _mathDataDigest(mathData):
+    mathData = dict(mathData, extendedShapes=sorted(mathData["extendedShapes"]))
+    return hashlib.sha1(repr(mathData).encode("utf-8")).digest()
+
+
+def _hasMathData(glyph):
+    if glyph.userData[VARIANTS_ID] or glyph.userData[EXTENDED_SHAPE_ID]:
+        return True
+    for layer in glyph.layers:
+        if layer.userData[VARIANTS_ID]:
+            return True
+        if any(a.name.startswith(MATH_ANCHOR_PREFIX) for a in layer.anchors):
+            return True
+    return False
+
+
+class BuildContext:
+    """Font level data shared by the builds of all instances of a font: the
+    production names, the glyphs that carry any MATH data, their resolved
+    glyph-level variants and their lastChange."""
+
+    def __init__(self, font):
+        if font.customParameters["Don't use Production Names"]:
+            self.productionMap = {g.name: g.name for g in font.glyphs}
+        else:
+            self.productionMap = {
+                g.name: g.productionName or g.name for g in font.glyphs
+            }
+        self.glyphKeys = {}
+        self.versions = {}
+        for glyph in font.glyphs:
+            if _hasMathData(glyph):
+                self.glyphKeys[glyph.name] = _glyphKey(glyph)
+                self.versions[glyph.name] = glyph.lastChange
+
+
+class MathGlyphCache:
+    """Per-glyph MATH data of a font, kept between builds.
+
+    Each entry is keyed by the lastChange of the glyph, which Glyphs updates
+    on every edit of the glyph or its layers, so a build only reads the
+    glyphs that changed since the previous one. Those are fingerprinted,
+    their layer, anchors and MATH userData, and only reprocessed if the
+    fingerprint changed too. Glyphs without a lastChange are always
+    fingerprinted. `scope` is whatever else the glyphs depend on, such as the
+    location of an interpolated instance, the cache is dropped when it
+    changes. The last compiled table is kept as well, so that the other
+    output formats of the same instance reuse it."""
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.entries = {}
+        self.dirty = []
+        self.compiled = None
+
+    def update(self, font, master, context=None):
+        if context is None:
+            glyphs = ((g, _glyphKey(g), None) for g in font.glyphs)
+        else:
+            glyphs = (
+                (font.glyphs[name], key, context.versions[name])
+                for name, key in context.glyphKeys.items()
+            )
+
+        entries = {}
+        dirty = []
+        for glyph, glyphKey, version in glyphs:
+            if glyph is None:
+                continue
+            entry = self.entries.get(glyph.name)
+            if version is None or entry is None or entry[0] != version:
+                fingerprint = _fingerprint(glyphKey, glyph.layers[master.id])
+                if entry is None or entry[1] != fingerprint:
+                    entry = (version, fingerprint, _glyphMathData(fingerprint))
+                    dirty.append(glyph.name)
+                else:
+                    entry = (version, *entry[1:])
+            entries[glyph.name] = entry
+        self.entries = entries
+        self.dirty = dirty
+        return {name: entry[2] for name, entry in entries.items()}
 
 
 class MathTableBuilder:
     @staticmethod
-    def buildMathTable(font, ttFont):
+    def collectMathData(font, cache=None, context=None, master=None, instance=None):
+        """Collect the MATH data of `font` as keyword arguments for
+        fontTools' buildMathTable(), or None if there is no MATH data.
+
+        This reads the first master and instance, which for an interpolated
+        font are the instance itself, unless `master` and `instance` are
+        given."""
         if not font:
             return
 
-        instance = font.instances[0]
-        master = font.masters[0]
+        if instance is None:
+            instance = font.instances[0]
+        if master is None:
+            master = font.masters[0]
 
         constants = dict(master.userData.get(CONSTANTS_ID, {}))
         min_connector_overlap = constants.pop("MinConnectorOverlap", 0)
 
-        if (
-            font.customParameters["Don't use Production Names"]
-            or instance.customParameters["Don't use Production Names"]
-        ):
-            productionMap = {g.name: g.name for g in font.glyphs}
-        else:
-            productionMap = {g.name: g.productionName or g.name for g in font.glyphs}
+        if context is None:
+            context = BuildContext(font)
+        productionMap = context.productionMap
+        if instance.customParameters["Don't use Production Names"]:
+            productionMap = {n: n for n in productionMap}
+
+        metrics = MetricsIndex(font, productionMap, master.id)
+
+        if cache is None:
+            cache = MathGlyphCache()
+        glyphData = cache.update(font, master, context)
 
         italic = {}
         accent = {}
         kerning = {}
         extended = set()
-        kerning_sides = {
-            KERN_TOP_RIGHT_ANCHOR: "TopRight",
-            KERN_TOP_LEFT_ANCHOR: "TopLeft",
-            KERN_BOTTOM_RIGHT_ANCHOR: "BottomRight",
-            KERN_BOTTOM_LEFT_ANCHOR: "BottomLeft",
-        }
-        for glyph in font.glyphs:
-            name = productionMap[glyph.name]
-            layer = glyph.layers[0]
-            kerns = {}
-            for anchor in layer.anchors:
-                if anchor.name == ITALIC_CORRECTION_ANCHOR:
-                    italic[name] = anchor.position.x - layer.width
-                elif anchor.name == TOP_ACCENT_ANCHOR:
-                    accent[name] = anchor.position.x
-                else:
-                    for aName in kerning_sides.keys():
-                        if anchor.name.startswith(aName):
-                            side = kerning_sides[aName]
-                            pt = anchor.position
-                            if side.endswith("Right"):
-                                pt.x -= layer.width
-                            elif side.endswith("Left"):
-                                pt.x = -pt.x
-                            kerns.setdefault(side, []).append(pt)
-            if kerns:
-                kerning[name] = {}
-                for side, pts in kerns.items():
-                    pts = sorted(pts, key=lambda pt: pt.y)
-                    correctionHeights = [pt.y for pt in pts[:-1]]
-                    kernValues = [pt.x for pt in pts]
-                    kerning[name][side] = (correctionHeights, kernValues)
-            if glyph.userData[EXTENDED_SHAPE_ID]:
-                extended.add(name)
-
         vVariants = {}
         hVariants = {}
         vAssemblies = {}
         hAssemblies = {}
-        for glyph in font.glyphs:
-            name = productionMap[glyph.name]
-            varData = glyph.userData.get(VARIANTS_ID, {})
-            if vVars := varData.get(V_VARIANTS_ID):
-                vVariants[name] = [
-                    (productionMap[str(n)], _bboxHeight(font.glyphs[str(n)].layers[0]))
-                    for n in vVars
-                ]
-                if glyph.userData[EXTENDED_SHAPE_ID]:
-                    productionVVars = [productionMap[str(n)] for n in vVars]
-                    extended.update(productionVVars)
-            if hVars := varData.get(H_VARIANTS_ID):
-                hVars = [productionMap[str(n)] for n in hVars]
-                hVariants[name] = [
-                    (n, _bboxWidth(font.glyphs[n].layers[0])) for n in hVars
-                ]
-
-            layer = glyph.layers[master.id]
-            varData = layer.userData.get(VARIANTS_ID, {})
-            if vAssembly := varData.get(V_ASSEMBLY_ID):
-                vAssemblies[name] = [
-                    [
-                        (
-                            productionMap[str(part[0])],
-                            *part[1:],
-                            _bboxHeight(part[0].glyph.layers[0]),
-                        )
-                        for part in vAssembly
-                    ],
-                    italic.pop(str(vAssembly[-1][0]), 0),
-                ]
-            if hAssembly := varData.get(H_ASSEMBLY_ID):
-                hAssemblies[name] = [
-                    [
-                        (
-                            productionMap[str(part[0])],
-                            *part[1:],
-                            _bboxWidth(part[0].glyph.layers[0]),
-                        )
-                        for part in hAssembly
-                    ],
-                    italic.pop(str(hAssembly[-1][0]), 0),
-                ]
+        for glyphName, data in glyphData.items():
+            name = productionMap[glyphName]
+            if data.italic is not None:
+                italic[name] = data.italic
+            if data.accent is not None:
+                accent[name] = data.accent
+            if data.kerns:
+                kerning[name] = data.kerns
+            if data.extended:
+                extended.add(name)
+
+            if data.vVariants:
+                vVars = [metrics[n] for n in data.vVariants]
+                vVariants[name] = [(m.productionName, m.height) for m in vVars]
+                if data.extended:
+                    extended.update(m.productionName for m in vVars)
+            if data.hVariants:
+                hVars = [metrics[n] for n in data.hVariants]
+                hVariants[name] = [(m.productionName, m.width) for m in hVars]
+
+            if data.vAssembly:
+                vAssemblies[name] = data.vAssembly
+            if data.hAssembly:
+                hAssemblies[name] = data.hAssembly
+
+        # Resolve assemblies only after all italic corrections are collected,
+        # as the italic correction of the last part moves to the assembly.
+        for assemblies, size in ((vAssemblies, "height"), (hAssemblies, "width")):
+            for name, assembly in assemblies.items():
+                parts = []
+                for partName, *rest in assembly:
+                    m = metrics[partName]
+                    parts.append((m.productionName, *rest, getattr(m, size)))
+                assemblies[name] = [parts, italic.pop(assembly[-1][0], 0)]
 
         if not any(
             [
@@ -138,10 +257,7 @@ class MathTableBuilder:
         ):
             return
 
-        from fontTools.otlLib.builder import buildMathTable
-
-        buildMathTable(
-            ttFont,
+        return dict(
             constants=constants,
             italicsCorrections=italic,
             topAccentAttachments=accent,
@@ -153,3 +269,46 @@ class MathTableBuilder:
             vertGlyphAssembly=vAssemblies,
             horizGlyphAssembly=hAssemblies,
         )
+
+    @staticmethod
+    def buildMathTable(font, ttFont, cache=None, context=None):
+        if mathData := MathTableBuilder.collectMathData(font, cache, context):
+            from fontTools.otlLib.builder import buildMathTable
+
+            buildMathTable(ttFont, **mathData)
+
+    @staticmethod
+    def writeMathTable(mathData, path, cache=None):
+        """Build a MATH table from collected `mathData` into the font file at
+        `path`. This does not touch any Glyphs objects, so it can run off the
+        main thread. Returns whether a MATH table was written.
+
+        The compiled table is kept in `cache` and reused as long as neither
+        the `mathData` nor the glyph order of the font changes, so the other
+        formats exported from one instance reuse it."""
+        if not mathData:
+            return False
+
+        from fontTools.otlLib.builder import buildMathTable
+        from fontTools.ttLib import TTFont
+
+        if not canSpliceTable(path):
+            with TTFont(path) as ttFont:
+                buildMathTable(ttFont, **mathData)
+                ttFont.save(path)
+                return True
+
+        # Only compile the MATH table and splice it into the file, the rest of
+        # the font is copied over as is.
+        with TTFont(path, lazy=True) as ttFont:
+            # The compiled table refers to glyphs by their IDs.
+            key = (_mathDataDigest(mathData), tuple(ttFont.getGlyphOrder()))
+            if cache is not None and cache.compiled and cache.compiled[0] == key:
+                data = cache.compiled[1]
+            else:
+                buildMathTable(ttFont, **mathData)
+                data = ttFont["MATH"].compile(ttFont)
+                if cache is not None:
+                    cache.compiled = (key, data)
+        spliceTable(path, "MATH", data)
+        return True
@@ -0,0 +1,99 @@
+from collections import namedtuple
+
+try:
+    import AppKit
+except ImportError:
+    # Running outside of Glyphs, only the RecordingBackend can be used.
+    AppKit = None
+
+Style = namedtuple("Style", ["color", "width", "dashed"])
+Style.__doc__ = """How a line is stroked: an NSColor name (e.g. "green" for
+NSColor.greenColor()), the line width, and whether the line is dashed."""
+
+
+class AppKitBackend:
+    """Draws into the current NSGraphicsContext."""
+
+    def newPath(self):
+        return AppKit.NSBezierPath.bezierPath()
+
+    def moveTo(self, path, pt):
+        path.moveToPoint_(pt)
+
+    def lineTo(self, path, pt):
+        path.lineToPoint_(pt)
+
+    def save(self):
+        AppKit.NSGraphicsContext.saveGraphicsState()
+
+    def restore(self):
+        AppKit.NSGraphicsContext.restoreGraphicsState()
+
+    def stroke(self, path, style):
+        getattr(AppKit.NSColor, f"{style.color}Color")().set()
+        path.setLineWidth_(style.width)
+        if style.dashed:
+            path.setLineDash_count_phase_((style.width, style.width), 2, 0)
+        path.stroke()
+
+
+class RecordingBackend:
+    """Records the drawing commands instead of drawing them, so that the
+    paths and strokes of the overlays can be inspected without AppKit."""
+
+    def __init__(self):
+        self.paths = 0
+        self.strokes = []
+
+    def newPath(self):
+        self.paths += 1
+        return []
+
+    def moveTo(self, path, pt):
+        path.append(("moveTo", tuple(pt)))
+
+    def lineTo(self, path, pt):
+        path.append(("lineTo", tuple(pt)))
+
+    def save(self):
+        pass
+
+    def restore(self):
+        pass
+
+    def stroke(self, path, style):
+        self.strokes.append((style, list(path)))
+
+
+class Canvas:
+    """Collects lines by their Style, so that draw() strokes one path per
+    style however many lines there are."""
+
+    def __init__(self, backend=None):
+        self.backend = backend or AppKitBackend()
+        self.paths = {}
+
+    def path(self, style):
+        if (path := self.paths.get(style)) is None:
+            path = self.paths[style] = self.backend.newPath()
+        return path
+
+    def moveTo(self, style, pt):
+        self.backend.moveTo(self.path(style), pt)
+
+    def lineTo(self, style, pt):
+        self.backend.lineTo(self.path(style), pt)
+
+    def line(self, style, pt1, pt2):
+        path = self.path(style)
+        self.backend.moveTo(path, pt1)
+        self.backend.lineTo(path, pt2)
+
+    def draw(self):
+        if not self.paths:
+            return
+        self.backend.save()
+        for style, path in self.paths.items():
+            self.backend.stroke(path, style)
+        self.backend.restore()
+        self.paths = {}
@@ -5,7 +5,21 @@ NAME = "OpenType MATH Plug-in"
 PLUGIN_ID = "com.nagwa.MATHPlugin"
 CONSTANTS_ID = PLUGIN_ID + ".constants"
 SKIP_EXPORT_ID = PLUGIN_ID + ".skipExport"
+DEBUG_ID = PLUGIN_ID + ".debug"
 STATUS_ID = PLUGIN_ID + ".status"
+BUILD_CACHE_ID = PLUGIN_ID + ".buildCache"
+DRAWING_CACHE_ID = PLUGIN_ID + ".drawingCache"
+ACCENTS_CACHE_ID = PLUGIN_ID + ".accentsCache"
+SAMPLE_ACCENTS_ID = PLUGIN_ID + ".sampleAccents"
+PREVIEW_SIZE_ID = PLUGIN_ID + ".previewSize"
+
+# Size in font units the stretch preview stretches glyphs to by default.
+DEFAULT_PREVIEW_SIZE = 1500
+SCHEMA_VERSION_ID = PLUGIN_ID + ".schemaVersion"
+VARIANTS_INDEX_ID = PLUGIN_ID + ".variantsIndex"
+
+# Version of the MATH userData layout, bump when open_ needs to migrate it.
+SCHEMA_VERSION = 1
 
 EXTENDED_SHAPE_ID = PLUGIN_ID + ".extendedShape"
 
@@ -15,6 +29,7 @@ H_VARIANTS_ID = "hVariants"
 V_ASSEMBLY_ID = "vAssembly"
 H_ASSEMBLY_ID = "hAssembly"
 
+MATH_ANCHOR_PREFIX = "math."
 ITALIC_CORRECTION_ANCHOR = "math.ic"
 TOP_ACCENT_ANCHOR = "math.ta"
 
@@ -1,53 +1,332 @@
 import AppKit
+import Quartz
 
+from collections import OrderedDict
 from GlyphsApp import GSGlyphReference
 from GlyphsApp.drawingTools import restore, save, translate
+from OpenTypeMathPlugin.assembly import AssemblyEngine, assemblyParts
+from OpenTypeMathPlugin.canvas import Canvas, Style
 from OpenTypeMathPlugin.constants import (
+    ACCENTS_CACHE_ID,
     CONSTANTS_ID,
+    DRAWING_CACHE_ID,
     ITALIC_CORRECTION_ANCHOR,
     KERN_BOTTOM_LEFT_ANCHOR,
     KERN_BOTTOM_RIGHT_ANCHOR,
     KERN_TOP_LEFT_ANCHOR,
     KERN_TOP_RIGHT_ANCHOR,
+    SAMPLE_ACCENTS_ID,
     SAMPLE_MATH_ACCENTS,
-    TOP_ACCENT_ANCHOR,
 )
-from OpenTypeMathPlugin.helpers import _bboxHeight, _bboxWidth, _getMetrics
+from OpenTypeMathPlugin.helpers import (
+    KERN_CORNERS,
+    _bboxHeight,
+    _bboxWidth,
+    mathAnchors,
+)
+from OpenTypeMathPlugin.stretch import StretchyGlyph
+
+# Number of layers whose variants and assemblies are kept laid out.
+DRAWING_CACHE_SIZE = 256
+# Below this zoom, variants and assemblies are drawn as the boxes of their
+# glyphs.
+SIMPLIFIED_SCALE = 0.2
+# Distance of the stretch preview from the glyph.
+PREVIEW_GAP = 100
+
+
+KERN_COLORS = {
+    KERN_TOP_RIGHT_ANCHOR: "green",
+    KERN_TOP_LEFT_ANCHOR: "blue",
+    KERN_BOTTOM_RIGHT_ANCHOR: "cyan",
+    KERN_BOTTOM_LEFT_ANCHOR: "red",
+}
+
+
+def _glyph(font, obj):
+    if isinstance(obj, GSGlyphReference):
+        return obj.glyph
+    return font.glyphs[obj]
+
+
+def _glyphVersion(glyph):
+    if glyph is None:
+        return None
+    return glyph.name, glyph.lastChange
+
+
+def _clipBounds():
+    """The part of the current graphics context that drawing can change, in
+    the coordinates of the layer being drawn."""
+    context = AppKit.NSGraphicsContext.currentContext()
+    if context is None:
+        return None
+    rect = Quartz.CGContextGetClipBoundingBox(context.CGContext())
+    x, y = rect.origin.x, rect.origin.y
+    return x, y, x + rect.size.width, y + rect.size.height
+
+
+def _translation(x, y):
+    transform = AppKit.NSAffineTransform.transform()
+    transform.translateXBy_yBy_(x, y)
+    return transform
+
+
+def _intersects(bounds, clip, margin):
+    return (
+        bounds[0] - margin <= clip[2]
+        and bounds[2] + margin >= clip[0]
+        and bounds[1] - margin <= clip[3]
+        and bounds[3] + margin >= clip[1]
+    )
+
+
+class _MergedPath:
+    """Collects the outlines of several layers at different offsets into one
+    NSBezierPath, along with a path of their bounding boxes and their
+    overall bounds (xMin, yMin, xMax, yMax)."""
+
+    def __init__(self):
+        self.path = AppKit.NSBezierPath.bezierPath()
+        self.boxes = AppKit.NSBezierPath.bezierPath()
+        self.bounds = None
+
+    def add(self, layer, x, y):
+        path = layer.completeBezierPath
+        if path is None or path.isEmpty():
+            return
+        path.transformUsingAffineTransform_(_translation(x, y))
+        self.path.appendBezierPath_(path)
+
+        rect = path.bounds()
+        self.boxes.appendBezierPathWithRect_(rect)
+        box = (
+            rect.origin.x,
+            rect.origin.y,
+            rect.origin.x + rect.size.width,
+            rect.origin.y + rect.size.height,
+        )
+        if self.bounds is None:
+            self.bounds = box
+        else:
+            self.bounds = (
+                min(self.bounds[0], box[0]),
+                min(self.bounds[1], box[1]),
+                max(self.bounds[2], box[2]),
+                max(self.bounds[3], box[3]),
+            )
+
+    def translate(self, x, y):
+        transform = _translation(x, y)
+        self.path.transformUsingAffineTransform_(transform)
+        self.boxes.transformUsingAffineTransform_(transform)
+        if self.bounds is not None:
+            xMin, yMin, xMax, yMax = self.bounds
+            self.bounds = (xMin + x, yMin + y, xMax + x, yMax + y)
+
+
+def _layoutVariants(layer, variantLayers, parts, minOverlap, vertical):
+    """The variants of `layer` next to it, followed by its assembly of
+    `parts`, (layer, flags, start, end), at the maximum size (applying only
+    MinConnectorOverlap) and at the minimum size, as one _MergedPath each."""
+    x = layer.width
+    variantsPath = _MergedPath()
+    for variantLayer in variantLayers:
+        variantsPath.add(variantLayer, x, 0)
+        x += variantLayer.width
+
+    if not parts:
+        return [variantsPath]
+
+    measure = _bboxHeight if vertical else _bboxWidth
+    engine = AssemblyEngine(
+        assemblyParts(parts, [measure(p[0]) for p in parts]), minOverlap
+    )
+
+    paths = [variantsPath]
+    for overlap in (minOverlap, engine.maxOverlap(1)):
+        assemblyPath = _MergedPath()
+        assemblyLayout = engine.arrange(1, overlap)
+        y = 0
+        if vertical:
+            # Vertically center the assembly
+            d = layer.bounds.size.height - assemblyLayout.size
+            y = layer.bounds.origin.y + d / 2
+        for i, offset in assemblyLayout.positions:
+            if vertical:
+                assemblyPath.add(parts[i][0], x, y + offset)
+            else:
+                assemblyPath.add(parts[i][0], x + offset, y)
+        paths.append(assemblyPath)
+
+        if vertical:
+            x += parts[-1][0].width
+        else:
+            x += assemblyLayout.size
+
+    return paths
+
+
+def _layoutPreview(layer, variantLayers, parts, minOverlap, vertical, size):
+    """The construction of `layer` picked for `size`, left of it if it is
+    `vertical` and below it otherwise, as a list of one _MergedPath."""
+    measure = _bboxHeight if vertical else _bboxWidth
+    engine = None
+    if parts:
+        engine = AssemblyEngine(
+            assemblyParts(parts, [measure(p[0]) for p in parts]), minOverlap
+        )
+    stretchy = StretchyGlyph(variantLayers, [measure(v) for v in variantLayers], engine)
+    if (construction := stretchy.select(size)) is None:
+        return []
+
+    preview = _MergedPath()
+    if construction.layout is None:
+        preview.add(construction.variant, 0, 0)
+    else:
+        for i, offset in construction.layout.positions:
+            if vertical:
+                preview.add(parts[i][0], 0, offset)
+            else:
+                preview.add(parts[i][0], offset, 0)
+    if preview.bounds is None:
+        return []
+
+    xMin, yMin, xMax, yMax = preview.bounds
+    bounds = layer.bounds
+    if vertical:
+        center = bounds.origin.y + bounds.size.height / 2
+        preview.translate(-PREVIEW_GAP - xMax, center - (yMin + yMax) / 2)
+    else:
+        center = bounds.origin.x + bounds.size.width / 2
+        preview.translate(
+            center - (xMin + xMax) / 2, bounds.origin.y - PREVIEW_GAP - yMax
+        )
+    return [preview]
+
+
+def accentCloud(font, master):
+    """The outlines of the sample accents of `font` in `master` as one path,
+    each moved so that its top accent position is at x = 0.
+
+    The path is kept per master and built again only when the sample
+    accents, or any of their glyphs, change. The sample accents are the
+    glyph names in font.userData[SAMPLE_ACCENTS_ID], or SAMPLE_MATH_ACCENTS."""
+    accents = []
+    for name in font.userData[SAMPLE_ACCENTS_ID] or SAMPLE_MATH_ACCENTS:
+        if glyph := font.glyphs[name]:
+            layer = glyph.layers[master.id]
+            if layer is not None and (x := mathAnchors(layer).accent) is not None:
+                accents.append((glyph, layer, x))
+    version = tuple((g.name, g.lastChange, x) for g, _, x in accents)
+
+    cache = font.tempData[ACCENTS_CACHE_ID]
+    if cache is None:
+        cache = font.tempData[ACCENTS_CACHE_ID] = {}
+    entry = cache.get(master.id)
+    if entry is None or entry[0] != version:
+        cloud = _MergedPath()
+        for _, layer, x in accents:
+            cloud.add(layer, -x, 0)
+        entry = cache[master.id] = (version, cloud.path)
+    return entry[1]
+
+
+class VariantsDrawingCache:
+    """The laid out variants and assemblies of the most recently drawn layers
+    of a font, so that redrawing a layer only strokes ready-made paths, and
+    only those that are visible.
+
+    An entry is rebuilt when the glyph of the layer, any glyph it references
+    or the MinConnectorOverlap of its master changed since it was built."""
+
+    @staticmethod
+    def forFont(font):
+        cache = font.tempData[DRAWING_CACHE_ID]
+        if cache is None:
+            cache = font.tempData[DRAWING_CACHE_ID] = VariantsDrawingCache()
+        return cache
+
+    def __init__(self, size=DRAWING_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def paths(self, variants, assembly, layer, vertical, previewSize=None):
+        """The _MergedPaths of the variants and assemblies of `layer`, or of
+        the construction picked for `previewSize`, if given."""
+        glyph = layer.parent
+        font = glyph.parent
+        layerId = layer.layerId
+        minOverlap = layer.master.userData.get(CONSTANTS_ID, {}).get(
+            "MinConnectorOverlap", 0
+        )
 
+        variantGlyphs = [_glyph(font, v) for v in variants]
+        partGlyphs = [_glyph(font, a[0]) for a in assembly]
+        version = (
+            _glyphVersion(glyph),
+            minOverlap,
+            tuple(_glyphVersion(g) for g in variantGlyphs),
+            tuple((_glyphVersion(g), *a[1:]) for g, a in zip(partGlyphs, assembly)),
+        )
+
+        key = (glyph.name, layerId, vertical, previewSize)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(key)
+            return entry[1]
+
+        variantLayers = [g.layers[layerId] for g in variantGlyphs if g is not None]
+        parts = []
+        for partGlyph, (_, flags, start, end) in zip(partGlyphs, assembly):
+            if partGlyph is not None:
+                parts.append((partGlyph.layers[layerId], flags, start, end))
+        variantLayers = [v for v in variantLayers if v is not None]
+        parts = [p for p in parts if p[0] is not None]
+        if previewSize is None:
+            paths = _layoutVariants(layer, variantLayers, parts, minOverlap, vertical)
+        else:
+            paths = _layoutPreview(
+                layer, variantLayers, parts, minOverlap, vertical, previewSize
+            )
 
-def dashedLine(pt1, pt2, width):
-    path = AppKit.NSBezierPath.bezierPath()
-    path.setLineWidth_(width)
-    path.setLineDash_count_phase_((width * 2, width * 2), 2, 0)
-    path.moveToPoint_(pt1)
-    path.lineToPoint_(pt2)
-    path.stroke()
+        self.entries[key] = (version, paths)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+        return paths
 
 
 class MathDrawing:
+    """Draws the MATH overlays of a layer. The lines are collected in
+    `canvas` and only stroked by canvas.draw(), if a canvas is given, so
+    that the lines of all overlays of a layer are stroked once per style."""
+
     @staticmethod
-    def drawAnchors(layer, name, width):
-        save()
+    def drawAnchors(layer, name, width, canvas=None):
+        anchors = mathAnchors(layer)
+        x = anchors.italic if name == ITALIC_CORRECTION_ANCHOR else anchors.accent
+        if x is None:
+            return
+
+        target = canvas or Canvas()
         master = layer.master
-        if anchor := layer.anchors[name]:
-            line = AppKit.NSBezierPath.bezierPath()
-            line.moveToPoint_((anchor.position.x, master.descender))
-            line.lineToPoint_((anchor.position.x, master.ascender))
-            line.setLineWidth_(width)
-            if anchor.name == ITALIC_CORRECTION_ANCHOR:
-                AppKit.NSColor.blueColor().set()
-            elif anchor.name == TOP_ACCENT_ANCHOR:
-                AppKit.NSColor.magentaColor().set()
-                if anchor.selected:
-                    MathDrawing.drawAccent(layer, anchor)
-            line.stroke()
-        restore()
+        if name == ITALIC_CORRECTION_ANCHOR:
+            style = Style("blue", width, False)
+        else:
+            style = Style("magenta", width, False)
+            if layer.anchors[name].selected:
+                MathDrawing.drawAccent(layer, x)
+        target.line(style, (x, master.descender), (x, master.ascender))
+        if canvas is None:
+            target.draw()
 
     @staticmethod
-    def drawAccent(layer, anchor):
-        save()
+    def drawAccent(layer, x):
         master = layer.master
-        font = master.font
+        path = accentCloud(master.font, master)
+        if path.isEmpty():
+            return
 
         constants = master.userData.get(CONSTANTS_ID, {})
         accentBase = constants.get("AccentBaseHeight", master.xHeight)
@@ -55,170 +334,86 @@ class MathDrawing:
         height = layer.bounds.origin.y + layer.bounds.size.height
         dy = height - min(height, accentBase)
 
+        save()
         AppKit.NSColor.colorWithDeviceWhite_alpha_(0, 0.2).set()
-        for name in SAMPLE_MATH_ACCENTS:
-            if glyph := font.glyphs[name]:
-                aLayer = glyph.layers[master.id]
-                aAnchor = aLayer.anchors[anchor.name]
-                if aAnchor is None:
-                    continue
-
-                dx = anchor.position.x - aAnchor.position.x
-                Transform = AppKit.NSAffineTransform.alloc().init()
-                Transform.translateXBy_yBy_(dx, dy)
-
-                path = aLayer.completeBezierPath
-                path.transformUsingAffineTransform_(Transform)
-                path.fill()
+        translate(x, dy)
+        path.fill()
         restore()
 
     @staticmethod
-    def drawMathKern(layer, width):
-        save()
+    def drawMathKern(layer, width, canvas=None):
+        kerns = mathAnchors(layer).kerns
+        if not kerns:
+            return
+
+        target = canvas or Canvas()
         bounds = layer.bounds
         master = layer.master
-        for name in (
-            KERN_TOP_RIGHT_ANCHOR,
-            KERN_TOP_LEFT_ANCHOR,
-            KERN_BOTTOM_RIGHT_ANCHOR,
-            KERN_BOTTOM_LEFT_ANCHOR,
-        ):
-            points = []
-            for anchor in layer.anchors:
-                if anchor.name == name or anchor.name.startswith(name + "."):
-                    points.append(anchor.position)
-            points = sorted(points, key=lambda pt: pt.y)
-
-            line = AppKit.NSBezierPath.bezierPath()
-            line.setLineWidth_(width * 2)
-            if name == KERN_TOP_RIGHT_ANCHOR:
-                AppKit.NSColor.greenColor().set()
-            elif name == KERN_TOP_LEFT_ANCHOR:
-                AppKit.NSColor.blueColor().set()
-            elif name == KERN_BOTTOM_RIGHT_ANCHOR:
-                AppKit.NSColor.cyanColor().set()
-            elif name == KERN_BOTTOM_LEFT_ANCHOR:
-                AppKit.NSColor.redColor().set()
-            for i, pt in enumerate(points):
+        bottom = min(bounds.origin.y, master.descender)
+        top = max(bounds.origin.y + bounds.size.height, master.ascender)
+        for name in KERN_CORNERS:
+            if not (points := kerns.get(name)):
+                continue
+
+            line = Style(KERN_COLORS[name], width * 2, False)
+            dashed = Style(KERN_COLORS[name], width * 2, True)
+            for i, (x, y) in enumerate(points):
                 if i == 0:
-                    y = min(bounds.origin.y, master.descender)
-                    dashedLine((pt.x, y), pt, width * 2)
-                    line.moveToPoint_(pt)
+                    target.line(dashed, (x, bottom), (x, y))
+                    target.moveTo(line, (x, y))
                 if i < len(points) - 1:
-                    line.lineToPoint_(pt)
-                    line.lineToPoint_((points[i + 1].x, pt.y))
+                    target.lineTo(line, (x, y))
+                    target.lineTo(line, (points[i + 1][0], y))
                 else:
-                    y = max(bounds.origin.y + bounds.size.height, master.ascender)
-                    dashedLine((pt.x, points[i - 1].y), (pt.x, y), width * 2)
-            line.stroke()
-        restore()
+                    target.line(dashed, (x, points[i - 1][1]), (x, top))
+        if canvas is None:
+            target.draw()
 
     @staticmethod
     def drawVariants(variants, assembly, layer, width, vertical):
-        save()
-        font = layer.parent.parent
+        cache = VariantsDrawingCache.forFont(layer.parent.parent)
+        paths = cache.paths(variants, assembly, layer, vertical)
+        MathDrawing.strokePaths(paths, "green" if vertical else "blue", width)
 
-        def gl(obj):
-            if isinstance(obj, GSGlyphReference):
-                return obj.glyph
-            return font.glyphs[obj]
+    @staticmethod
+    def drawStretchPreview(
+        variants, assembly, layer, width, vertical, size, canvas=None
+    ):
+        """Draw the construction a renderer picks for stretching `layer` to
+        `size`, next to a dashed line of that size."""
+        cache = VariantsDrawingCache.forFont(layer.parent.parent)
+        paths = cache.paths(variants, assembly, layer, vertical, size)
+        MathDrawing.strokePaths(paths, "orange", width)
 
+        target = canvas or Canvas()
+        style = Style("orange", width, True)
+        bounds = layer.bounds
         if vertical:
-            AppKit.NSColor.greenColor().set()
+            x = -PREVIEW_GAP / 2
+            y = bounds.origin.y + bounds.size.height / 2 - size / 2
+            target.line(style, (x, y), (x, y + size))
         else:
-            AppKit.NSColor.blueColor().set()
-
-        x = layer.width
-        y = 0
-        for variant in variants:
-            save()
-            translate(x, y)
-            variantLayer = gl(variant).layers[layer.layerId]
-            if variantLayer is None:
-                continue
-
-            path = variantLayer.completeBezierPath
-            path.setLineWidth_(width)
-            path.stroke()
-            x += variantLayer.width
-            restore()
-
-        if not assembly:
-            restore()
-            return
+            x = bounds.origin.x + bounds.size.width / 2 - size / 2
+            y = bounds.origin.y - PREVIEW_GAP / 2
+            target.line(style, (x, y), (x + size, y))
+        if canvas is None:
+            target.draw()
 
-        minOverlap = layer.master.userData.get(CONSTANTS_ID, {}).get(
-            "MinConnectorOverlap", 0
-        )
-
-        # Draw assembly.
-
-        # First at the maximum size (applying only MinConnectorOverlap)
-        if vertical:
-            # Vertically center the assembly
-            h = sum(gl(a[0]).layers[layer.layerId].bounds.size.height for a in assembly)
-            h -= (len(assembly) - 1) * minOverlap
-            d = layer.bounds.size.height - h
-            y = layer.bounds.origin.y + d / 2
+    @staticmethod
+    def strokePaths(paths, color, width):
+        """Stroke the visible ones of the _MergedPaths `paths`, as boxes when
+        zoomed out."""
+        clip = _clipBounds()
+        simplified = 1 / width < SIMPLIFIED_SCALE
 
-        for gRef, _, _, _ in assembly:
-            save()
-            translate(x, y)
-            partLayer = gl(gRef).layers[layer.layerId]
-            if partLayer is None:
+        save()
+        getattr(AppKit.NSColor, f"{color}Color")().set()
+        for merged in paths:
+            if merged.bounds is None:
                 continue
-            path = partLayer.completeBezierPath
-            path.setLineWidth_(width)
-            path.stroke()
-
-            w, h = _getMetrics(partLayer)
-            if vertical:
-                y += _bboxHeight(partLayer) - minOverlap
-            else:
-                x += _bboxWidth(partLayer) - minOverlap
-            restore()
-
-        # Then at the minimum size
-        if vertical:
-            # Vertically center the assembly
-            x += partLayer.width
-            h = 0
-            prev = 0
-            for gRef, _, start, end in assembly:
-                overlap = max(min(start, prev), minOverlap)
-                prev = end
-                partLayer = gl(gRef).layers[layer.layerId]
-                h += _bboxHeight(partLayer) - overlap
-            d = layer.bounds.size.height - h
-            y = layer.bounds.origin.y + d / 2
-        else:
-            x += minOverlap * 2
-
-        prev = 0
-        for gRef, _, start, end in assembly:
-            save()
-            overlap = max(min(start, prev), minOverlap)
-            prev = end
-
-            partLayer = gl(gRef).layers[layer.layerId]
-            if partLayer is None:
+            if clip is not None and not _intersects(merged.bounds, clip, width):
                 continue
-
-            w, h = _getMetrics(partLayer)
-            if vertical:
-                y -= overlap
-            else:
-                x -= overlap
-
-            translate(x, y)
-            if vertical:
-                y += h
-            else:
-                x += w
-
-            path = partLayer.completeBezierPath
+            path = merged.boxes if simplified else merged.path
             path.setLineWidth_(width)
             path.stroke()
-            restore()
-
         restore()
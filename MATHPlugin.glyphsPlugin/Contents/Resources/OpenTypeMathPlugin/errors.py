@@ -0,0 +1,96 @@
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque, namedtuple
+
+# Number of errors kept for reading from the Macro panel.
+ERROR_LOG_SIZE = 100
+# Seconds before the same problem is logged again.
+ERROR_LOG_INTERVAL = 60
+
+ErrorRecord = namedtuple(
+    "ErrorRecord", ["time", "context", "glyph", "suppressed", "traceback"]
+)
+ErrorRecord.__doc__ = """One logged error: when and where it happened, the
+name of the glyph it happened for, if any, how many repetitions of it were
+not logged since it was last logged, and its formatted traceback."""
+
+
+class ErrorReporter:
+    """Reports errors from callbacks that run over and over, like drawing and
+    interpolation, without an alert for each of them.
+
+    A problem is identified by what was being done, the place the exception
+    was raised and the glyph. It is printed and logged at most once every
+    ERROR_LOG_INTERVAL seconds, only the first time gets a notification,
+    and the log keeps the last ERROR_LOG_SIZE records. As many problems are
+    remembered, the ones reported least recently are forgotten first.
+
+    From the Macro panel:
+
+        from OpenTypeMathPlugin.errors import reporter
+        print(reporter.format())
+    """
+
+    def __init__(self, size=ERROR_LOG_SIZE, interval=ERROR_LOG_INTERVAL):
+        self.log = deque(maxlen=size)
+        self.size = size
+        self.interval = interval
+        self.problems = OrderedDict()
+        self.lock = threading.Lock()
+        # Called with the message of every new problem.
+        self.notify = None
+
+    def report(self, context, glyph=None):
+        """Report the exception being handled, raised while doing `context`
+        (e.g. "Drawing") for the glyph named `glyph`."""
+        excType, exc, tb = sys.exc_info()
+        frames = traceback.extract_tb(tb)
+        site = (frames[-1].filename, frames[-1].lineno) if frames else None
+        key = (context, excType, site, glyph)
+        now = time.monotonic()
+
+        with self.lock:
+            problem = self.problems.get(key)
+            if problem is not None:
+                self.problems.move_to_end(key)
+                if now - problem[0] < self.interval:
+                    problem[1] += 1
+                    return
+            suppressed = problem[1] if problem is not None else 0
+            self.problems[key] = [now, 0]
+            while len(self.problems) > self.size:
+                self.problems.popitem(last=False)
+            record = ErrorRecord(
+                time.time(), context, glyph, suppressed, traceback.format_exc()
+            )
+            self.log.append(record)
+
+        print(self.formatRecord(record))
+        if problem is None and self.notify is not None:
+            where = f" for {glyph}" if glyph else ""
+            self.notify(
+                f"{context} failed{where}: {exc}\nSee the Macro panel for details."
+            )
+
+    @staticmethod
+    def formatRecord(record):
+        stamp = time.strftime("%H:%M:%S", time.localtime(record.time))
+        where = f" for {record.glyph}" if record.glyph else ""
+        repeated = ""
+        if record.suppressed:
+            repeated = f" (and {record.suppressed} times since it was last logged)"
+        heading = f"[{stamp}] {record.context} failed{where}{repeated}"
+        return f"{heading}:\n{record.traceback}"
+
+    def format(self):
+        return "\n".join(self.formatRecord(r) for r in self.log)
+
+    def clear(self):
+        with self.lock:
+            self.log.clear()
+            self.problems.clear()
+
+
+reporter = ErrorReporter()
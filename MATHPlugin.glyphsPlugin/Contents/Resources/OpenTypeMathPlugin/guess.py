@@ -0,0 +1,352 @@
+"""Guessing the MATH variants and assemblies of glyphs from the names of
+their alternates, for one glyph from the variants window or for a whole font
+at once."""
+
+from bisect import bisect_left
+
+from GlyphsApp import GSGlyphReference
+from OpenTypeMathPlugin.assembly import EXTENDER_FLAG
+from OpenTypeMathPlugin.constants import (
+    H_ASSEMBLY_ID,
+    H_VARIANTS_ID,
+    VARIANTS_ID,
+    V_ASSEMBLY_ID,
+    V_VARIANTS_ID,
+)
+from OpenTypeMathPlugin.helpers import indexGlyphs
+
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional, connectors are then found in plain Python.
+    numpy = None
+
+# Suffixes of size variants, e.g. parenleft.size1 or parenleft.s1, tried in
+# order.
+VARIANT_SUFFIXES = ("size", "s")
+# Suffixes of vertical display variants, e.g. integral.disp.
+DISPLAY_SUFFIXES = ("disp", "display")
+
+# Suffixes of assembly parts, e.g. braceleft.top, tried in order: left,
+# right, top, bottom, middle and extender.
+ASSEMBLY_SUFFIXES = (
+    ("lft", "rgt", "top", "bot", "mid", "ext"),
+    ("left", "right", "top", "bottom", "middle", "extension"),
+    ("lt", "rt", "tp", "bt", "md", "ex"),
+    ("l", "r", "t", "b", "m", "x"),
+)
+
+# Assemblies of the legacy encoded parts, for glyphs without named parts:
+# the glyph name, the Unicode, whether it is vertical, and the Unicodes of
+# the parts. An empty list of parts repeats the glyph itself.
+LEGACY_ASSEMBLIES = (
+    ("parenleft", "0028", True, ("239D", "239C", "239B")),
+    ("parenright", "0029", True, ("23A0", "239F", "239E")),
+    ("bracketleft", "005B", True, ("23A3", "23A2", "23A1")),
+    ("bracketright", "005D", True, ("23A6", "23A5", "23A4")),
+    ("braceleft", "007B", True, ("23A9", "23AA", "23A8", "23AA", "23A7")),
+    ("braceright", "007D", True, ("23AD", "23AA", "23AC", "23AA", "23AB")),
+    ("integral", "222B", True, ("2321", "23AE", "2320")),
+    ("radical", "221A", True, ("23B7", "2502", "250C")),
+    (None, "23B0", True, ("23AD", "23AA", "23A7")),
+    (None, "23B1", True, ("23A9", "23AA", "23AB")),
+    (None, "007C", True, ()),
+    (None, "2016", True, ()),
+    (None, "2223", True, ()),
+    (None, "2225", True, ()),
+    (None, "2980", True, ()),
+    (None, "0305", False, ()),
+    (None, "0332", False, ()),
+)
+
+
+class NameIndex:
+    """The glyph names of a font, sorted, so that the names starting with
+    some prefix are found by bisection instead of by scanning the font."""
+
+    def __init__(self, font):
+        self.names = sorted(g.name for g in font.glyphs)
+
+    def __contains__(self, name):
+        names = self.names
+        i = bisect_left(names, name)
+        return i < len(names) and names[i] == name
+
+    def startingWith(self, prefix):
+        names = self.names
+        i = bisect_left(names, prefix)
+        while i < len(names) and names[i].startswith(prefix):
+            yield names[i]
+            i += 1
+
+    def numbered(self, prefix):
+        """The names that are `prefix` or `prefix` followed by a number, in
+        the order of their numbers."""
+        variants = []
+        n = len(prefix)
+        for name in self.startingWith(prefix):
+            number = name[n:]
+            if not number:
+                variants.append((-1, name))
+            elif number.isdigit():
+                variants.append((int(number), name))
+        return [name for _, name in sorted(variants)]
+
+
+def guessVariants(index, name, vertical):
+    """The names of the variants of the glyph `name`, starting with itself,
+    from the names in `index`, or None if it has no alternates with a known
+    suffix."""
+    suffixes = VARIANT_SUFFIXES + (DISPLAY_SUFFIXES if vertical else ())
+    for suffix in suffixes:
+        if variants := index.numbered(f"{name}.{suffix}"):
+            return [name] + variants
+    return None
+
+
+def _growsVertically(font, names, masterId):
+    layers = [font.glyphs[n].layers[masterId] for n in (names[0], names[-1])]
+    first, last = (layer.bounds.size for layer in layers)
+    return last.height - first.height >= last.width - first.width
+
+
+def guessFontVariants(font, masterId=None):
+    """Guess the variants of every glyph of `font` that has none yet, in
+    either direction, and save them.
+
+    Size variants are named the same in both directions, so glyphs with
+    them only get the direction their largest variant grows in, measured in
+    the master with `masterId` (the first one by default). Returns the name
+    of every changed glyph with its new variants as {variantsId: names}."""
+    masterId = masterId or font.masters[0].id
+    index = NameIndex(font)
+    changes = []
+    changed = []
+    for glyph in font.glyphs:
+        name = glyph.name
+        guesses = {
+            V_VARIANTS_ID: guessVariants(index, name, True),
+            H_VARIANTS_ID: guessVariants(index, name, False),
+        }
+        names = guesses[V_VARIANTS_ID]
+        if names is not None and names == guesses[H_VARIANTS_ID]:
+            if _growsVertically(font, names, masterId):
+                guesses[H_VARIANTS_ID] = None
+            else:
+                guesses[V_VARIANTS_ID] = None
+
+        varData = glyph.userData.get(VARIANTS_ID) or {}
+        guesses = {
+            k: v for k, v in guesses.items() if v is not None and not varData.get(k)
+        }
+        if not guesses:
+            continue
+
+        varData = {k: list(v) for k, v in varData.items()}
+        for variantsId, names in guesses.items():
+            varData[variantsId] = [GSGlyphReference(font.glyphs[n]) for n in names]
+        glyph.userData[VARIANTS_ID] = varData
+        changes.append((name, guesses))
+        changed.append(glyph)
+
+    indexGlyphs(font, changed)
+    return changes
+
+
+def guessAssemblyNames(font, index, glyph, vertical):
+    """The names of the parts of the assembly of `glyph`, bottom to top or
+    left to right, from the names in `index`, or from the legacy encoded
+    parts, or None if there is no assembly to guess."""
+    name = glyph.name
+    for lft, rgt, top, bot, mid, ext in ASSEMBLY_SUFFIXES:
+        if f"{name}.{ext}" not in index:
+            continue
+        start, end = (bot, top) if vertical else (lft, rgt)
+        start, mid, end = (f"{name}.{n}" for n in (start, mid, end))
+        ext = f"{name}.{ext}"
+        start, mid, end = (n if n in index else None for n in (start, mid, end))
+        if not start and not end:
+            continue
+        if start and not end:
+            return [start, ext]
+        if end and not start:
+            return [ext, end]
+        if mid:
+            return [start, ext, mid, ext, end]
+        return [start, ext, end]
+
+    for legacyName, unicode, legacyVertical, unicodes in LEGACY_ASSEMBLIES:
+        if legacyVertical != vertical:
+            continue
+        if name != legacyName and glyph.unicode != unicode:
+            continue
+        if not unicodes:
+            return [name, name]
+        parts = [font.glyphs[u] for u in unicodes]
+        if all(parts):
+            return [p.name for p in parts]
+        return None
+    return None
+
+
+def _lineRecords(layers):
+    """(layer index, shape index, x, y, width, height) of the bounds of every
+    segment of `layers`."""
+    records = []
+    for i, layer in enumerate(layers):
+        for j, shape in enumerate(layer.shapes):
+            if (path := shape.bezierPath) is None:
+                continue
+            for segment in path.segments():
+                bounds = segment.bounds
+                origin, size = bounds.origin, bounds.size
+                records.append((i, j, origin.x, origin.y, size.width, size.height))
+    return records
+
+
+def _edgeLinesPython(records, edges, vertical):
+    """For each layer, the shortest line at its start and at its end edge,
+    of the last shape with such lines in pairs, or 0."""
+    shapes = {}
+    for i, j, x, y, width, height in records:
+        position, length, across = (
+            (y, height, width) if vertical else (x, width, height)
+        )
+        if not int(length) or int(across):
+            continue
+        lines = shapes.setdefault((i, j), ([], []))
+        lo, hi = edges[i]
+        if position == lo:
+            lines[0].append(length)
+        if position + length == hi:
+            lines[1].append(length)
+
+    starts = [0] * len(edges)
+    ends = [0] * len(edges)
+    for (i, _), (startLines, endLines) in sorted(shapes.items()):
+        if startLines and len(startLines) % 2 == 0:
+            starts[i] = min(startLines)
+        if endLines and len(endLines) % 2 == 0:
+            ends[i] = min(endLines)
+    return starts, ends
+
+
+def _edgeLinesNumpy(records, edges, vertical):
+    """_edgeLinesPython() over arrays of all segments of all layers at
+    once."""
+    count = len(edges)
+    if not records:
+        return [0] * count, [0] * count
+    table = numpy.array(records, dtype=float)
+    layer = table[:, 0].astype(int)
+    if vertical:
+        position, length, across = table[:, 3], table[:, 5], table[:, 4]
+    else:
+        position, length, across = table[:, 2], table[:, 4], table[:, 5]
+    lines = (numpy.trunc(length) != 0) & (numpy.trunc(across) == 0)
+    lo, hi = numpy.array(edges, dtype=float).reshape(-1, 2).T
+
+    # Records are in layer then shape order, so are the groups.
+    shapes, group = numpy.unique(table[:, :2], axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    shapeLayer = shapes[:, 0].astype(int)
+
+    results = []
+    for edge in (position == lo[layer], position + length == hi[layer]):
+        found = lines & edge
+        counts = numpy.bincount(group[found], minlength=len(shapes))
+        shortest = numpy.full(len(shapes), numpy.inf)
+        numpy.minimum.at(shortest, group[found], length[found])
+        paired = numpy.flatnonzero((counts > 0) & (counts % 2 == 0))
+        last = numpy.full(count, -1)
+        numpy.maximum.at(last, shapeLayer[paired], paired)
+        values = numpy.where(last >= 0, shortest[numpy.maximum(last, 0)], 0)
+        results.append(values.tolist())
+    return results[0], results[1]
+
+
+def connectorLengths(layers, vertical):
+    """The guessed start and end connector lengths of each of `layers`.
+
+    The connectors are taken to be the straight stems at the edges of the
+    glyph in the direction of the assembly: lines in that direction that
+    touch the edge, coming in pairs, the shortest of which is the connector
+    length. The segments of all layers are collected once, and filtered
+    with NumPy if it is available."""
+    records = _lineRecords(layers)
+    edges = []
+    for layer in layers:
+        bounds = layer.bounds
+        if vertical:
+            lo, size = bounds.origin.y, bounds.size.height
+        else:
+            lo, size = bounds.origin.x, bounds.size.width
+        edges.append((lo, lo + size))
+    edgeLines = _edgeLinesNumpy if numpy is not None else _edgeLinesPython
+    return list(zip(*edgeLines(records, edges, vertical)))
+
+
+def guessAssembly(names, lengths):
+    """Assembly records (name, flags, start, end) of the parts `names` with
+    the connector `lengths` of each part. Every other part is an extender,
+    the first part has no start connector and the last none at the end."""
+    assembly = []
+    last = len(names) - 1
+    for i, (name, (start, end)) in enumerate(zip(names, lengths)):
+        flags = EXTENDER_FLAG if i % 2 else 0
+        assembly.append((name, flags, start if i else 0, end if i < last else 0))
+    return assembly
+
+
+def guessFontAssemblies(font, masterIds=None):
+    """Guess the assembly of every glyph of `font` that has none yet, in
+    either direction, in each master with `masterIds` (all by default), and
+    save them.
+
+    The connectors of all parts of all assemblies in a master and direction
+    are found together, and each part glyph is measured once. Returns the
+    name of every changed glyph with the master IDs and assembly IDs of its
+    new assemblies."""
+    if masterIds is None:
+        masterIds = [m.id for m in font.masters]
+    index = NameIndex(font)
+
+    guesses = []
+    for glyph in font.glyphs:
+        for assemblyId, vertical in ((V_ASSEMBLY_ID, True), (H_ASSEMBLY_ID, False)):
+            if names := guessAssemblyNames(font, index, glyph, vertical):
+                guesses.append((glyph, assemblyId, vertical, names))
+
+    changes = {}
+    for masterId in masterIds:
+        for direction in (True, False):
+            todo = []
+            for glyph, assemblyId, vertical, names in guesses:
+                if vertical != direction:
+                    continue
+                layer = glyph.layers[masterId]
+                if (layer.userData.get(VARIANTS_ID) or {}).get(assemblyId):
+                    continue
+                todo.append((glyph, layer, assemblyId, names))
+            if not todo:
+                continue
+
+            parts = sorted({n for *_, names in todo for n in names})
+            lengths = connectorLengths(
+                [font.glyphs[n].layers[masterId] for n in parts], direction
+            )
+            lengths = dict(zip(parts, lengths))
+
+            for glyph, layer, assemblyId, names in todo:
+                assembly = guessAssembly(names, [lengths[n] for n in names])
+                varData = layer.userData.get(VARIANTS_ID) or {}
+                varData = {k: list(v) for k, v in varData.items()}
+                varData[assemblyId] = [
+                    (GSGlyphReference(font.glyphs[n]), flags, int(start), int(end))
+                    for n, flags, start, end in assembly
+                ]
+                layer.userData[VARIANTS_ID] = varData
+                changes.setdefault(glyph.name, []).append((masterId, assemblyId))
+
+    indexGlyphs(font, [font.glyphs[n] for n in changes])
+    return list(changes.items())
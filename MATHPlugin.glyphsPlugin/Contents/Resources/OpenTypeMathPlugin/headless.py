@@ -0,0 +1,270 @@
+"""Build MATH tables into already exported fonts from their .glyphs or
+.glyphspackage sources, without Glyphs. Run from the plug-in Resources folder:
+
+    python -m OpenTypeMathPlugin.headless Font.glyphs --fonts build/*.otf
+
+Each font is matched to a source instance by its PostScript name. Requires
+glyphsLib and fontTools."""
+
+import argparse
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from OpenTypeMathPlugin.build import MathGlyphCache, MathTableBuilder
+from OpenTypeMathPlugin.constants import (
+    CONSTANTS_ID,
+    H_ASSEMBLY_ID,
+    MATH_CONSTANTS,
+    VARIANTS_ID,
+    V_ASSEMBLY_ID,
+)
+from OpenTypeMathPlugin.variable import axisTriples, normalizeLocation, orderedMasters
+
+Point = namedtuple("Point", ["x", "y"])
+Size = namedtuple("Size", ["width", "height"])
+Rect = namedtuple("Rect", ["origin", "size"])
+Anchor = namedtuple("Anchor", ["name", "position"])
+
+MASTER_ID = "m01"
+
+
+class UserData(dict):
+    def __getitem__(self, key):
+        return self.get(key)
+
+
+class GlyphList(list):
+    def __init__(self, glyphs):
+        super().__init__(glyphs)
+        self.byName = {g.name: g for g in glyphs}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.byName.get(key)
+        return super().__getitem__(key)
+
+
+class LayerList(list):
+    def __getitem__(self, key):
+        if key == MASTER_ID:
+            key = 0
+        return super().__getitem__(key)
+
+
+class InterpolatedLayer:
+    """A glyph layer interpolated from the master layers with the given
+    scalars, exposing the subset of GSLayer that MathTableBuilder uses."""
+
+    def __init__(self, layers, scalars):
+        self.layers = layers
+        self.scalars = scalars
+        self.width = self.interpolate(layer.width for layer in layers)
+
+        origin = layers[0]
+        self.anchors = []
+        for anchor in origin.anchors:
+            positions = []
+            for layer in layers:
+                position = anchor.position
+                for other in layer.anchors:
+                    if other.name == anchor.name:
+                        position = other.position
+                        break
+                positions.append(position)
+            x = self.interpolate(p.x for p in positions)
+            y = self.interpolate(p.y for p in positions)
+            self.anchors.append(Anchor(anchor.name, Point(x, y)))
+
+        self.userData = UserData()
+        if varData := origin.userData[VARIANTS_ID]:
+            varData = dict(varData)
+            for assemblyId in (V_ASSEMBLY_ID, H_ASSEMBLY_ID):
+                if assembly := varData.get(assemblyId):
+                    varData[assemblyId] = self.interpolateAssembly(assemblyId, assembly)
+            self.userData[VARIANTS_ID] = varData
+
+    def interpolate(self, values):
+        return sum(v * s for v, s in zip(values, self.scalars))
+
+    def interpolateAssembly(self, assemblyId, assembly):
+        masterAssemblies = [
+            (layer.userData[VARIANTS_ID] or {}).get(assemblyId) or []
+            for layer in self.layers
+        ]
+        parts = []
+        for i, (name, flags, *_) in enumerate(assembly):
+            connectors = [a[i][2:4] if i < len(a) else (0, 0) for a in masterAssemblies]
+            start = self.interpolate(c[0] for c in connectors)
+            end = self.interpolate(c[1] for c in connectors)
+            parts.append((str(name), flags, start, end))
+        return parts
+
+    @property
+    def bounds(self):
+        boxes = []
+        for layer in self.layers:
+            if (bounds := layer.bounds) is None:
+                boxes.append((0, 0, 0, 0))
+            else:
+                origin, size = bounds.origin, bounds.size
+                boxes.append((origin.x, origin.y, size.x, size.y))
+        x, y, w, h = (self.interpolate(b[i] for b in boxes) for i in range(4))
+        return Rect(Point(x, y), Size(w, h))
+
+
+class InterpolatedGlyph:
+    # Interpolated again for every build, so never taken from MathGlyphCache.
+    lastChange = None
+
+    def __init__(self, glyph, layers, scalars):
+        self.name = glyph.name
+        self.productionName = _productionName(glyph)
+        self.userData = UserData(glyph.userData or {})
+        self.layer = InterpolatedLayer(layers, scalars)
+        self.layers = LayerList([self.layer])
+
+
+class InterpolatedMaster:
+    id = MASTER_ID
+
+    def __init__(self, masters, scalars):
+        constants = {}
+        for c in MATH_CONSTANTS:
+            value = None
+            for master, factor in zip(masters, scalars):
+                masterConstants = master.userData[CONSTANTS_ID] or {}
+                if v := masterConstants.get(c):
+                    if value is None:
+                        value = 0
+                    value += v * factor
+            if value is not None:
+                constants[c] = round(value)
+        self.userData = UserData()
+        if constants:
+            self.userData[CONSTANTS_ID] = constants
+
+
+class InterpolatedFont:
+    """Stand-in for GSInstance.interpolatedFont built from a glyphsLib font."""
+
+    def __init__(self, source, instance):
+        masters = orderedMasters(source)
+        scalars = _masterScalars(source, masters, instance)
+        self.customParameters = source.customParameters
+        self.instances = [instance]
+        self.masters = [InterpolatedMaster(masters, scalars)]
+
+        glyphs = []
+        for glyph in source.glyphs:
+            if not glyph.export:
+                continue
+            layers = [glyph.layers[m.id] for m in masters]
+            if None in layers:
+                # Sparse glyph, use the origin layer as is.
+                layers, glyphScalars = layers[:1], [1]
+            else:
+                glyphScalars = scalars
+            if layers[0] is None:
+                continue
+            glyphs.append(InterpolatedGlyph(glyph, layers, glyphScalars))
+        self.glyphs = GlyphList(glyphs)
+
+
+def _productionName(glyph):
+    if glyph.production:
+        return glyph.production
+    from glyphsLib.glyphdata import get_glyph
+
+    return get_glyph(glyph.name).production_name
+
+
+def _masterScalars(source, masters, instance):
+    if len(masters) == 1:
+        return [1]
+
+    from fontTools.varLib.models import VariationModel
+
+    triples = axisTriples(source, masters)
+    model = VariationModel(
+        [normalizeLocation(source, m.axes, triples) for m in masters]
+    )
+    return model.getMasterScalars(normalizeLocation(source, instance.axes, triples))
+
+
+@lru_cache(maxsize=None)
+def _loadSource(path):
+    import glyphsLib
+
+    return glyphsLib.load(path)
+
+
+def _staticInstances(source):
+    for i, instance in enumerate(source.instances):
+        if not instance.exports or getattr(instance, "type", None) == "variable":
+            continue
+        yield i, instance
+
+
+def _postScriptName(path):
+    from fontTools.ttLib import TTFont
+
+    with TTFont(path, lazy=True) as ttFont:
+        return ttFont["name"].getDebugName(6)
+
+
+def _buildFonts(job):
+    """Build the MATH table of one instance into all its font files."""
+    (sourcePath, instanceIndex), fontPaths = job
+    source = _loadSource(sourcePath)
+    font = InterpolatedFont(source, source.instances[instanceIndex])
+    mathData = MathTableBuilder.collectMathData(font)
+    cache = MathGlyphCache()
+    return [MathTableBuilder.writeMathTable(mathData, p, cache) for p in fontPaths]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m OpenTypeMathPlugin.headless",
+        description="Build MATH tables into fonts exported from Glyphs sources.",
+    )
+    parser.add_argument("sources", nargs="+", metavar="SOURCE")
+    parser.add_argument("-f", "--fonts", nargs="+", metavar="FONT", required=True)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    options = parser.parse_args(args)
+
+    instances = {}
+    for sourcePath in options.sources:
+        source = _loadSource(sourcePath)
+        for i, instance in _staticInstances(source):
+            instances[instance.fontName.replace(" ", "")] = (sourcePath, i)
+
+    jobs = {}
+    failed = False
+    for fontPath in options.fonts:
+        psName = (_postScriptName(fontPath) or "").replace(" ", "")
+        if psName not in instances:
+            print(f"{fontPath}: no matching instance for ‘{psName}’", file=sys.stderr)
+            failed = True
+            continue
+        jobs.setdefault(instances[psName], []).append(fontPath)
+
+    with ProcessPoolExecutor(options.jobs) as executor:
+        jobs = list(jobs.items())
+        for (_, fontPaths), results in zip(jobs, executor.map(_buildFonts, jobs)):
+            for fontPath, built in zip(fontPaths, results):
+                status = "MATH table built" if built else "no MATH data"
+                print(f"{fontPath}: {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
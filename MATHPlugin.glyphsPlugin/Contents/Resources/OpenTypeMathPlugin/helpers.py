@@ -1,3 +1,28 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from OpenTypeMathPlugin.constants import (
+    ITALIC_CORRECTION_ANCHOR,
+    KERN_BOTTOM_LEFT_ANCHOR,
+    KERN_BOTTOM_RIGHT_ANCHOR,
+    KERN_TOP_LEFT_ANCHOR,
+    KERN_TOP_RIGHT_ANCHOR,
+    MATH_ANCHOR_PREFIX,
+    TOP_ACCENT_ANCHOR,
+    VARIANTS_INDEX_ID,
+)
+
+KERN_CORNERS = (
+    KERN_TOP_RIGHT_ANCHOR,
+    KERN_TOP_LEFT_ANCHOR,
+    KERN_BOTTOM_RIGHT_ANCHOR,
+    KERN_BOTTOM_LEFT_ANCHOR,
+)
+
+# Number of distinct anchor sets whose parsed MATH anchors are kept.
+ANCHOR_INDEX_SIZE = 4096
+
+
 def _getMetrics(layer):
     size = layer.bounds.size
     return size.width, size.height
@@ -9,3 +34,123 @@ def _bboxWidth(layer):
 
 def _bboxHeight(layer):
     return layer.bounds.size.height
+
+
+GlyphMetrics = namedtuple(
+    "GlyphMetrics", ["productionName", "width", "height", "advance"]
+)
+
+
+MathAnchors = namedtuple("MathAnchors", ["italic", "accent", "kerns"])
+MathAnchors.__doc__ = """The MATH anchors of a layer: the x positions of the
+italic correction and top accent anchors, or None, and the (x, y) points of
+each MathKern corner sorted by height."""
+
+
+def anchorKey(layer):
+    """The MATH anchors of `layer` as (name, x, y) tuples, which identify its
+    parsed MathAnchors."""
+    return tuple(
+        (a.name, a.position.x, a.position.y)
+        for a in layer.anchors
+        if a.name.startswith(MATH_ANCHOR_PREFIX)
+    )
+
+
+@lru_cache(maxsize=ANCHOR_INDEX_SIZE)
+def parseMathAnchors(anchors):
+    """Parse the MATH anchors of a layer, given by its anchorKey(), once.
+    Layers with the same anchors share the result, so it must not be
+    modified."""
+    italic = accent = None
+    kerns = {}
+    for name, x, y in anchors:
+        if name == ITALIC_CORRECTION_ANCHOR:
+            italic = x
+        elif name == TOP_ACCENT_ANCHOR:
+            accent = x
+        else:
+            # Cut-ins are a series of math.tr.0, math.tr.1, … anchors.
+            corner = name.rsplit(".", 1)[0] if name.count(".") > 1 else name
+            if corner in KERN_CORNERS:
+                kerns.setdefault(corner, []).append((x, y))
+    kerns = {c: tuple(sorted(pts, key=lambda pt: pt[1])) for c, pts in kerns.items()}
+    return MathAnchors(italic, accent, kerns)
+
+
+def mathAnchors(layer):
+    """The MathAnchors of `layer`, parsed again only when its MATH anchors
+    change."""
+    return parseMathAnchors(anchorKey(layer))
+
+
+class MetricsIndex(dict):
+    """Maps glyph names to their GlyphMetrics for the duration of one build.
+
+    Glyphs are only measured the first time they are looked up, so each glyph
+    is measured at most once and glyphs that nothing references are never
+    measured at all."""
+
+    def __init__(self, font, productionMap, masterId=None):
+        super().__init__()
+        self.font = font
+        self.productionMap = productionMap
+        self.masterId = masterId
+
+    def __missing__(self, name):
+        layers = self.font.glyphs[name].layers
+        layer = layers[0] if self.masterId is None else layers[self.masterId]
+        width, height = _getMetrics(layer)
+        metrics = GlyphMetrics(
+            self.productionMap.get(name, name), width, height, layer.width
+        )
+        self[name] = metrics
+        return metrics
+
+
+class GlyphIndex:
+    """Resolves the glyph names and glyph IDs of a compiled font to the glyphs
+    of a GSFont.
+
+    The index is built once per import, so every lookup is a dictionary
+    access instead of a search of the font or of the glyph order."""
+
+    def __init__(self, font, glyphOrder):
+        glyphs = list(font.glyphs)
+        self.byGID = dict(enumerate(glyphs[: len(glyphOrder)]))
+        self.byName = {}
+        # Glyphs may have been renamed in the compiled font (e.g. production
+        # names), fall back to the glyph at the same glyph ID.
+        for gid, name in enumerate(glyphOrder):
+            if gid in self.byGID:
+                self.byName[name] = self.byGID[gid]
+        self.byName.update((g.name, g) for g in glyphs)
+
+    def __getitem__(self, name):
+        return self.byName.get(name)
+
+    def glyphForID(self, gid):
+        return self.byGID.get(gid)
+
+
+def indexGlyphs(font, glyphs, reset=False):
+    """Add `glyphs` to the index of glyphs with MATH variants userData kept in
+    `font.userData`, or replace the index with them if `reset` is set.
+
+    The index holds GSGlyphReferences, so it follows glyph renames."""
+    from GlyphsApp import GSGlyphReference
+
+    index = [] if reset else list(font.userData[VARIANTS_INDEX_ID] or [])
+    names = {str(ref) for ref in index}
+    added = [GSGlyphReference(g) for g in glyphs if g.name not in names]
+    if added or reset:
+        font.userData[VARIANTS_INDEX_ID] = index + added
+
+
+def indexedGlyphs(font):
+    """The glyphs in the variants index of `font` that still exist."""
+    glyphs = []
+    for ref in font.userData[VARIANTS_INDEX_ID] or []:
+        if (glyph := font.glyphs[str(ref)]) is not None:
+            glyphs.append(glyph)
+    return glyphs
@@ -0,0 +1,362 @@
+import time
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+
+from OpenTypeMathPlugin.constants import (
+    CONSTANTS_ID,
+    EXTENDED_SHAPE_ID,
+    ITALIC_CORRECTION_ANCHOR,
+    KERN_BOTTOM_LEFT_ANCHOR,
+    KERN_BOTTOM_RIGHT_ANCHOR,
+    KERN_TOP_LEFT_ANCHOR,
+    KERN_TOP_RIGHT_ANCHOR,
+    MATH_CONSTANTS,
+    TOP_ACCENT_ANCHOR,
+    H_ASSEMBLY_ID,
+    H_VARIANTS_ID,
+    VARIANTS_ID,
+    V_ASSEMBLY_ID,
+    V_VARIANTS_ID,
+)
+from OpenTypeMathPlugin.helpers import GlyphIndex, indexGlyphs
+
+# How many glyphs are parsed between progress reports, which is also how
+# often the parsing checks whether it was cancelled.
+REPORT_INTERVAL = 100
+
+KERN_ANCHORS = {
+    "TopRightMathKern": KERN_TOP_RIGHT_ANCHOR,
+    "BottomRightMathKern": KERN_BOTTOM_RIGHT_ANCHOR,
+    "TopLeftMathKern": KERN_TOP_LEFT_ANCHOR,
+    "BottomLeftMathKern": KERN_BOTTOM_LEFT_ANCHOR,
+}
+
+MathImportData = namedtuple(
+    "MathImportData",
+    [
+        "glyphOrder",
+        "constants",
+        "italic",
+        "accent",
+        "extended",
+        "kerns",
+        "vVariants",
+        "hVariants",
+        "vAssemblies",
+        "hAssemblies",
+    ],
+)
+MathImportData.__doc__ = """The contents of a MATH table in plain Python
+objects, with glyphs referenced by their names in the compiled font."""
+
+
+def _reportEach(items, count, report, start, end):
+    """Yield from `items`, reporting the progress from `start` to `end` every
+    REPORT_INTERVAL of the `count` items."""
+    for i, item in enumerate(items):
+        if i % REPORT_INTERVAL == 0:
+            report(start + (end - start) * i / count)
+        yield item
+    report(end)
+
+
+def _parseConstruction(coverage, constructions, variants, assemblies, *report):
+    glyphs = coverage.glyphs
+    for name, construction in _reportEach(
+        zip(glyphs, constructions), len(glyphs), *report
+    ):
+        if records := construction.MathGlyphVariantRecord:
+            variants[name] = [r.VariantGlyph for r in records]
+        if assembly := construction.GlyphAssembly:
+            parts = [
+                [p.glyph, p.PartFlags, p.StartConnectorLength, p.EndConnectorLength]
+                for p in assembly.PartRecords
+            ]
+            italic = assembly.ItalicsCorrection
+            assemblies[name] = (parts, italic.Value if italic else None)
+
+
+def _kernPoints(heights, values, master, top):
+    """The MathKern correction heights and kern values as anchor points, the
+    last kern value extends to an arbitrary height above or below the last
+    correction height."""
+    heights = list(heights)
+    last = master.ascender
+    if heights and heights[-1] >= master.ascender:
+        last = heights[-1] + 100
+    elif not heights:
+        last = master.ascender if top else master.descender
+    heights.append(last)
+    return zip(values, heights)
+
+
+@contextmanager
+def bulkChanges(font, glyphs):
+    """Suspend interface updates of `font` and undo registration of it and
+    `glyphs`, so that a batch of changes is applied at once and does not
+    leave anything to undo."""
+    undoManagers = [font.undoManager()] + [g.undoManager() for g in glyphs]
+    font.disableUpdateInterface()
+    for undoManager in undoManagers:
+        undoManager.disableUndoRegistration()
+    try:
+        yield
+    finally:
+        for undoManager in undoManagers:
+            undoManager.enableUndoRegistration()
+        font.enableUpdateInterface()
+
+
+class MathTableImporter:
+    @staticmethod
+    def parseMathTable(ttFont, report=None):
+        """Read the MATH table of `ttFont` into MathImportData, or None if
+        there is no supported MATH table. This does not touch any Glyphs
+        objects, so it can run off the main thread.
+
+        `report` is called with the progress so far, from 0 to 1."""
+        report = report or (lambda progress: None)
+        if "MATH" not in ttFont:
+            return
+
+        from fontTools.ttLib.tables import otTables
+
+        # The MATH table is decompiled piece by piece as it is read below,
+        # with a lazy `ttFont` the top-level table is all that is read here.
+        report(0)
+        table = ttFont["MATH"].table
+        if table.Version != 0x00010000:
+            return
+        report(0.05)
+
+        data = MathImportData(
+            ttFont.getGlyphOrder(), {}, {}, {}, [], {}, {}, {}, {}, {}
+        )
+
+        if table.MathConstants:
+            for constant in MATH_CONSTANTS:
+                value = getattr(table.MathConstants, constant, None)
+                if value is not None:
+                    if isinstance(value, otTables.MathValueRecord):
+                        value = value.Value
+                    data.constants[constant] = value
+        report(0.1)
+
+        if info := table.MathGlyphInfo:
+            if italic := info.MathItalicsCorrectionInfo:
+                glyphs = italic.Coverage.glyphs
+                for name, value in _reportEach(
+                    zip(glyphs, italic.ItalicsCorrection), len(glyphs), report, 0.1, 0.2
+                ):
+                    data.italic[name] = value.Value
+
+            if accent := info.MathTopAccentAttachment:
+                glyphs = accent.TopAccentCoverage.glyphs
+                for name, value in _reportEach(
+                    zip(glyphs, accent.TopAccentAttachment),
+                    len(glyphs),
+                    report,
+                    0.2,
+                    0.3,
+                ):
+                    data.accent[name] = value.Value
+
+            if extended := info.ExtendedShapeCoverage:
+                data.extended.extend(extended.glyphs)
+            report(0.35)
+
+            if kernInfo := info.MathKernInfo:
+                glyphs = kernInfo.MathKernCoverage.glyphs
+                for name, record in _reportEach(
+                    zip(glyphs, kernInfo.MathKernInfoRecords),
+                    len(glyphs),
+                    report,
+                    0.35,
+                    0.6,
+                ):
+                    kerns = {}
+                    for attr, anchor in KERN_ANCHORS.items():
+                        if kern := getattr(record, attr):
+                            kerns[anchor] = (
+                                [h.Value for h in kern.CorrectionHeight],
+                                [k.Value for k in kern.KernValue],
+                            )
+                    data.kerns[name] = kerns
+        report(0.6)
+
+        if variants := table.MathVariants:
+            data.constants["MinConnectorOverlap"] = variants.MinConnectorOverlap
+            if coverage := variants.VertGlyphCoverage:
+                _parseConstruction(
+                    coverage,
+                    variants.VertGlyphConstruction,
+                    data.vVariants,
+                    data.vAssemblies,
+                    report,
+                    0.6,
+                    0.8,
+                )
+            if coverage := variants.HorizGlyphCoverage:
+                _parseConstruction(
+                    coverage,
+                    variants.HorizGlyphConstruction,
+                    data.hVariants,
+                    data.hAssemblies,
+                    report,
+                    0.8,
+                    1,
+                )
+        report(1)
+
+        return data
+
+    @staticmethod
+    def applyMathData(font, data):
+        """Write parsed MathImportData into the first master of `font`.
+
+        The changes are collected per glyph first and then applied in one
+        batch, without registering undo actions or updating the interface
+        for each of them."""
+        from GlyphsApp import GSAnchor
+
+        master = font.masters[0]
+        glyphs = GlyphIndex(font, data.glyphOrder)
+
+        anchors = {}
+        glyphData = {}
+        layerData = {}
+
+        def layerAnchors(name):
+            glyph = glyphs[name]
+            return anchors.setdefault(glyph, {})
+
+        for name, value in data.italic.items():
+            width = glyphs[name].layers[master.id].width
+            layerAnchors(name)[ITALIC_CORRECTION_ANCHOR] = (width + value, 0)
+
+        for name, value in data.accent.items():
+            layerAnchors(name)[TOP_ACCENT_ANCHOR] = (value, 0)
+
+        for name, kerns in data.kerns.items():
+            width = glyphs[name].layers[master.id].width
+            for anchor, (heights, values) in kerns.items():
+                top = anchor in (KERN_TOP_RIGHT_ANCHOR, KERN_TOP_LEFT_ANCHOR)
+                right = anchor in (KERN_TOP_RIGHT_ANCHOR, KERN_BOTTOM_RIGHT_ANCHOR)
+                points = _kernPoints(heights, values, master, top)
+                for i, (x, y) in enumerate(points):
+                    x = x + width if right else -x
+                    layerAnchors(name)[f"{anchor}.{i}"] = (x, y)
+
+        for variants, key in (
+            (data.vVariants, V_VARIANTS_ID),
+            (data.hVariants, H_VARIANTS_ID),
+        ):
+            for name, names in variants.items():
+                varData = glyphData.setdefault(glyphs[name], {})
+                varData[key] = [glyphs[n].name for n in names]
+
+        for assemblies, key in (
+            (data.vAssemblies, V_ASSEMBLY_ID),
+            (data.hAssemblies, H_ASSEMBLY_ID),
+        ):
+            for name, (parts, italic) in assemblies.items():
+                varData = layerData.setdefault(glyphs[name], {})
+                varData[key] = [[glyphs[p[0]].name, *p[1:]] for p in parts]
+                if italic is not None:
+                    # The italic correction of an assembly goes to its last part.
+                    width = glyphs[parts[-1][0]].layers[master.id].width
+                    layerAnchors(parts[-1][0])[ITALIC_CORRECTION_ANCHOR] = (
+                        width + italic,
+                        0,
+                    )
+
+        changed = set(anchors) | set(glyphData) | set(layerData)
+        with bulkChanges(font, changed):
+            for glyph, positions in anchors.items():
+                layer = glyph.layers[master.id]
+                for aName, position in positions.items():
+                    layer.anchors[aName] = GSAnchor(aName, position)
+
+            for name in data.extended:
+                glyphs[name].userData[EXTENDED_SHAPE_ID] = True
+
+            for glyph, varData in glyphData.items():
+                glyph.userData[VARIANTS_ID] = {
+                    **(glyph.userData.get(VARIANTS_ID) or {}),
+                    **varData,
+                }
+
+            for glyph, varData in layerData.items():
+                layer = glyph.layers[master.id]
+                layer.userData[VARIANTS_ID] = {
+                    **(layer.userData.get(VARIANTS_ID) or {}),
+                    **varData,
+                }
+
+            indexGlyphs(font, set(glyphData) | set(layerData))
+
+            if data.constants:
+                master.userData[CONSTANTS_ID] = data.constants
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class MathImportTask:
+    """Imports the MATH table of a compiled font file into `font` in two
+    phases: parse() reads the table on a worker thread, apply() then writes
+    it into the font on the main thread. The task can be cancelled until it
+    is applied."""
+
+    def __init__(self, font, path, fontNumber=0):
+        self.font = font
+        self.path = path
+        self.fontNumber = fontNumber
+        self.start = time.perf_counter()
+        self.progress = 0
+        self.cancelled = False
+        self.done = False
+        self.data = None
+        self.error = None
+        # Whether the document had unsaved changes when the import started.
+        self.documentEdited = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report(self, progress):
+        if self.cancelled:
+            raise ImportCancelled()
+        self.progress = progress
+
+    def parse(self):
+        from fontTools.ttLib import TTFont
+
+        try:
+            try:
+                ttFont = TTFont(
+                    self.path,
+                    fontNumber=self.fontNumber,
+                    lazy=True,
+                    recalcBBoxes=False,
+                )
+            except Exception:
+                # Not a compiled font.
+                return
+            with ttFont:
+                self.data = MathTableImporter.parseMathTable(ttFont, self.report)
+        except ImportCancelled:
+            pass
+        except Exception:
+            self.error = traceback.format_exc()
+        finally:
+            self.done = True
+
+    def apply(self):
+        """Returns whether a MATH table was imported."""
+        if self.cancelled or not self.data:
+            return False
+        MathTableImporter.applyMathData(self.font, self.data)
+        return True
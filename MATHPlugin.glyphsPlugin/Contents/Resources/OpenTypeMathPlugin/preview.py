@@ -0,0 +1,180 @@
+"""A view of the construction of a stretchy glyph picked for a size, for
+dragging the size around in the MATH variants window."""
+
+import AppKit
+import weakref
+import vanilla
+
+from OpenTypeMathPlugin.canvas import Canvas, Style
+from OpenTypeMathPlugin.errors import reporter
+from OpenTypeMathPlugin.stretch import StretchIndex
+
+# Space around the construction, in points.
+PREVIEW_MARGIN = 12
+# The largest size of the size range, relative to the largest construction.
+PREVIEW_RANGE = 3
+
+TARGET_STYLE = Style("orange", 1, True)
+
+
+class MATHStretchPreviewView(AppKit.NSView):
+    def drawRect_(self, rect):
+        if (preview := self.preview()) is None:
+            return
+        try:
+            preview.draw(self.bounds())
+        except Exception:
+            reporter.report("Drawing stretch preview", preview.glyph.name)
+
+
+class StretchPreview(vanilla.VanillaBaseObject):
+    """Draws the construction of `layer` picked for a size, in one direction.
+
+    The outline of every glyph is fetched once and reused however the parts
+    are laid out, and the StretchyGlyph is kept between sizes, so changing
+    the size only lays out the assembly again. update() reads the variants
+    and the assembly again after they are edited, and fetches the outlines of
+    the glyphs that changed since."""
+
+    nsViewClass = MATHStretchPreviewView
+
+    def __init__(self, posSize, layer, vertical=True):
+        self._setupView(self.nsViewClass, posSize)
+        self._nsObject.preview = weakref.ref(self)
+        self.layer = layer
+        self.glyph = layer.parent
+        self.vertical = vertical
+        font = self.glyph.parent
+        self.index = StretchIndex(
+            font, font.masters[layer.associatedMasterId], vertical
+        )
+        # Glyph name: (NSBezierPath, bounds as NSRect).
+        self.outlines = {}
+        # Glyph name: lastChange of the glyph when it was measured or its
+        # outline was fetched.
+        self.versions = {}
+        self.size = 0
+        self.construction = None
+        self.update()
+
+    def getNSView(self):
+        return self._nsObject
+
+    def outline(self, name):
+        if (outline := self.outlines.get(name)) is None:
+            glyph = self.glyph.parent.glyphs[name]
+            path = glyph.layers[self.index.master.id].completeBezierPath
+            if path is None or path.isEmpty():
+                path = None
+            bounds = path.bounds() if path is not None else None
+            outline = self.outlines[name] = (path, bounds)
+            self.versions.setdefault(name, glyph.lastChange)
+        return outline
+
+    def update(self):
+        font = self.glyph.parent
+        for name, version in list(self.versions.items()):
+            glyph = font.glyphs[name]
+            if glyph is None or glyph.lastChange != version:
+                del self.versions[name]
+                self.outlines.pop(name, None)
+                self.index.metrics.pop(name, None)
+        self.index.pop(self.glyph.name, None)
+        self.stretchy = self.index[self.glyph.name]
+        for name in self.index.metrics:
+            if name not in self.versions:
+                self.versions[name] = font.glyphs[name].lastChange
+        self.setSize(self.size, force=True)
+
+    def sizeRange(self):
+        """The sizes worth previewing: up to PREVIEW_RANGE times the largest
+        variant, or assembly with each extender once."""
+        stretchy = self.stretchy
+        largest = max(stretchy.sizes, default=0)
+        if (engine := stretchy.engine) is not None:
+            largest = max(largest, engine.arrange(1, engine.minOverlap).size)
+        return 0, largest * PREVIEW_RANGE
+
+    def setSize(self, size, force=False):
+        if size == self.size and not force:
+            return
+        self.size = size
+        construction = self.stretchy.select(size)
+        if construction != self.construction:
+            self.construction = construction
+            self._nsObject.setNeedsDisplay_(True)
+        elif force:
+            self._nsObject.setNeedsDisplay_(True)
+
+    def placements(self):
+        """The outline of every glyph of the construction and its offset in
+        the direction of the construction."""
+        if (construction := self.construction) is None:
+            return []
+        if construction.layout is None:
+            return [(self.outline(construction.variant), 0)]
+        parts = self.stretchy.parts
+        return [
+            (self.outline(parts[i]), offset)
+            for i, offset in construction.layout.positions
+        ]
+
+    def draw(self, rect):
+        placements = [(o, d) for o, d in self.placements() if o[0] is not None]
+        if not placements:
+            return
+        vertical = self.vertical
+
+        xMin = yMin = float("inf")
+        xMax = yMax = float("-inf")
+        for (_, bounds), offset in placements:
+            x = bounds.origin.x + (0 if vertical else offset)
+            y = bounds.origin.y + (offset if vertical else 0)
+            xMin, yMin = min(xMin, x), min(yMin, y)
+            xMax = max(xMax, x + bounds.size.width)
+            yMax = max(yMax, y + bounds.size.height)
+
+        # Keep the scale for the whole size range, so that the construction
+        # grows and shrinks with the size instead of always filling the view.
+        width = rect.size.width - 2 * PREVIEW_MARGIN
+        height = rect.size.height - 2 * PREVIEW_MARGIN
+        extent = max(self.sizeRange()[1], self.size, 1)
+        if vertical:
+            scale = min(height / extent, width / max(xMax - xMin, 1))
+            dx = rect.origin.x + (rect.size.width - (xMax - xMin) * scale) / 2
+            dx -= xMin * scale
+            dy = rect.origin.y + PREVIEW_MARGIN - yMin * scale
+        else:
+            scale = min(width / extent, height / max(yMax - yMin, 1))
+            dx = rect.origin.x + PREVIEW_MARGIN - xMin * scale
+            dy = rect.origin.y + (rect.size.height - (yMax - yMin) * scale) / 2
+            dy -= yMin * scale
+        if scale <= 0:
+            return
+
+        AppKit.NSColor.textColor().set()
+        for (path, _), offset in placements:
+            transform = AppKit.NSAffineTransform.transform()
+            if vertical:
+                transform.translateXBy_yBy_(dx, dy + offset * scale)
+            else:
+                transform.translateXBy_yBy_(dx + offset * scale, dy)
+            transform.scaleBy_(scale)
+            AppKit.NSGraphicsContext.saveGraphicsState()
+            transform.concat()
+            path.fill()
+            AppKit.NSGraphicsContext.restoreGraphicsState()
+
+        # The size asked for, from where the construction starts.
+        canvas = Canvas()
+        if vertical:
+            y = dy + (yMin + self.size) * scale
+            canvas.line(
+                TARGET_STYLE, (rect.origin.x, y), (rect.origin.x + rect.size.width, y)
+            )
+        else:
+            x = dx + (xMin + self.size) * scale
+            canvas.line(
+                TARGET_STYLE, (x, rect.origin.y), (x, rect.origin.y + rect.size.height)
+            )
+        canvas.draw()
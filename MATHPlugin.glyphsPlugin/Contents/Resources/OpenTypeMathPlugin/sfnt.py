@@ -0,0 +1,543 @@
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from contextlib import contextmanager
+
+SFNT_VERSIONS = (b"\x00\x01\x00\x00", b"OTTO", b"true")
+WOFF_SIGNATURE = b"wOFF"
+WOFF2_SIGNATURE = b"wOF2"
+TTC_SIGNATURE = b"ttcf"
+
+SFNT_HEADER = ">4sHHHH"
+SFNT_HEADER_SIZE = struct.calcsize(SFNT_HEADER)
+TABLE_RECORD = ">4sLLL"
+TABLE_RECORD_SIZE = struct.calcsize(TABLE_RECORD)
+
+WOFF_HEADER = ">4s4sLHHLHHLLLLL"
+WOFF_HEADER_SIZE = struct.calcsize(WOFF_HEADER)
+WOFF_TABLE_RECORD = ">4sLLLL"
+WOFF_TABLE_RECORD_SIZE = struct.calcsize(WOFF_TABLE_RECORD)
+
+WOFF2_HEADER = ">4s4sLHHLLHHLLLLL"
+WOFF2_HEADER_SIZE = struct.calcsize(WOFF2_HEADER)
+
+# fmt: off
+WOFF2_KNOWN_TAGS = [
+    b"cmap", b"head", b"hhea", b"hmtx", b"maxp", b"name", b"OS/2", b"post",
+    b"cvt ", b"fpgm", b"glyf", b"loca", b"prep", b"CFF ", b"VORG", b"EBDT",
+    b"EBLC", b"gasp", b"hdmx", b"kern", b"LTSH", b"PCLT", b"VDMX", b"vhea",
+    b"vmtx", b"BASE", b"GDEF", b"GPOS", b"GSUB", b"EBSC", b"JSTF", b"MATH",
+    b"CBDT", b"CBLC", b"COLR", b"CPAL", b"SVG ", b"sbix", b"acnt", b"avar",
+    b"bdat", b"bloc", b"bsln", b"cvar", b"fdsc", b"feat", b"fmtx", b"fvar",
+    b"gvar", b"hsty", b"just", b"lcar", b"mort", b"morx", b"opbd", b"prop",
+    b"trak", b"Zapf", b"Silf", b"Glat", b"Gloc", b"Feat", b"Sill",
+]
+# fmt: on
+WOFF2_CUSTOM_TAG = 0x3F
+
+CHECKSUM_MAGIC = 0xB1B0AFBA
+HEAD_CHECKSUM_OFFSET = 8
+
+
+def _pad(data):
+    return data + b"\0" * (-len(data) % 4)
+
+
+def _align(offset):
+    return (offset + 3) & ~3
+
+
+def _checksum(data):
+    data = _pad(data)
+    return sum(struct.unpack(f">{len(data) // 4}L", data)) & 0xFFFFFFFF
+
+
+def _searchParams(numTables):
+    entrySelector = max(numTables.bit_length() - 1, 0)
+    searchRange = (1 << entrySelector) * 16
+    return searchRange, entrySelector, numTables * 16 - searchRange
+
+
+def _zeroAdjustment(head):
+    head = bytearray(head)
+    struct.pack_into(">L", head, HEAD_CHECKSUM_OFFSET, 0)
+    return head
+
+
+def _adjustHead(head, sfntVersion, tables, offsets):
+    """Set the checkSumAdjustment of `head` for an sfnt font whose `tables`
+    map tags to (checksum, length) and are laid out at `offsets`. Returns the
+    sfnt table directory."""
+    numTables = len(tables)
+    directory = struct.pack(
+        SFNT_HEADER, sfntVersion, numTables, *_searchParams(numTables)
+    )
+    for tag in sorted(tables):
+        checksum, length = tables[tag]
+        directory += struct.pack(TABLE_RECORD, tag, checksum, offsets[tag], length)
+
+    if head is not None:
+        total = _checksum(directory) + sum(c for c, _ in tables.values())
+        adjustment = (CHECKSUM_MAGIC - total) & 0xFFFFFFFF
+        struct.pack_into(">L", head, HEAD_CHECKSUM_OFFSET, adjustment)
+    return directory
+
+
+def _tableChecksum(tag, data):
+    return _checksum(_zeroAdjustment(data) if tag == b"head" else data)
+
+
+def _directoryChecksum(sfntVersion, lengths):
+    """The checksum of the table directory of an sfnt font with tables of
+    `lengths` in tag order, with the checksums of the tables left out."""
+    tables = {tag: (0, length) for tag, length in lengths.items()}
+    offsets, _ = _sfntOffsets(sorted(tables), lengths)
+    return _checksum(_adjustHead(None, sfntVersion, tables, offsets))
+
+
+def _sfntOffsets(tags, lengths):
+    offset = SFNT_HEADER_SIZE + len(tags) * TABLE_RECORD_SIZE
+    offsets = {}
+    for tag in tags:
+        offsets[tag] = offset
+        offset += _align(lengths[tag])
+    return offsets, offset
+
+
+def _moveBlocks(m, offset, blocks):
+    """Copy the (offset, length) `blocks` of `m` to start at `offset`, each
+    aligned to four bytes. Returns the new offsets, the data to write and the
+    end offset."""
+    offsets = []
+    data = b""
+    for blockOffset, length in blocks:
+        if not length:
+            offsets.append(0)
+            continue
+        data += b"\0" * (_align(offset) - offset)
+        offset = _align(offset)
+        offsets.append(offset)
+        end = blockOffset + length
+        data += m[blockOffset:end]
+        offset += length
+    return offsets, data, offset
+
+
+def _unpackBase128(data, offset):
+    value = 0
+    for i in range(5):
+        byte = data[offset + i]
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, offset + i + 1
+    raise ValueError("UIntBase128 sequence exceeds 5 bytes")
+
+
+def _packBase128(value):
+    data = bytes([value & 0x7F])
+    value >>= 7
+    while value:
+        data = bytes([0x80 | (value & 0x7F)]) + data
+        value >>= 7
+    return data
+
+
+def _unpack255UShort(data, offset):
+    code = data[offset]
+    if code == 253:
+        return struct.unpack_from(">H", data, offset + 1)[0], offset + 3
+    if code == 254:
+        return data[offset + 1] + 253 * 2, offset + 2
+    if code == 255:
+        return data[offset + 1] + 253, offset + 2
+    return code, offset + 1
+
+
+def _directoryTags(directory, recordSize):
+    count = len(directory) // recordSize
+    return {
+        struct.unpack_from(">4s", directory, i * recordSize)[0] for i in range(count)
+    }
+
+
+def _sfntTags(f, offset):
+    f.seek(offset)
+    header = f.read(SFNT_HEADER_SIZE)
+    if len(header) < SFNT_HEADER_SIZE or header[:4] not in SFNT_VERSIONS:
+        return set()
+    numTables = struct.unpack_from(SFNT_HEADER, header)[1]
+    directory = f.read(numTables * TABLE_RECORD_SIZE)
+    return _directoryTags(directory, TABLE_RECORD_SIZE)
+
+
+def _woff2Tags(f):
+    f.seek(0)
+    header = f.read(WOFF2_HEADER_SIZE)
+    flavor, _, numTables = struct.unpack_from(WOFF2_HEADER, header)[1:4]
+    # Each directory entry takes at most 15 bytes.
+    data = f.read(numTables * 15)
+    tags = []
+    offset = 0
+    for _ in range(numTables):
+        flags = data[offset]
+        offset += 1
+        if flags & 0x3F == WOFF2_CUSTOM_TAG:
+            end = offset + 4
+            tag = data[offset:end]
+            offset = end
+        else:
+            tag = WOFF2_KNOWN_TAGS[flags & 0x3F]
+        _, offset = _unpackBase128(data, offset)
+        if flags >> 6 != _nullTransform(tag):
+            _, offset = _unpackBase128(data, offset)
+        tags.append(tag)
+
+    if flavor != TTC_SIGNATURE:
+        return [set(tags)]
+
+    # The collection directory follows the table directory, each font lists
+    # the indices of its tables.
+    f.seek(WOFF2_HEADER_SIZE + offset)
+    data = f.read(7)
+    numFonts, offset = _unpack255UShort(data, 4)
+    data = data + f.read(numFonts * (3 + 4 + len(tags) * 3))
+    faces = []
+    for _ in range(numFonts):
+        numFaceTables, offset = _unpack255UShort(data, offset)
+        offset += 4
+        face = set()
+        for _ in range(numFaceTables):
+            index, offset = _unpack255UShort(data, offset)
+            face.add(tags[index])
+        faces.append(face)
+    return faces
+
+
+def fontTables(path):
+    """The table tags of every face in the font file at `path`, read from the
+    table directories alone. Supports sfnt fonts and collections, WOFF and
+    WOFF2 fonts. Returns an empty list for anything that is not a font."""
+    try:
+        with open(path, "rb") as f:
+            signature = f.read(4)
+            if signature in SFNT_VERSIONS:
+                return [_sfntTags(f, 0)]
+            if signature == TTC_SIGNATURE:
+                f.seek(8)
+                numFonts = struct.unpack(">L", f.read(4))[0]
+                offsets = struct.unpack(f">{numFonts}L", f.read(numFonts * 4))
+                return [_sfntTags(f, offset) for offset in offsets]
+            if signature == WOFF_SIGNATURE:
+                header = f.read(WOFF_HEADER_SIZE - 4)
+                numTables = struct.unpack_from(">H", header, 8)[0]
+                directory = f.read(numTables * WOFF_TABLE_RECORD_SIZE)
+                return [_directoryTags(directory, WOFF_TABLE_RECORD_SIZE)]
+            if signature == WOFF2_SIGNATURE:
+                return _woff2Tags(f)
+    except (OSError, struct.error, IndexError, ValueError):
+        pass
+    return []
+
+
+def facesWithTable(path, tag):
+    """Indices of the faces of the font file at `path` that have a `tag`
+    table, without building any fontTools objects."""
+    tag = tag.encode("ascii") if isinstance(tag, str) else tag
+    return [i for i, tags in enumerate(fontTables(path)) if tag in tags]
+
+
+@contextmanager
+def _replaceFile(path):
+    """Yield a file object whose contents replace `path` once it is closed."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or None)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            yield out
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+    os.replace(tmp, path)
+
+
+def canSpliceTable(path):
+    """Whether spliceTable() supports the font file at `path`: a single face
+    sfnt, WOFF or WOFF2 font."""
+    with open(path, "rb") as f:
+        header = f.read(8)
+    signature, flavor = header[:4], header[4:]
+    if signature in (WOFF_SIGNATURE, WOFF2_SIGNATURE):
+        return flavor in SFNT_VERSIONS
+    return signature in SFNT_VERSIONS
+
+
+def spliceTable(path, tag, data):
+    """Add or replace a table of the font file at `path` without decompiling
+    any of the other tables.
+
+    Only the table directory and the head checksum adjustment are rewritten,
+    the bytes of all other tables are copied over unchanged. WOFF2 fonts need
+    their font data stream recompressed, but transformed tables are kept as
+    they are."""
+    spliceTables(path, {tag: data})
+
+
+def spliceTables(path, newTables):
+    """Like spliceTable(), for several tables at once. `newTables` maps table
+    tags to their compiled data."""
+    newTables = {
+        tag.encode("ascii") if isinstance(tag, str) else tag: data
+        for tag, data in newTables.items()
+    }
+
+    with open(path, "rb") as f:
+        signature = f.read(4)
+    if signature in SFNT_VERSIONS:
+        _spliceSfntTables(path, newTables)
+    elif signature == WOFF_SIGNATURE:
+        _spliceWoffTables(path, newTables)
+    elif signature == WOFF2_SIGNATURE:
+        _spliceWoff2Tables(path, newTables)
+    else:
+        raise ValueError(f"Not an sfnt, WOFF or WOFF2 font file: {path}")
+
+
+def _spliceSfntTables(path, newTables):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        sfntVersion, numTables = struct.unpack_from(SFNT_HEADER, m)[:2]
+
+        records = {}
+        for i in range(numTables):
+            offset = SFNT_HEADER_SIZE + i * TABLE_RECORD_SIZE
+            tableTag, checksum, offset, length = struct.unpack_from(
+                TABLE_RECORD, m, offset
+            )
+            records[tableTag] = (checksum, offset, length)
+
+        # Keep the existing tables in file order, and put the new tables where
+        # the old ones were or at the end.
+        order = sorted(records, key=lambda t: records[t][1])
+        for tag, data in newTables.items():
+            if tag not in records:
+                order.append(tag)
+            records[tag] = (_checksum(data), None, len(data))
+
+        head = None
+        if b"head" in records:
+            checksum, offset, length = records[b"head"]
+            end = offset + length
+            head = _zeroAdjustment(m[offset:end])
+            records[b"head"] = (_checksum(head), offset, length)
+
+        tables = {t: (checksum, length) for t, (checksum, _, length) in records.items()}
+        offsets, _ = _sfntOffsets(order, {t: r[1] for t, r in tables.items()})
+        directory = _adjustHead(head, sfntVersion, tables, offsets)
+
+        with _replaceFile(path) as out:
+            out.write(directory)
+            for tableTag in order:
+                _, offset, length = records[tableTag]
+                if tableTag in newTables:
+                    out.write(_pad(newTables[tableTag]))
+                elif tableTag == b"head":
+                    out.write(_pad(bytes(head)))
+                else:
+                    end = offset + length
+                    out.write(m[offset:end])
+                    out.write(b"\0" * (-length % 4))
+
+
+def _spliceWoffTables(path, newTables):
+    def compress(tableData):
+        compressed = zlib.compress(tableData)
+        return compressed if len(compressed) < len(tableData) else tableData
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        header = list(struct.unpack_from(WOFF_HEADER, m))
+        flavor, numTables = header[1], header[3]
+
+        records = {}
+        for i in range(numTables):
+            offset = WOFF_HEADER_SIZE + i * WOFF_TABLE_RECORD_SIZE
+            tableTag, offset, compLength, origLength, checksum = struct.unpack_from(
+                WOFF_TABLE_RECORD, m, offset
+            )
+            records[tableTag] = (offset, compLength, origLength, checksum)
+
+        order = sorted(records, key=lambda t: records[t][0])
+        tableData = {}
+        for tag, data in newTables.items():
+            if tag not in records:
+                order.append(tag)
+            tableData[tag] = compress(data)
+            records[tag] = (None, len(tableData[tag]), len(data), _checksum(data))
+
+        # The checksum adjustment is the one of the decoded sfnt font, which
+        # has its tables in tag order.
+        tables = {t: (r[3], r[2]) for t, r in records.items()}
+        head = None
+        if b"head" in records:
+            offset, compLength, origLength, _ = records[b"head"]
+            end = offset + compLength
+            head = m[offset:end]
+            if compLength != origLength:
+                head = zlib.decompress(head)
+            head = _zeroAdjustment(head)
+            tables[b"head"] = (_checksum(head), origLength)
+        lengths = {t: length for t, (_, length) in tables.items()}
+        offsets, totalSfntSize = _sfntOffsets(sorted(tables), lengths)
+        _adjustHead(head, flavor, tables, offsets)
+        if head is not None:
+            tableData[b"head"] = compress(bytes(head))
+            records[b"head"] = (None, len(tableData[b"head"]), *tables[b"head"][::-1])
+
+        offset = WOFF_HEADER_SIZE + len(records) * WOFF_TABLE_RECORD_SIZE
+        directory = []
+        for tableTag in order:
+            tableOffset, compLength, origLength, checksum = records[tableTag]
+            directory.append((tableTag, offset, compLength, origLength, checksum))
+            offset += _align(compLength)
+        directory.sort()
+
+        (header[8], header[11]), blocks, end = _moveBlocks(
+            m, offset, [(header[8], header[9]), (header[11], header[12])]
+        )
+        header[2] = end
+        header[3] = len(records)
+        header[5] = totalSfntSize
+
+        with _replaceFile(path) as out:
+            out.write(struct.pack(WOFF_HEADER, *header))
+            for record in directory:
+                out.write(struct.pack(WOFF_TABLE_RECORD, *record))
+            for tableTag in order:
+                if tableTag in tableData:
+                    out.write(_pad(tableData[tableTag]))
+                else:
+                    offset, compLength = records[tableTag][:2]
+                    end = offset + compLength
+                    out.write(m[offset:end])
+                    out.write(b"\0" * (-compLength % 4))
+            out.write(blocks)
+
+
+def _nullTransform(tag):
+    # glyf and loca use transform version 3 for the null transform, all other
+    # tables use version 0.
+    return 3 if tag in (b"glyf", b"loca") else 0
+
+
+def _spliceWoff2Tables(path, newTables):
+    import brotli
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        header = list(struct.unpack_from(WOFF2_HEADER, m))
+        flavor, numTables, totalSfntSize, totalCompressedSize = (
+            header[1],
+            header[3],
+            header[5],
+            header[6],
+        )
+        if flavor == TTC_SIGNATURE:
+            raise ValueError(f"WOFF2 font collections are not supported: {path}")
+
+        entries = []
+        offset = WOFF2_HEADER_SIZE
+        for _ in range(numTables):
+            flags = m[offset]
+            offset += 1
+            if flags & 0x3F == WOFF2_CUSTOM_TAG:
+                end = offset + 4
+                tableTag = m[offset:end]
+                offset = end
+            else:
+                tableTag = WOFF2_KNOWN_TAGS[flags & 0x3F]
+            origLength, offset = _unpackBase128(m, offset)
+            length = origLength
+            if flags >> 6 != _nullTransform(tableTag):
+                length, offset = _unpackBase128(m, offset)
+            entries.append((tableTag, flags, origLength, length))
+
+        end = offset + totalCompressedSize
+        stream = brotli.decompress(m[offset:end])
+
+        tables = {}
+        offset = 0
+        for tableTag, flags, origLength, length in entries:
+            end = offset + length
+            tables[tableTag] = stream[offset:end]
+            offset = end
+            if tableTag in newTables:
+                if flags >> 6 != _nullTransform(tableTag):
+                    raise ValueError(
+                        f"Cannot replace the transformed {tableTag} table: {path}"
+                    )
+                totalSfntSize -= TABLE_RECORD_SIZE + _align(origLength)
+
+        # The checksum adjustment is the one of the reconstructed sfnt font,
+        # whose transformed glyf, loca and hmtx tables are not known without
+        # reconstructing them. They are not changed though, so the adjustment
+        # only changes by the checksums of the replaced and new tables, which
+        # count twice as they are in the table directory as well, and by the
+        # offsets and lengths in the table directory.
+        oldLengths = {e[0]: e[2] for e in entries}
+        newLengths = {e[0]: e[2] for e in entries if e[0] not in newTables}
+        newLengths.update((tag, len(data)) for tag, data in newTables.items())
+        change = _directoryChecksum(flavor, newLengths) - _directoryChecksum(
+            flavor, oldLengths
+        )
+        for tag, data in newTables.items():
+            change += 2 * _tableChecksum(tag, data)
+            if tag in tables:
+                change -= 2 * _tableChecksum(tag, tables[tag])
+        adjustment = None
+        if b"head" in tables:
+            adjustment = struct.unpack_from(">L", tables[b"head"], HEAD_CHECKSUM_OFFSET)
+            adjustment = (adjustment[0] - change) & 0xFFFFFFFF
+
+        # The table data stays in directory order, glyf and loca need to be
+        # kept adjacent, so only the new tables are put in their tag order
+        # place.
+        entries = [e for e in entries if e[0] not in newTables]
+        for tag, data in newTables.items():
+            if tag in WOFF2_KNOWN_TAGS:
+                flags = WOFF2_KNOWN_TAGS.index(tag)
+            else:
+                flags = WOFF2_CUSTOM_TAG
+            index = sum(1 for e in entries if e[0] < tag)
+            entries.insert(index, (tag, flags, len(data), len(data)))
+            tables[tag] = data
+            totalSfntSize += TABLE_RECORD_SIZE + _align(len(data))
+        if adjustment is not None:
+            head = bytearray(tables[b"head"])
+            struct.pack_into(">L", head, HEAD_CHECKSUM_OFFSET, adjustment)
+            tables[b"head"] = bytes(head)
+
+        directory = b""
+        for tableTag, flags, origLength, length in entries:
+            directory += bytes([flags])
+            if flags & 0x3F == WOFF2_CUSTOM_TAG:
+                directory += tableTag
+            directory += _packBase128(origLength)
+            if flags >> 6 != _nullTransform(tableTag):
+                directory += _packBase128(length)
+        stream = b"".join(tables[e[0]] for e in entries)
+        compressed = brotli.compress(stream, mode=brotli.MODE_FONT)
+        fontData = _pad(directory + compressed)
+
+        (header[9], header[12]), blocks, end = _moveBlocks(
+            m,
+            WOFF2_HEADER_SIZE + len(fontData),
+            [(header[9], header[10]), (header[12], header[13])],
+        )
+        header[2] = end
+        header[3] = len(entries)
+        header[5] = totalSfntSize
+        header[6] = len(compressed)
+
+        with _replaceFile(path) as out:
+            out.write(struct.pack(WOFF2_HEADER, *header))
+            out.write(fontData)
+            out.write(blocks)
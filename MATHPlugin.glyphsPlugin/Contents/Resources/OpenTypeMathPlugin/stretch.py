@@ -0,0 +1,101 @@
+"""Which construction of a stretchy glyph a math renderer picks for a given
+size: the smallest variant that is large enough, or else the assembly
+stretched to the size, or else the largest variant, as in MathML Core
+(https://w3c.github.io/mathml-core/#algorithms-for-glyph-stretching)."""
+
+from bisect import bisect_left
+from collections import namedtuple
+
+from OpenTypeMathPlugin.assembly import AssemblyEngine, assemblyParts
+from OpenTypeMathPlugin.constants import (
+    CONSTANTS_ID,
+    H_ASSEMBLY_ID,
+    H_VARIANTS_ID,
+    VARIANTS_ID,
+    V_ASSEMBLY_ID,
+    V_VARIANTS_ID,
+)
+from OpenTypeMathPlugin.helpers import MetricsIndex
+
+Construction = namedtuple("Construction", ["variant", "size", "layout"])
+Construction.__doc__ = """The construction picked for some size: the name of
+the variant and its size, or None and the size and AssemblyLayout of the
+assembly."""
+
+
+class StretchyGlyph:
+    """The variants of a glyph in one direction, sorted by size, and an
+    AssemblyEngine for its assembly, if it has one, along with the names of
+    the assembly parts."""
+
+    def __init__(self, variants, sizes, engine=None, parts=()):
+        order = sorted(range(len(variants)), key=sizes.__getitem__)
+        self.variants = [variants[i] for i in order]
+        self.sizes = [sizes[i] for i in order]
+        self.engine = engine
+        self.parts = list(parts)
+
+    def select(self, target):
+        """The Construction for `target`, or None if there is none."""
+        i = bisect_left(self.sizes, target)
+        if i < len(self.sizes):
+            return Construction(self.variants[i], self.sizes[i], None)
+        if self.engine is not None:
+            layout = self.engine.layout(target)
+            return Construction(None, layout.size, layout)
+        if self.sizes:
+            return Construction(self.variants[-1], self.sizes[-1], None)
+        return None
+
+    def selectMany(self, targets):
+        return [self.select(target) for target in targets]
+
+
+class StretchIndex(dict):
+    """Maps glyph names to their StretchyGlyph in one direction, for one
+    master of `font` (the first one by default).
+
+    Glyphs are measured as by the MATH table builder, and only the first time
+    they are looked up, like the glyphs of MetricsIndex."""
+
+    def __init__(self, font, master=None, vertical=True):
+        super().__init__()
+        self.font = font
+        self.master = master if master is not None else font.masters[0]
+        self.vertical = vertical
+        self.metrics = MetricsIndex(font, {}, self.master.id)
+        constants = self.master.userData.get(CONSTANTS_ID) or {}
+        self.minOverlap = constants.get("MinConnectorOverlap", 0)
+
+    def measure(self, name):
+        metrics = self.metrics[name]
+        return metrics.height if self.vertical else metrics.width
+
+    def __missing__(self, name):
+        glyph = self.font.glyphs[name]
+        layer = glyph.layers[self.master.id]
+        variantsId = V_VARIANTS_ID if self.vertical else H_VARIANTS_ID
+        assemblyId = V_ASSEMBLY_ID if self.vertical else H_ASSEMBLY_ID
+
+        glyphData = glyph.userData.get(VARIANTS_ID) or {}
+        variants = [str(n) for n in glyphData.get(variantsId) or ()] or [name]
+        sizes = [self.measure(n) for n in variants]
+
+        engine = None
+        parts = []
+        layerData = layer.userData.get(VARIANTS_ID) or {}
+        if assembly := layerData.get(assemblyId):
+            parts = [str(p[0]) for p in assembly]
+            advances = [self.measure(n) for n in parts]
+            engine = AssemblyEngine(assemblyParts(assembly, advances), self.minOverlap)
+
+        stretchy = self[name] = StretchyGlyph(variants, sizes, engine, parts)
+        return stretchy
+
+    def select(self, name, target):
+        return self[name].select(target)
+
+    def selectMany(self, names, targets):
+        """The Constructions of each of `names` for each of `targets`."""
+        targets = list(targets)
+        return {name: self[name].selectMany(targets) for name in names}
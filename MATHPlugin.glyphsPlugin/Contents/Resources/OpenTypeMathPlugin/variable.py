@@ -0,0 +1,238 @@
+from OpenTypeMathPlugin.build import BuildContext, MathTableBuilder
+from OpenTypeMathPlugin.sfnt import canSpliceTable, spliceTables
+
+GDEF_VARSTORE_VERSION = 0x00010003
+
+
+def orderedMasters(font):
+    """Masters with the variable font origin first."""
+    masters = list(font.masters)
+    if origin := font.customParameters["Variable Font Origin"]:
+        for i, master in enumerate(masters):
+            if origin in (master.id, master.name):
+                masters.insert(0, masters.pop(i))
+                break
+    return masters
+
+
+def axisTriples(font, masters):
+    """(minimum, default, maximum) of each font axis, as spanned by the
+    masters with the first one being the default."""
+    triples = []
+    for i in range(len(font.axes)):
+        values = [m.axes[i] for m in masters]
+        triples.append((min(values), values[0], max(values)))
+    return triples
+
+
+def normalizeLocation(font, location, triples):
+    from fontTools.varLib.models import normalizeValue
+
+    return {
+        axis.axisTag: normalizeValue(location[i], triples[i])
+        for i, axis in enumerate(font.axes)
+    }
+
+
+def _alignValues(values, path=()):
+    """Make the per-master `values` structurally identical, so that the MATH
+    tables built from them have their MathValueRecords at the same places.
+
+    Dictionaries get the union of the keys of all masters. Whatever a master
+    is missing is 0 in that master, lists and tuples included, which keep the
+    shape and the glyph names of the other masters with all their numbers 0.
+    That way e.g. a kern set in some masters only varies to nothing in the
+    others instead of moving there. Lists and tuples that do not match in
+    shape between the masters raise a ValueError."""
+    reference = next(v for v in values if v is not None)
+
+    if isinstance(reference, dict):
+        keys = list(reference)
+        for value in values:
+            if isinstance(value, dict):
+                keys.extend(k for k in value if k not in reference)
+        aligned = {
+            key: _alignValues(
+                [v.get(key) if isinstance(v, dict) else None for v in values],
+                (*path, key),
+            )
+            for key in dict.fromkeys(keys)
+        }
+        return [{k: a[i] for k, a in aligned.items()} for i in range(len(values))]
+
+    if isinstance(reference, set):
+        union = set().union(*(v for v in values if isinstance(v, set)))
+        return [union] * len(values)
+
+    if isinstance(reference, (list, tuple)):
+        if any(
+            v is not None
+            and (not isinstance(v, (list, tuple)) or len(v) != len(reference))
+            for v in values
+        ):
+            raise ValueError(
+                "The masters do not match in MATH data "
+                + "/".join(str(p) for p in path)
+            )
+        columns = [
+            _alignValues([v[i] if v is not None else None for v in values], path)
+            for i in range(len(reference))
+        ]
+        return [type(reference)(c[i] for c in columns) for i in range(len(values))]
+
+    if isinstance(reference, (int, float)) and not isinstance(reference, bool):
+        return [
+            v if isinstance(v, (int, float)) and not isinstance(v, bool) else 0
+            for v in values
+        ]
+
+    return [reference] * len(values)
+
+
+def _mathValueRecords(table):
+    """All MathValueRecords of an otTables object, in a stable order."""
+    from fontTools.ttLib.tables import otTables
+
+    if isinstance(table, otTables.MathValueRecord):
+        yield table
+    elif isinstance(table, list):
+        for item in table:
+            yield from _mathValueRecords(item)
+    elif hasattr(table, "getConverters"):
+        for converter in table.getConverters():
+            yield from _mathValueRecords(getattr(table, converter.name, None))
+
+
+def _mergeVarStore(target, store):
+    """Append the regions and VarData of `store` to `target`, returning the
+    outer index of the first appended VarData."""
+    regionList = target.VarRegionList
+    regions = {
+        tuple((a.StartCoord, a.PeakCoord, a.EndCoord) for a in r.VarRegionAxis): i
+        for i, r in enumerate(regionList.Region)
+    }
+    regionMap = []
+    for region in store.VarRegionList.Region:
+        key = tuple(
+            (a.StartCoord, a.PeakCoord, a.EndCoord) for a in region.VarRegionAxis
+        )
+        if key not in regions:
+            regions[key] = len(regionList.Region)
+            regionList.Region.append(region)
+        regionMap.append(regions[key])
+    regionList.RegionCount = len(regionList.Region)
+
+    outer = len(target.VarData)
+    for varData in store.VarData:
+        varData.VarRegionIndex = [regionMap[i] for i in varData.VarRegionIndex]
+        target.VarData.append(varData)
+    target.VarDataCount = len(target.VarData)
+    return outer
+
+
+class VariableMathBuilder:
+    """MATH tables for variable fonts.
+
+    A MATH table is built for every master, and values that differ between
+    the masters get a VariationIndex device table pointing into the GDEF
+    item variation store."""
+
+    @staticmethod
+    def collectMathData(font, instance, caches=None, context=None):
+        """Collect the MATH data of every master of `font`, for exporting the
+        variable `instance`. Returns the normalized master locations and the
+        per-master MATH data, or None if there is no MATH data."""
+        if context is None:
+            context = BuildContext(font)
+
+        masters = orderedMasters(font)
+        triples = axisTriples(font, masters)
+        locations = []
+        masterData = []
+        for master in masters:
+            cache = caches(master) if caches else None
+            mathData = MathTableBuilder.collectMathData(
+                font, cache, context, master=master, instance=instance
+            )
+            locations.append(normalizeLocation(font, master.axes, triples))
+            masterData.append(mathData)
+
+        if all(mathData is None for mathData in masterData):
+            return
+        return locations, masterData
+
+    @staticmethod
+    def writeMathTable(variableData, path):
+        """Build a variable MATH table from collected `variableData` into the
+        variable font file at `path`, adding its deltas to the GDEF variation
+        store. Returns whether a MATH table was written."""
+        if not variableData:
+            return False
+
+        from fontTools.otlLib.builder import buildMathTable
+        from fontTools.ttLib import TTFont, newTable
+        from fontTools.ttLib.tables import otTables
+        from fontTools.varLib.builder import buildVarDevTable
+        from fontTools.varLib.models import VariationModel
+        from fontTools.varLib.varStore import OnlineVarStoreBuilder
+
+        locations, masterData = variableData
+        masterData = _alignValues(masterData)
+
+        splice = canSpliceTable(path)
+        with TTFont(path, lazy=True if splice else None) as ttFont:
+            axisTags = [axis.axisTag for axis in ttFont["fvar"].axes]
+            locations = [
+                {tag: loc[tag] for tag in axisTags if loc.get(tag)} for loc in locations
+            ]
+
+            masterRecords = []
+            for mathData in reversed(masterData):
+                buildMathTable(ttFont, **mathData)
+                masterRecords.insert(0, list(_mathValueRecords(ttFont["MATH"].table)))
+
+            # ttFont["MATH"] is now the table of the default master.
+            model = VariationModel(locations, axisOrder=axisTags)
+            builder = OnlineVarStoreBuilder(axisTags)
+            builder.setModel(model)
+            devices = []
+            for records in zip(*masterRecords):
+                values = [r.Value for r in records]
+                if len(set(values)) > 1:
+                    base, varIdx = builder.storeMasters(values)
+                    records[0].Value = base
+                    devices.append((records[0], varIdx))
+
+            if devices:
+                store = builder.finish()
+                if "GDEF" in ttFont:
+                    gdef = ttFont["GDEF"].table
+                else:
+                    ttFont["GDEF"] = newTable("GDEF")
+                    gdef = ttFont["GDEF"].table = otTables.GDEF()
+                    gdef.Version = GDEF_VARSTORE_VERSION
+                    gdef.GlyphClassDef = gdef.AttachList = None
+                    gdef.LigCaretList = gdef.MarkAttachClassDef = None
+                    gdef.MarkGlyphSetsDef = gdef.VarStore = None
+                if gdef.Version < GDEF_VARSTORE_VERSION:
+                    gdef.Version = GDEF_VARSTORE_VERSION
+                    gdef.MarkGlyphSetsDef = getattr(gdef, "MarkGlyphSetsDef", None)
+                    gdef.VarStore = None
+
+                if gdef.VarStore is None:
+                    gdef.VarStore = store
+                    outer = 0
+                else:
+                    outer = _mergeVarStore(gdef.VarStore, store)
+                for record, varIdx in devices:
+                    record.DeviceTable = buildVarDevTable(varIdx + (outer << 16))
+
+            if not splice:
+                ttFont.save(path)
+                return True
+
+            tables = {"MATH": ttFont["MATH"].compile(ttFont)}
+            if devices:
+                tables["GDEF"] = ttFont["GDEF"].compile(ttFont)
+        spliceTables(path, tables)
+        return True
@@ -1,13 +1,15 @@
 import AppKit
+import os
 import traceback
 import vanilla
 
 from functools import cached_property
-from GlyphsApp import GSGlyphReference, GSMetricsTypexHeight, Message
-from OpenTypeMathPlugin import NSLocalizedString
+from GlyphsApp import Glyphs, GSGlyphReference, GSMetricsTypexHeight
+from OpenTypeMathPlugin import NSLocalizedString, _message
 from OpenTypeMathPlugin.constants import (
     CONSTANTS_ID,
     CONSTANT_UNSIGNED,
+    DEFAULT_PREVIEW_SIZE,
     EXTENDED_SHAPE_ID,
     H_ASSEMBLY_ID,
     H_VARIANTS_ID,
@@ -20,22 +22,63 @@ from OpenTypeMathPlugin.constants import (
     MATH_CONSTANTS_SCRIPTS,
     MATH_CONSTANTS_STACKS,
     MATH_CONSTANTS_TOOLTIPS,
-    NAME,
+    PREVIEW_SIZE_ID,
     VARIANTS_ID,
     V_ASSEMBLY_ID,
     V_VARIANTS_ID,
 )
+from OpenTypeMathPlugin.guess import (
+    NameIndex,
+    connectorLengths,
+    guessAssembly,
+    guessAssemblyNames,
+    guessVariants,
+)
+from OpenTypeMathPlugin.helpers import indexGlyphs
+from OpenTypeMathPlugin.preview import StretchPreview
+
+
+class ImportProgressWindow:
+    def __init__(self, task):
+        self.task = task
+        title = NSLocalizedString("Importing MATH table from {fileName}…", "")
+        title = title.format(fileName=os.path.basename(task.path))
+        self.window = window = vanilla.FloatingWindow((360, 60), title, closable=False)
+        window.progress = vanilla.ProgressBar("auto", maxValue=1)
+        window.cancel = vanilla.Button(
+            "auto", NSLocalizedString("Cancel", ""), callback=self.cancelCallback
+        )
+        window.addAutoPosSizeRules(
+            [
+                "H:|-[progress]-[cancel]-|",
+                "V:|-[cancel]-|",
+            ]
+        )
+        progress = window.progress.getNSProgressIndicator()
+        cancel = window.cancel.getNSButton()
+        progress.centerYAnchor().constraintEqualToAnchor_(
+            cancel.centerYAnchor()
+        ).setActive_(True)
+
+    def open(self):
+        self.window.open()
+
+    def close(self):
+        self.window.close()
 
+    def update(self):
+        self.window.progress.set(self.task.progress)
 
-def _message(message):
-    Message(message, NAME)
+    def cancelCallback(self, sender):
+        self.task.cancel()
+        sender.enable(False)
 
 
 class VariantsWindow:
     def __init__(self, layer):
         self.layer = layer
         self.glyph = glyph = layer.parent
-        width, height = 650, 400
+        width, height = 650, 460
         title = NSLocalizedString(
             "MATH Variants for ‘{glyphName}’ from {familyName}", ""
         )
@@ -102,14 +145,26 @@ class VariantsWindow:
             )
             tab.check.show(i == 0)
 
+            tab.preview = StretchPreview("auto", layer, i == 0)
+            tab.slider = vanilla.Slider(
+                "auto", continuous=True, callback=self.sliderCallback
+            )
+            tab.slider.getNSSlider().setTag_(i)
+            tab.size = vanilla.TextBox("auto", "", alignment="right")
+
             if i == 0:
                 rules = [
                     "V:[aList]-[check(22)]-4-[prev]-|",
                     "V:[check]-4-[next]",
                     "H:|-[check]-|",
+                    "V:[slider]-[check]",
                 ]
             else:
-                rules = ["V:[aList]-[prev]-|", "V:[aList]-[next]"]
+                rules = [
+                    "V:[aList]-[prev]-|",
+                    "V:[aList]-[next]",
+                    "V:[slider]-[prev]",
+                ]
             rules.extend(
                 [
                     "V:|[vButton]-6-[vEdit(40)]-[aButton]-6-[aList]",
@@ -118,7 +173,10 @@ class VariantsWindow:
                     f"H:|-[vEdit({width})]-|",
                     "H:|-[aLabel]-[aButton(26)]-|",
                     "V:[aLabel]-6-[aList]",
-                    "H:|-[aList]-|",
+                    "H:|-[aList]-[preview(220)]-|",
+                    "V:[aButton]-6-[preview]-6-[slider]",
+                    "H:[aList]-[slider]-[size(50)]-|",
+                    "V:[preview]-6-[size]",
                     "H:|-[prev]-4-[next(==prev)]-|",
                 ]
             )
@@ -157,6 +215,10 @@ class VariantsWindow:
         if extended := glyph.userData[EXTENDED_SHAPE_ID]:
             window.tabs[0].check.set(bool(extended))
 
+        size = Glyphs.defaults[PREVIEW_SIZE_ID] or DEFAULT_PREVIEW_SIZE
+        for i in range(2):
+            self.updatePreview(i, size)
+
     def open(self):
         self.window.open()
 
@@ -198,203 +260,55 @@ class VariantsWindow:
     def guessVariantsCallback(self, sender):
         try:
             tag = sender.getNSButton().tag()
-            glyph = self.glyph
-            font = glyph.parent
-            name = glyph.name
-
-            alternates = [g.name for g in font.glyphs if g.name.startswith(name + ".")]
-            if not alternates:
-                return
-
-            suffixes = ["size", "s"]
-            varId = H_VARIANTS_ID if tag else V_VARIANTS_ID
-            if varId == V_VARIANTS_ID:
-                suffixes += ["disp", "display"]
-
-            for suffix in suffixes:
-                prefix = f"{name}.{suffix}"
-                n_prefix = len(prefix)
-                variants = []
-                for alternate in alternates:
-                    if alternate.startswith(prefix) and alternate[n_prefix:].isdigit():
-                        variants.append(alternate)
-                    elif alternate == prefix:
-                        variants.append(alternate)
-                if variants:
-                    tab = self.window.tabs[tag]
-                    tab.vEdit.set(" ".join([name] + variants))
-                    self.editTextCallback(tab.vEdit)
-                    return
+            index = NameIndex(self.glyph.parent)
+            if variants := guessVariants(index, self.glyph.name, not tag):
+                tab = self.window.tabs[tag]
+                tab.vEdit.set(" ".join(variants))
+                self.editTextCallback(tab.vEdit)
         except Exception:
             _message(traceback.format_exc())
 
-    def guessAssembly(self, vertical):
-        glyph = self.glyph
-        font = glyph.parent
-        name = glyph.name
-
-        for l, r, t, b, m, e in [  # noqa: E741
-            ["lft", "rgt", "top", "bot", "mid", "ext"],
-            ["left", "right", "top", "bottom", "middle", "extension"],
-            ["lt", "rt", "tp", "bt", "md", "ex"],
-            ["l", "r", "t", "b", "m", "x"],
-        ]:
-            if (ext := font.glyphs[f"{name}.{e}"]) is None:
-                continue
-
-            mid = font.glyphs[f"{name}.{m}"]
-            if vertical:
-                top = font.glyphs[f"{name}.{t}"]
-                bot = font.glyphs[f"{name}.{b}"]
-                if not top and not bot:
-                    continue
-                if bot and not top:
-                    parts = [bot, ext]
-                elif top and not bot:
-                    parts = [ext, top]
-                elif mid:
-                    parts = [bot, ext, mid, ext, top]
-                else:
-                    parts = [bot, ext, top]
-            else:
-                lft = font.glyphs[f"{name}.{l}"]
-                rgt = font.glyphs[f"{name}.{r}"]
-                if not lft and not rgt:
-                    continue
-                if lft and not rgt:
-                    parts = [lft, ext]
-                elif rgt and not lft:
-                    parts = [ext, rgt]
-                elif mid:
-                    parts = [lft, ext, mid, ext, rgt]
-                else:
-                    parts = [lft, ext, rgt]
-
-            return parts
-
     def guessAssemblyCallback(self, sender):
         try:
             tag = sender.getNSButton().tag()
-
-            assemblyId = H_ASSEMBLY_ID if tag else V_ASSEMBLY_ID
-            vertical = assemblyId == V_ASSEMBLY_ID
-            if (parts := self.guessAssembly(vertical)) is None:
-                # Fallback using legacy encoded assembly parts
-                glyph = self.glyph
-                font = glyph.parent
-                name = glyph.name
-                unicode = glyph.unicode
-
-                names = []
-                if name == "parenleft" or unicode == "0028":
-                    names = ["239D", "239C", "239B"]
-                elif name == "parenright" or unicode == "0029":
-                    names = ["23A0", "239F", "239E"]
-                elif name == "bracketleft" or unicode == "005B":
-                    names = ["23A3", "23A2", "23A1"]
-                elif name == "bracketright" or unicode == "005D":
-                    names = ["23A6", "23A5", "23A4"]
-                elif name == "braceleft" or unicode == "007B":
-                    names = ["23A9", "23AA", "23A8", "23AA", "23A7"]
-                elif name == "braceright" or unicode == "007D":
-                    names = ["23AD", "23AA", "23AC", "23AA", "23AB"]
-                elif name == "integral" or unicode == "222B":
-                    names = ["2321", "23AE", "2320"]
-                elif name == "radical" or unicode == "221A":
-                    names = ["23B7", "2502", "250C"]
-                elif unicode == "23B0":
-                    names = ["23AD", "23AA", "23A7"]
-                elif unicode == "23B1":
-                    names = ["23A9", "23AA", "23AB"]
-                elif unicode in {
-                    "007C",
-                    "2016",
-                    "2223",
-                    "2225",
-                    "2980",
-                    "0305",
-                    "0332",
-                }:
-                    names = [name, name]
-
-                parts = [font.glyphs[n] for n in names]
-                if not all(parts):
-                    return
-
-            if not parts:
+            vertical = not tag
+            font = self.glyph.parent
+            index = NameIndex(font)
+            if not (names := guessAssemblyNames(font, index, self.glyph, vertical)):
                 return
 
+            masterId = self.layer.associatedMasterId
+            layers = [font.glyphs[n].layers[masterId] for n in names]
+            lengths = connectorLengths(layers, vertical)
+            items = [
+                {"g": name, "f": bool(flags), "s": start, "e": end}
+                for name, flags, start, end in guessAssembly(names, lengths)
+            ]
             tab = self.window.tabs[tag]
-            items = []
-            for i, part in enumerate(parts):
-                ext = bool(i % 2)
-                layer = part.layers[self.layer.associatedMasterId]
-                # Guess start and end connector lengths.
-                #
-                # This is rather crude. The idea is to find the line segments in the
-                # respective direction (vertical or horizontal) that are at the
-                # respective end (top/bottom, right/left).
-                # If the line segments are in pairs, we assume these are straight stems
-                # ans then take the length of the shortest of those segments.
-                #
-                # The first (top or left) part is skipped for start connector length,
-                # ditto for the last (bottom or right) part for end connector length.
-                start = end = 0
-                for shape in layer.shapes:
-                    path = shape.bezierPath
-                    if vertical:
-                        # Find vertical lines
-                        lines = [
-                            s.bounds
-                            for s in path.segments()
-                            if int(s.bounds.size.height)
-                            and not int(s.bounds.size.width)
-                        ]
-                        # Find lines at top and bottom
-                        starts = [
-                            line
-                            for line in lines
-                            if line.origin.y == layer.bounds.origin.y
-                        ]
-                        ends = [
-                            line
-                            for line in lines
-                            if (line.origin.y + line.size.height)
-                            == (layer.bounds.origin.y + layer.bounds.size.height)
-                        ]
-                        if i != 0 and len(starts) and (len(starts) % 2) == 0:
-                            start = min(a.size.height for a in starts)
-                        if (i < len(parts) - 1) and len(ends) and (len(ends) % 2) == 0:
-                            end = min(a.size.height for a in ends)
-                    else:
-                        # Find horizontal lines
-                        lines = [
-                            s.bounds
-                            for s in path.segments()
-                            if int(s.bounds.size.width)
-                            and not int(s.bounds.size.height)
-                        ]
-                        # Find lines at left and right
-                        starts = [
-                            line
-                            for line in lines
-                            if line.origin.x == layer.bounds.origin.x
-                        ]
-                        ends = [
-                            line
-                            for line in lines
-                            if (line.origin.x + line.size.width)
-                            == (layer.bounds.origin.x + layer.bounds.size.width)
-                        ]
-                        if i != 0 and len(starts) and (len(starts) % 2) == 0:
-                            start = min(a.size.width for a in starts)
-                        if (i < len(parts) - 1) and len(ends) and (len(ends) % 2) == 0:
-                            end = min(a.size.width for a in ends)
-
-                items.append({"g": part.name, "f": ext, "s": start, "e": end})
             tab.aList.set(items)
             self.listEditCallback(tab.aList)
-            return
+        except Exception:
+            _message(traceback.format_exc())
+
+    def updatePreview(self, tag, size=None):
+        """Read the variants and the assembly of the preview of tab `tag`
+        again, and fit the slider to its sizes."""
+        tab = self.window.tabs[tag]
+        tab.preview.update()
+        if size is None:
+            size = tab.slider.get()
+        minValue, maxValue = tab.preview.sizeRange()
+        tab.slider.setMinValue(minValue)
+        tab.slider.setMaxValue(maxValue)
+        tab.slider.set(min(max(size, minValue), maxValue))
+        self.sliderCallback(tab.slider)
+
+    def sliderCallback(self, sender):
+        try:
+            tab = self.window.tabs[sender.getNSSlider().tag()]
+            size = round(sender.get())
+            tab.size.set(str(size))
+            tab.preview.setSize(size)
         except Exception:
             _message(traceback.format_exc())
 
@@ -419,8 +333,10 @@ class VariantsWindow:
                 del varData[variantsId]
             if varData:
                 glyph.userData[VARIANTS_ID] = dict(varData)
+                indexGlyphs(glyph.parent, [glyph])
             elif VARIANTS_ID in glyph.userData:
                 del glyph.userData[VARIANTS_ID]
+            self.updatePreview(tag)
         except Exception:
             _message(traceback.format_exc())
 
@@ -450,6 +366,9 @@ class VariantsWindow:
             elif assemblyId in varData:
                 del varData[assemblyId]
             layer.userData[VARIANTS_ID] = dict(varData)
+            if varData:
+                indexGlyphs(self.glyph.parent, [self.glyph])
+            self.updatePreview(tag)
         except Exception:
             _message(traceback.format_exc())
 
@@ -1,48 +1,101 @@
 # Copyright 2021 Nagwa Limited
 
+import os
+import threading
+import time
 import traceback
+from functools import partial
 
 import objc
 import AppKit
 
-from fontTools.ttLib import TTFont
 from GlyphsApp import (
     DOCUMENTEXPORTED,
     DOCUMENTOPENED,
     DRAWBACKGROUND,
     EDIT_MENU,
     GLYPH_MENU,
+    INSTANCETYPEVARIABLE,
     VIEW_MENU,
     Glyphs,
-    GSAnchor,
     GSGlyphReference,
     GSCallbackHandler,
 )
 from GlyphsApp.plugins import GeneralPlugin
-from OpenTypeMathPlugin import NSLocalizedString
-from OpenTypeMathPlugin.build import MathTableBuilder
+from OpenTypeMathPlugin import NSLocalizedString, _message
 from OpenTypeMathPlugin.constants import (
+    BUILD_CACHE_ID,
     CONSTANTS_ID,
-    EXTENDED_SHAPE_ID,
+    DEBUG_ID,
+    DEFAULT_PREVIEW_SIZE,
     ITALIC_CORRECTION_ANCHOR,
-    KERN_BOTTOM_LEFT_ANCHOR,
-    KERN_BOTTOM_RIGHT_ANCHOR,
-    KERN_TOP_LEFT_ANCHOR,
-    KERN_TOP_RIGHT_ANCHOR,
     MATH_CONSTANTS,
     NAME,
     PLUGIN_ID,
+    PREVIEW_SIZE_ID,
+    SCHEMA_VERSION,
+    SCHEMA_VERSION_ID,
     SKIP_EXPORT_ID,
     STATUS_ID,
     TOP_ACCENT_ANCHOR,
     H_ASSEMBLY_ID,
     H_VARIANTS_ID,
     VARIANTS_ID,
+    VARIANTS_INDEX_ID,
     V_ASSEMBLY_ID,
     V_VARIANTS_ID,
 )
-from OpenTypeMathPlugin.drawing import MathDrawing
-from OpenTypeMathPlugin.windows import ConstantsWindow, VariantsWindow, _message
+from OpenTypeMathPlugin.errors import reporter
+from OpenTypeMathPlugin.helpers import indexedGlyphs, indexGlyphs
+from OpenTypeMathPlugin.sfnt import facesWithTable
+
+# The builder, importer, drawing and window modules, and with them fontTools
+# and vanilla, are only imported once they are needed, so that they do not
+# slow down the start of Glyphs.
+
+# Seconds between checks of a running MATH import, and before showing its
+# progress.
+IMPORT_POLL_INTERVAL = 0.1
+IMPORT_DELAY = 0.5
+
+# The View menu toggles, by the DrawingSettings attribute they set.
+TOGGLES = {
+    "showIC": "toggleShowIC:",
+    "showTA": "toggleShowTA:",
+    "showMK": "toggleShowMK:",
+    "showGV": "toggleShowGV:",
+    "showGA": "toggleShowGA:",
+    "showSP": "toggleShowSP:",
+}
+
+# Lines listed in the summary of a font-wide guess.
+SUMMARY_LINES = 20
+
+
+def _summary(heading, lines):
+    """`heading` followed by the first SUMMARY_LINES of `lines`."""
+    if not lines:
+        return heading
+    shown = lines[:SUMMARY_LINES]
+    if len(lines) > len(shown):
+        shown.append(f"… and {len(lines) - len(shown)} more")
+    return heading + ":\n" + "\n".join(shown)
+
+
+class DrawingSettings:
+    """The state of the View menu toggles, kept in memory so that drawing
+    does not read the defaults for every layer."""
+
+    __slots__ = (*TOGGLES, "anyShown", "previewSize")
+
+    def __init__(self, defaults):
+        self.update(defaults)
+
+    def update(self, defaults):
+        for name, action in TOGGLES.items():
+            setattr(self, name, bool(defaults[f"{PLUGIN_ID}.{action}"]))
+        self.anyShown = any(getattr(self, name) for name in TOGGLES)
+        self.previewSize = defaults[PREVIEW_SIZE_ID] or DEFAULT_PREVIEW_SIZE
 
 
 class MATHPlugin(GeneralPlugin):
@@ -53,6 +106,13 @@ class MATHPlugin(GeneralPlugin):
     @objc.python_method
     def start(self):
         self.defaults = Glyphs.defaults
+        self.exportBatch = None
+        self.exportLock = threading.Lock()
+        self.importWindows = {}
+        self.drawingSettings = DrawingSettings(self.defaults)
+        # Errors in callbacks that run over and over must not show an alert
+        # each time.
+        reporter.notify = self.notification_
 
         if self.defaults.get(SKIP_EXPORT_ID):
             self.notification_(
@@ -90,6 +150,13 @@ class MATHPlugin(GeneralPlugin):
         )
         Glyphs.menu[VIEW_MENU].append(menuItem)
 
+        menuItem = self.newMenuItem_(
+            NSLocalizedString("Show MATH Stretch Preview", ""),
+            self.toggleShowSP_,
+            defaultState=AppKit.NSOffState,
+        )
+        Glyphs.menu[VIEW_MENU].append(menuItem)
+
         menuItem = self.newMenuItem_(
             NSLocalizedString("Edit MATH Variants…", ""), self.editGlyph_, False
         )
@@ -99,6 +166,20 @@ class MATHPlugin(GeneralPlugin):
         menuItem.setKeyEquivalent_("x")
         Glyphs.menu[GLYPH_MENU].append(menuItem)
 
+        menuItem = self.newMenuItem_(
+            NSLocalizedString("Guess MATH Variants of All Glyphs", ""),
+            self.guessVariants_,
+            False,
+        )
+        Glyphs.menu[GLYPH_MENU].append(menuItem)
+
+        menuItem = self.newMenuItem_(
+            NSLocalizedString("Guess MATH Assemblies of All Glyphs", ""),
+            self.guessAssemblies_,
+            False,
+        )
+        Glyphs.menu[GLYPH_MENU].append(menuItem)
+
         menuItem = self.newMenuItem_(
             NSLocalizedString("Edit MATH Constants…", ""), self.editFont_, False
         )
@@ -108,12 +189,18 @@ class MATHPlugin(GeneralPlugin):
         menuItem.setKeyEquivalent_("x")
         Glyphs.menu[EDIT_MENU].append(menuItem)
 
+        # The toggles may also be changed from scripts.
+        AppKit.NSNotificationCenter.defaultCenter().addObserver_selector_name_object_(
+            self, "defaultsChanged:", AppKit.NSUserDefaultsDidChangeNotification, None
+        )
+
     @objc.python_method
     def __del__(self):
         if not self.defaults.get(SKIP_EXPORT_ID):
             Glyphs.removeCallback(self.export_)
         Glyphs.removeCallback(self.open_)
         Glyphs.removeCallback(self.draw_)
+        AppKit.NSNotificationCenter.defaultCenter().removeObserver_(self)
 
     @objc.python_method
     def __file__(self):
@@ -124,27 +211,31 @@ class MATHPlugin(GeneralPlugin):
         Glyphs.showNotification(self.name, message)
 
     def validateMenuItem_(self, menuItem):
-        if menuItem.identifier() == "editFont:":
+        if menuItem.identifier() in ("editFont:", "guessVariants:", "guessAssemblies:"):
             return Glyphs.font is not None
         return Glyphs.font is not None and Glyphs.font.selectedLayers
 
     @objc.python_method
-    def newMenuItem_(self, title, action, setState=True):
+    def newMenuItem_(self, title, action, setState=True, defaultState=AppKit.NSOnState):
         menuItem = AppKit.NSMenuItem.new()
         menuItem.setTitle_(title)
         menuItem.setAction_(action)
         menuItem.setTarget_(self)
         if setState:
-            self.setMenuItemState_(menuItem)
+            self.setMenuItemState_(menuItem, defaultState=defaultState)
         return menuItem
 
     @objc.python_method
-    def setMenuItemState_(self, menuItem, state=None):
+    def setMenuItemState_(self, menuItem, state=None, defaultState=AppKit.NSOnState):
         key = f"{PLUGIN_ID}.{menuItem.identifier()}"
         if state is None:
-            state = self.defaults.get(key, AppKit.NSOnState)
+            state = self.defaults.get(key, defaultState)
         self.defaults[key] = state
         menuItem.setState_(state)
+        self.drawingSettings.update(self.defaults)
+
+    def defaultsChanged_(self, notification):
+        self.drawingSettings.update(self.defaults)
 
     def toggleShowIC_(self, menuItem):
         newState = AppKit.NSOnState
@@ -186,8 +277,18 @@ class MATHPlugin(GeneralPlugin):
         self.setMenuItemState_(menuItem, newState)
         Glyphs.redraw()
 
+    def toggleShowSP_(self, menuItem):
+        newState = AppKit.NSOnState
+        state = menuItem.state()
+        if state == AppKit.NSOnState:
+            newState = AppKit.NSOffState
+        self.setMenuItemState_(menuItem, newState)
+        Glyphs.redraw()
+
     def editFont_(self, menuItem):
         try:
+            from OpenTypeMathPlugin.windows import ConstantsWindow
+
             master = Glyphs.font.selectedFontMaster
             window = ConstantsWindow(master)
             window.open()
@@ -196,6 +297,8 @@ class MATHPlugin(GeneralPlugin):
 
     def editGlyph_(self, menuItem):
         try:
+            from OpenTypeMathPlugin.windows import VariantsWindow
+
             layer = Glyphs.font.selectedLayers[0]
             window = VariantsWindow(layer)
             window.open()
@@ -203,273 +306,279 @@ class MATHPlugin(GeneralPlugin):
             _message(f"Editing failed:\n{traceback.format_exc()}")
 
     @objc.python_method
-    def draw_(self, layer, options):
+    def changeFont(self, font, actionName, change, *args):
+        """Call `change` with `args` as one undoable action named
+        `actionName`, without updating the interface until it is done."""
+        undoManager = font.undoManager()
+        font.disableUpdateInterface()
+        undoManager.beginUndoGrouping()
         try:
-            scale = 1 / options["Scale"]
+            return change(*args)
+        finally:
+            undoManager.endUndoGrouping()
+            undoManager.setActionName_(actionName)
+            font.enableUpdateInterface()
 
-            if self.defaults[f"{PLUGIN_ID}.toggleShowIC:"]:
-                MathDrawing.drawAnchors(layer, ITALIC_CORRECTION_ANCHOR, scale)
-            if self.defaults[f"{PLUGIN_ID}.toggleShowTA:"]:
-                MathDrawing.drawAnchors(layer, TOP_ACCENT_ANCHOR, scale)
+    def guessVariants_(self, menuItem):
+        try:
+            from OpenTypeMathPlugin.guess import guessFontVariants
+
+            font = Glyphs.font
+            changes = self.changeFont(
+                font,
+                menuItem.title(),
+                guessFontVariants,
+                font,
+                font.selectedFontMaster.id,
+            )
+            lines = []
+            for name, guesses in changes:
+                for variantsId, names in guesses.items():
+                    direction = (
+                        "vertical" if variantsId == V_VARIANTS_ID else "horizontal"
+                    )
+                    lines.append(f"{name} {direction}: {' '.join(names[1:])}")
+            _message(
+                _summary(f"Guessed MATH variants of {len(changes)} glyphs", lines)
+            )
+        except Exception:
+            _message(f"Guessing failed:\n{traceback.format_exc()}")
 
-            if self.defaults[f"{PLUGIN_ID}.toggleShowMK:"]:
-                MathDrawing.drawMathKern(layer, scale)
+    def guessAssemblies_(self, menuItem):
+        try:
+            from OpenTypeMathPlugin.guess import guessFontAssemblies
+
+            font = Glyphs.font
+            changes = self.changeFont(font, menuItem.title(), guessFontAssemblies, font)
+            masterNames = {m.id: m.name for m in font.masters}
+            lines = []
+            for name, assemblies in changes:
+                for masterId, assemblyId in assemblies:
+                    direction = (
+                        "vertical" if assemblyId == V_ASSEMBLY_ID else "horizontal"
+                    )
+                    lines.append(f"{name} {direction} in {masterNames[masterId]}")
+            _message(
+                _summary(f"Guessed MATH assemblies of {len(changes)} glyphs", lines)
+            )
+        except Exception:
+            _message(f"Guessing failed:\n{traceback.format_exc()}")
+
+    @objc.python_method
+    def draw_(self, layer, options):
+        settings = self.drawingSettings
+        if not settings.anyShown:
+            return
+
+        try:
+            from OpenTypeMathPlugin.canvas import Canvas
+            from OpenTypeMathPlugin.drawing import MathDrawing
 
-            showGV = self.defaults[f"{PLUGIN_ID}.toggleShowGV:"]
-            showGA = self.defaults[f"{PLUGIN_ID}.toggleShowGA:"]
-            if showGV or showGA:
+            scale = 1 / options["Scale"]
+
+            canvas = Canvas()
+            if settings.showIC:
+                MathDrawing.drawAnchors(layer, ITALIC_CORRECTION_ANCHOR, scale, canvas)
+            if settings.showTA:
+                MathDrawing.drawAnchors(layer, TOP_ACCENT_ANCHOR, scale, canvas)
+            if settings.showMK:
+                MathDrawing.drawMathKern(layer, scale, canvas)
+
+            showGV = settings.showGV
+            showGA = settings.showGA
+            showSP = settings.showSP
+            if showGV or showGA or showSP:
                 layerData = layer.userData.get(VARIANTS_ID, {})
                 glyphData = layer.parent.userData.get(VARIANTS_ID, {})
                 if layerData or glyphData:
-                    assembly = layerData.get(V_ASSEMBLY_ID, []) if showGA else []
-                    variants = glyphData.get(V_VARIANTS_ID, []) if showGV else []
-                    if assembly or variants:
-                        MathDrawing.drawVariants(variants, assembly, layer, scale, True)
-
-                    assembly = layerData.get(H_ASSEMBLY_ID, []) if showGA else []
-                    variants = glyphData.get(H_VARIANTS_ID, []) if showGV else []
-                    if assembly or variants:
-                        MathDrawing.drawVariants(
-                            variants, assembly, layer, scale, False
-                        )
+                    for vertical, variantsId, assemblyId in (
+                        (True, V_VARIANTS_ID, V_ASSEMBLY_ID),
+                        (False, H_VARIANTS_ID, H_ASSEMBLY_ID),
+                    ):
+                        allAssembly = layerData.get(assemblyId, [])
+                        allVariants = glyphData.get(variantsId, [])
+                        assembly = allAssembly if showGA else []
+                        variants = allVariants if showGV else []
+                        if assembly or variants:
+                            MathDrawing.drawVariants(
+                                variants, assembly, layer, scale, vertical
+                            )
+                        if showSP and (allAssembly or allVariants):
+                            MathDrawing.drawStretchPreview(
+                                allVariants,
+                                allAssembly,
+                                layer,
+                                scale,
+                                vertical,
+                                settings.previewSize,
+                                canvas,
+                            )
+            canvas.draw()
         except Exception:
-            _message(f"Drawing MATH data failed:\n{traceback.format_exc()}")
+            reporter.report("Drawing MATH data", getattr(layer.parent, "name", None))
 
     @objc.python_method
     def open_(self, notification):
-        """Load glyph names in GSGlyph.userData into GSGlyphReference so they
-        track glyph renames."""
+        """Import the MATH table of compiled fonts, then load glyph names in
+        GSGlyph.userData into GSGlyphReference so they track glyph renames.
+
+        The MATH table is parsed on a worker thread, so that opening a large
+        font does not block the app, and applied once it is ready."""
         try:
             doc = notification.object()
             font = doc.font
+            path = doc.filePath
+            fontNumber = font.tempData.get("TTCFontIndex", 0)
+            # Only compiled fonts with a MATH table need the importer and the
+            # worker thread, this reads nothing but the table directories.
+            if not path or fontNumber not in facesWithTable(path, "MATH"):
+                self.finishOpening(font)
+                return
 
-            try:
-                ttFont = TTFont(
-                    doc.filePath,
-                    fontNumber=font.tempData.get("TTCFontIndex", 0),
-                    lazy=True,
-                    recalcBBoxes=False,
-                )
-            except Exception:
-                pass
-            else:
-                try:
-                    self.importMathTable(font, ttFont)
-                except Exception as ex:
-                    raise ex
-                finally:
-                    ttFont.close()
-                    # Mark font/all glyphs as unchanged
-                    for glyph in font.glyphs:
-                        glyph.undoManager().removeAllActions()
-                        glyph.updateChangeCount_(AppKit.NSChangeCleared)
-                    font.undoManager().removeAllActions()
-                    font.parent.updateChangeCount_(AppKit.NSChangeCleared)
-
-            def gn(n):
-                if isinstance(n, GSGlyphReference):
-                    return n
-                return GSGlyphReference(font.glyphs[n])
-
-            for glyph in font.glyphs:
-                if varData := glyph.userData.get(VARIANTS_ID):
-                    # We used to save the assemblies per-glyph, but we now store it per layer,
-                    # so we migrate old data here.
-                    layerData = {
-                        k: v
-                        for k, v in varData.items()
-                        if k in (H_ASSEMBLY_ID, V_ASSEMBLY_ID)
-                    }
-                    if layerData:
-                        for master in font.masters:
-                            layer = glyph.layers[master.id]
-                            layer.userData[VARIANTS_ID] = layerData
-                        glyph.userData[VARIANTS_ID] = {
-                            k: v
-                            for k, v in varData.items()
-                            if k in (H_VARIANTS_ID, V_VARIANTS_ID)
-                        }
-
-                # Convert glyph names in userData to GSGlyphReference
-                varData = glyph.userData.get(VARIANTS_ID, {})
-                for id in (V_VARIANTS_ID, H_VARIANTS_ID):
-                    if names := varData.get(id):
-                        varData[id] = [gn(n) for n in names]
-                for layer in glyph.layers:
-                    varData = layer.userData.get(VARIANTS_ID, {})
-                    for id in (V_ASSEMBLY_ID, H_ASSEMBLY_ID):
-                        if assembly := varData.get(id):
-                            varData[id] = [(gn(a[0]), *a[1:]) for a in assembly]
-            font.tempData[STATUS_ID] = True
-        except AppKit.MPMissingGlyph as e:
-            _message(f"Opening failed:\n{e}")
+            from OpenTypeMathPlugin.importer import MathImportTask
+
+            task = MathImportTask(font, path, fontNumber)
+            # The document may only be marked as unedited after the import
+            # if it has no changes of its own.
+            task.documentEdited = doc.isDocumentEdited()
+            threading.Thread(target=task.parse, daemon=True).start()
+            self.performSelector_withObject_afterDelay_(
+                "pollImport:", task, IMPORT_POLL_INTERVAL
+            )
         except Exception:
             _message(f"Opening failed:\n{traceback.format_exc()}")
 
-    @staticmethod
-    def importMathTable(font, ttFont):
-        if "MATH" not in ttFont:
+    def pollImport_(self, task):
+        window = self.importWindows.get(task)
+        if not task.done:
+            if window is None and time.perf_counter() - task.start > IMPORT_DELAY:
+                from OpenTypeMathPlugin.windows import ImportProgressWindow
+
+                window = self.importWindows[task] = ImportProgressWindow(task)
+                window.open()
+            if window is not None:
+                window.update()
+            self.performSelector_withObject_afterDelay_(
+                "pollImport:", task, IMPORT_POLL_INTERVAL
+            )
             return
 
-        from fontTools.ttLib.tables import otTables
-
-        master = font.masters[0]
-        userData = master.userData
+        if window is not None:
+            del self.importWindows[task]
+            window.close()
+        self.finishOpening(task.font, task)
 
-        table = ttFont["MATH"].table
+    @objc.python_method
+    def finishOpening(self, font, task=None):
+        """Apply the MATH import `task`, if any, and prepare the userData
+        of `font`."""
+        try:
+            if task is not None and task.error:
+                raise RuntimeError(task.error)
+
+            if task is not None:
+                # The font may have been edited while it was being imported.
+                edited = task.documentEdited or font.parent.isDocumentEdited()
+                if task.apply():
+                    # The import does not register undo actions, and a font
+                    # without changes of its own should not start out as
+                    # edited.
+                    if not edited:
+                        font.parent.updateChangeCount_(AppKit.NSChangeCleared)
+                    if self.defaults.get(DEBUG_ID):
+                        print(
+                            f"{NAME}: imported MATH table of {font.familyName} in "
+                            f"{time.perf_counter() - task.start:.2f} s"
+                        )
 
-        if table.Version != 0x00010000:
-            return
+            self.upgradeUserData(font)
+            # A cancelled import leaves the font without its MATH data, so it
+            # must not be exported as if it had none.
+            if task is None or not task.cancelled:
+                font.tempData[STATUS_ID] = True
+        except AppKit.MPMissingGlyph as e:
+            _message(f"Opening failed:\n{e}")
+        except Exception:
+            _message(f"Opening failed:\n{traceback.format_exc()}")
 
-        def get_glyph(gName):
-            if gName in font.glyphs:
-                return font.glyphs[gName]
-            glyphOrder = ttFont.getGlyphOrder()
-            if gName in glyphOrder:
-                return font.glyphs[glyphOrder.index(gName)]
-            return None
-
-        constants = {}
-        if table.MathConstants:
-            for constant in MATH_CONSTANTS:
-                if (value := getattr(table.MathConstants, constant, None)) is not None:
-                    if isinstance(value, otTables.MathValueRecord):
-                        value = value.Value
-                    constants[constant] = value
-
-        if info := table.MathGlyphInfo:
-            if italic := info.MathItalicsCorrectionInfo:
-                for name, value in zip(
-                    italic.Coverage.glyphs, italic.ItalicsCorrection
-                ):
-                    layer = get_glyph(name).layers[master.id]
-                    layer.anchors[ITALIC_CORRECTION_ANCHOR] = GSAnchor()
-                    layer.anchors[ITALIC_CORRECTION_ANCHOR].position = (
-                        layer.width + value.Value,
-                        0,
-                    )
+    @objc.python_method
+    def upgradeUserData(self, font):
+        """Migrate MATH userData written by older versions of the plug-in and
+        convert the glyph names in it to GSGlyphReference.
+
+        Fonts whose userData is already at the current schema version only
+        have the glyphs in their variants index converted. Other fonts are
+        scanned in full, and get an index once they have MATH userData;
+        fonts without any are not changed."""
+        current = font.userData[SCHEMA_VERSION_ID] == SCHEMA_VERSION
+        glyphs = indexedGlyphs(font) if current else font.glyphs
+
+        def gn(n):
+            if isinstance(n, GSGlyphReference):
+                return n
+            return GSGlyphReference(font.glyphs[n])
+
+        indexed = []
+        for glyph in glyphs:
+            hasData = False
+            if varData := glyph.userData.get(VARIANTS_ID):
+                hasData = True
+                # We used to save the assemblies per-glyph, but we now store it per layer,
+                # so we migrate old data here.
+                layerData = {
+                    k: v
+                    for k, v in varData.items()
+                    if k in (H_ASSEMBLY_ID, V_ASSEMBLY_ID)
+                }
+                if layerData:
+                    for master in font.masters:
+                        layer = glyph.layers[master.id]
+                        layer.userData[VARIANTS_ID] = layerData
+                    glyph.userData[VARIANTS_ID] = {
+                        k: v
+                        for k, v in varData.items()
+                        if k in (H_VARIANTS_ID, V_VARIANTS_ID)
+                    }
 
-            if accent := info.MathTopAccentAttachment:
-                for name, value in zip(
-                    accent.TopAccentCoverage.glyphs, accent.TopAccentAttachment
-                ):
-                    layer = get_glyph(name).layers[master.id]
-                    layer.anchors[TOP_ACCENT_ANCHOR] = GSAnchor()
-                    layer.anchors[TOP_ACCENT_ANCHOR].position = (value.Value, 0)
-
-            if extended := info.ExtendedShapeCoverage:
-                for name in extended.glyphs:
-                    get_glyph(name).userData[EXTENDED_SHAPE_ID] = True
-
-            if kernInfo := info.MathKernInfo:
-                for name, value in zip(
-                    kernInfo.MathKernCoverage.glyphs, kernInfo.MathKernInfoRecords
-                ):
-                    layer = get_glyph(name).layers[master.id]
-
-                    def _kern_to_xy(kern, top):
-                        heights = [h.Value for h in kern.CorrectionHeight]
-                        last = master.ascender
-                        if heights and heights[-1] >= master.ascender:
-                            last = heights[-1] + 100
-                        elif not heights:
-                            last = master.ascender if top else master.descender
-                        heights.append(last)
-                        values = [k.Value for k in kern.KernValue]
-                        return zip(values, heights)
-
-                    if kern := value.TopRightMathKern:
-                        for i, (x, y) in enumerate(_kern_to_xy(kern, True)):
-                            aName = f"{KERN_TOP_RIGHT_ANCHOR}.{i}"
-                            layer.anchors[aName] = GSAnchor("", (x + layer.width, y))
-
-                    if kern := value.BottomRightMathKern:
-                        for i, (x, y) in enumerate(_kern_to_xy(kern, False)):
-                            aName = f"{KERN_BOTTOM_RIGHT_ANCHOR}.{i}"
-                            layer.anchors[aName] = GSAnchor("", (x + layer.width, y))
-
-                    if kern := value.TopLeftMathKern:
-                        for i, (x, y) in enumerate(_kern_to_xy(kern, True)):
-                            aName = f"{KERN_TOP_LEFT_ANCHOR}.{i}"
-                            layer.anchors[aName] = GSAnchor("", (-x, y))
-
-                    if kern := value.BottomLeftMathKern:
-                        for i, (x, y) in enumerate(_kern_to_xy(kern, False)):
-                            aName = f"{KERN_BOTTOM_LEFT_ANCHOR}.{i}"
-                            layer.anchors[aName] = GSAnchor("", (-x, y))
-
-        if variants := table.MathVariants:
-            constants["MinConnectorOverlap"] = variants.MinConnectorOverlap
-
-            if vVariants := variants.VertGlyphCoverage:
-                for name, value in zip(
-                    vVariants.glyphs, variants.VertGlyphConstruction
-                ):
-                    glyph = get_glyph(name)
-                    varData = glyph.userData.get(VARIANTS_ID, {})
-                    if records := value.MathGlyphVariantRecord:
-                        varData[V_VARIANTS_ID] = [
-                            get_glyph(v.VariantGlyph).name for v in records
-                        ]
-                    glyph.userData[VARIANTS_ID] = dict(varData)
-
-                    layer = glyph.layers[master.id]
-                    if assembly := value.GlyphAssembly:
-                        varData[V_ASSEMBLY_ID] = [
-                            [
-                                get_glyph(p.glyph).name,
-                                p.PartFlags,
-                                p.StartConnectorLength,
-                                p.EndConnectorLength,
-                            ]
-                            for p in assembly.PartRecords
-                        ]
-                        if ic := assembly.ItalicsCorrection:
-                            part = varData[V_ASSEMBLY_ID][-1]
-                            partLayer = get_glyph(part[0]).layers[master.id]
-                            partLayer.anchors[ITALIC_CORRECTION_ANCHOR] = GSAnchor()
-                            partLayer.anchors[ITALIC_CORRECTION_ANCHOR].position = (
-                                partLayer.width + ic.Value,
-                                0,
-                            )
-                    layer.userData[VARIANTS_ID] = dict(varData)
-
-            if hVariants := variants.HorizGlyphCoverage:
-                for name, value in zip(
-                    hVariants.glyphs, variants.HorizGlyphConstruction
-                ):
-                    glyph = get_glyph(name)
-                    varData = glyph.userData.get(VARIANTS_ID, {})
-                    if records := value.MathGlyphVariantRecord:
-                        varData[H_VARIANTS_ID] = [
-                            get_glyph(v.VariantGlyph).name for v in records
-                        ]
-                    glyph.userData[VARIANTS_ID] = dict(varData)
-
-                    layer = glyph.layers[master.id]
-                    varData = layer.userData.get(VARIANTS_ID, {})
-                    if assembly := value.GlyphAssembly:
-                        varData[H_ASSEMBLY_ID] = [
-                            [
-                                get_glyph(p.glyph).name,
-                                p.PartFlags,
-                                p.StartConnectorLength,
-                                p.EndConnectorLength,
-                            ]
-                            for p in assembly.PartRecords
-                        ]
-                        if ic := assembly.ItalicsCorrection:
-                            part = varData[H_ASSEMBLY_ID][-1]
-                            partLayer = get_glyph(part[0]).layers[master.id]
-                            partLayer.anchors[ITALIC_CORRECTION_ANCHOR] = GSAnchor()
-                            partLayer.anchors[ITALIC_CORRECTION_ANCHOR].position = (
-                                partLayer.width + ic.Value,
-                                0,
-                            )
-                    layer.userData[VARIANTS_ID] = dict(varData)
+            # Convert glyph names in userData to GSGlyphReference
+            varData = glyph.userData.get(VARIANTS_ID, {})
+            for id in (V_VARIANTS_ID, H_VARIANTS_ID):
+                if names := varData.get(id):
+                    varData[id] = [gn(n) for n in names]
+            for layer in glyph.layers:
+                varData = layer.userData.get(VARIANTS_ID, {})
+                hasData = hasData or bool(varData)
+                for id in (V_ASSEMBLY_ID, H_ASSEMBLY_ID):
+                    if assembly := varData.get(id):
+                        varData[id] = [(gn(a[0]), *a[1:]) for a in assembly]
+            if hasData:
+                indexed.append(glyph)
+
+        # Fonts without any MATH userData are left alone, so that opening
+        # them does not mark them as edited.
+        hasMathData = (
+            indexed
+            or font.userData[VARIANTS_INDEX_ID] is not None
+            or any(m.userData[CONSTANTS_ID] for m in font.masters)
+        )
+        if not current and hasMathData:
+            indexGlyphs(font, indexed, reset=True)
+            font.userData[SCHEMA_VERSION_ID] = SCHEMA_VERSION
 
-        if constants:
-            userData[CONSTANTS_ID] = constants
+    @staticmethod
+    def importMathTable(font, ttFont):
+        """Import the MATH table of `ttFont` into `font` right away, for use
+        from scripts."""
+        from OpenTypeMathPlugin.importer import MathTableImporter
+
+        start = time.perf_counter()
+        if data := MathTableImporter.parseMathTable(ttFont):
+            MathTableImporter.applyMathData(font, data)
+            if Glyphs.defaults.get(DEBUG_ID):
+                print(
+                    f"{NAME}: imported MATH table of {font.familyName} in "
+                    f"{time.perf_counter() - start:.2f} s"
+                )
 
     @objc.python_method
     def export_(self, notification):
@@ -479,72 +588,169 @@ class MATHPlugin(GeneralPlugin):
             path = info["fontFilePath"]
 
             if not instance.font.tempData[STATUS_ID]:
-                _message("Export failed:\nloading math data failed")
-                return
+                raise RuntimeError("loading MATH data failed")
+
+            self.exportFile(instance, path)
+        except Exception:
+            reporter.report("Exporting MATH table")
 
-            font = instance.interpolatedFont
+    @objc.python_method
+    def exportFile(self, instance, path):
+        """Write the MATH table of `instance` into the exported font file at
+        `path`, before the export goes on with the file.
+
+        Exporting a family calls export_ once per font file. What those
+        calls share, the BuildContext of each font and the MATH data of each
+        instance for all of its formats, is kept in the export batch until
+        the export is over, which also sums up the batch in one
+        notification."""
+        from OpenTypeMathPlugin.build import BuildContext, MathTableBuilder
+        from OpenTypeMathPlugin.variable import VariableMathBuilder
+
+        with self.exportLock:
+            if (batch := self.exportBatch) is None:
+                batch = self.exportBatch = {
+                    "contexts": {},
+                    "writers": {},
+                    "exported": 0,
+                    "files": 0,
+                    "failed": 0,
+                }
+                # Runs on the first turn of the main run loop after the
+                # export, once all of its files are written.
+                self.performSelectorOnMainThread_withObject_waitUntilDone_(
+                    "scheduleExportSummary:", None, False
+                )
+            batch["files"] += 1
 
-            with TTFont(path) as ttFont:
-                MathTableBuilder.buildMathTable(font, ttFont)
-                if "MATH" in ttFont:
-                    ttFont.save(path)
-                    self.notification_("MATH table exported successfully")
+        try:
+            if (write := batch["writers"].get(instance)) is None:
+                font = instance.font
+                if (context := batch["contexts"].get(font)) is None:
+                    context = batch["contexts"][font] = BuildContext(font)
+                if instance.type == INSTANCETYPEVARIABLE:
+                    variableData = VariableMathBuilder.collectMathData(
+                        font,
+                        instance,
+                        partial(self.buildCache, instance),
+                        context,
+                    )
+                    write = partial(VariableMathBuilder.writeMathTable, variableData)
+                else:
+                    cache = self.buildCache(instance)
+                    mathData = MathTableBuilder.collectMathData(
+                        instance.interpolatedFont, cache, context
+                    )
+                    write = partial(
+                        MathTableBuilder.writeMathTable, mathData, cache=cache
+                    )
+                batch["writers"][instance] = write
+            if write(path):
+                batch["exported"] += 1
         except Exception:
-            _message(f"Export failed:\n{traceback.format_exc()}")
+            batch["failed"] += 1
+            reporter.report(f"Exporting MATH table to {os.path.basename(path)}")
+
+    def scheduleExportSummary_(self, sender):
+        self.performSelector_withObject_afterDelay_("exportSummary:", None, 0)
+
+    def exportSummary_(self, sender):
+        with self.exportLock:
+            batch, self.exportBatch = self.exportBatch, None
+        if batch is None:
+            return
+
+        if batch["exported"]:
+            self.notification_(
+                f"MATH table exported successfully to {batch['exported']} of "
+                f"{batch['files']} fonts"
+            )
+        if batch["failed"]:
+            # Each failure is reported as it happens, see ErrorReporter.
+            self.notification_(
+                f"Exporting MATH table failed for {batch['failed']} of "
+                f"{batch['files']} fonts, see the Macro panel for details"
+            )
+
+    @objc.python_method
+    def buildCache(self, instance, master=None):
+        """Per-glyph MATH data kept between exports of `instance`, or of one
+        `master` of a variable instance, so that the next export only
+        reprocesses the glyphs that changed."""
+        from OpenTypeMathPlugin.build import MathGlyphCache
+
+        font = instance.font
+        caches = font.tempData[BUILD_CACHE_ID]
+        if caches is None:
+            caches = {}
+            font.tempData[BUILD_CACHE_ID] = caches
+        key = (instance.fontName, master.id if master else None)
+        # Interpolated glyphs change with the instance and master locations
+        # too, without their lastChange changing.
+        scope = (tuple(instance.axes), tuple(tuple(m.axes) for m in font.masters))
+        cache = caches.get(key)
+        if cache is None or cache.scope != scope:
+            cache = caches[key] = MathGlyphCache(scope)
+        return cache
 
     @objc.typedSelector(b"c32@:@@@o^@")
     def interpolateLayer_glyph_interpolation_error_(
         self, layer, glyph, interpolation, error
     ):
-        # Interpolate start and end connector lengths of assemblies
-        if varData := layer.userData.get(VARIANTS_ID, {}):
-            if hAssembly := varData.get(H_ASSEMBLY_ID):
-                for i, _ in enumerate(hAssembly):
-                    start = 0
-                    end = 0
-                    for masterId, factor in interpolation.items():
-                        masterAssembly = (
-                            glyph.layers[masterId]
-                            .userData.get(VARIANTS_ID, {})
-                            .get(H_ASSEMBLY_ID, [])
-                        )
-                        if i < len(masterAssembly):
-                            start += masterAssembly[i][2] * factor
-                            end += masterAssembly[i][3] * factor
-                    hAssembly[i] = (hAssembly[i][0], hAssembly[i][1], start, end)
-            if vAssembly := varData.get(V_ASSEMBLY_ID):
-                for i, _ in enumerate(vAssembly):
-                    start = 0
-                    end = 0
-                    for masterId, factor in interpolation.items():
-                        masterAssembly = (
-                            glyph.layers[masterId]
-                            .userData.get(VARIANTS_ID, {})
-                            .get(V_ASSEMBLY_ID, [])
-                        )
-                        if i < len(masterAssembly):
-                            start += masterAssembly[i][2] * factor
-                            end += masterAssembly[i][3] * factor
-                    vAssembly[i] = (vAssembly[i][0], vAssembly[i][1], start, end)
+        try:
+            # Interpolate start and end connector lengths of assemblies
+            if varData := layer.userData.get(VARIANTS_ID, {}):
+                if hAssembly := varData.get(H_ASSEMBLY_ID):
+                    for i, _ in enumerate(hAssembly):
+                        start = 0
+                        end = 0
+                        for masterId, factor in interpolation.items():
+                            masterAssembly = (
+                                glyph.layers[masterId]
+                                .userData.get(VARIANTS_ID, {})
+                                .get(H_ASSEMBLY_ID, [])
+                            )
+                            if i < len(masterAssembly):
+                                start += masterAssembly[i][2] * factor
+                                end += masterAssembly[i][3] * factor
+                        hAssembly[i] = (hAssembly[i][0], hAssembly[i][1], start, end)
+                if vAssembly := varData.get(V_ASSEMBLY_ID):
+                    for i, _ in enumerate(vAssembly):
+                        start = 0
+                        end = 0
+                        for masterId, factor in interpolation.items():
+                            masterAssembly = (
+                                glyph.layers[masterId]
+                                .userData.get(VARIANTS_ID, {})
+                                .get(V_ASSEMBLY_ID, [])
+                            )
+                            if i < len(masterAssembly):
+                                start += masterAssembly[i][2] * factor
+                                end += masterAssembly[i][3] * factor
+                        vAssembly[i] = (vAssembly[i][0], vAssembly[i][1], start, end)
+        except Exception:
+            reporter.report("Interpolating MATH data", glyph.name)
         return (True, None)
 
     @objc.typedSelector(b"c32@:@@@o^@")
     def interpolateMaster_font_interpolation_error_(
         self, master, font, interpolation, error
     ):
-        # Interpolate math constants
-        constants = {}
-        for c in MATH_CONSTANTS:
-            value = None
-            for masterId, factor in interpolation.items():
-                userData = font.masters[masterId].userData.get(CONSTANTS_ID, {})
-                if v := userData.get(c):
-                    if value is None:
-                        value = 0
-                    value += v * factor
-            if value is not None:
-                constants[c] = round(value)
-        if constants:
-            master.userData[CONSTANTS_ID] = constants
-
+        try:
+            # Interpolate math constants
+            constants = {}
+            for c in MATH_CONSTANTS:
+                value = None
+                for masterId, factor in interpolation.items():
+                    userData = font.masters[masterId].userData.get(CONSTANTS_ID, {})
+                    if v := userData.get(c):
+                        if value is None:
+                            value = 0
+                        value += v * factor
+                if value is not None:
+                    constants[c] = round(value)
+            if constants:
+                master.userData[CONSTANTS_ID] = constants
+        except Exception:
+            reporter.report("Interpolating MATH constants")
         return (True, None)
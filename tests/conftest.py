@@ -0,0 +1,15 @@
+import os
+import sys
+
+RESOURCES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "MATHPlugin.glyphsPlugin",
+    "Contents",
+    "Resources",
+)
+sys.path.insert(0, RESOURCES)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import glyphs  # noqa: E402
+
+glyphs.install()
@@ -0,0 +1,173 @@
+"""A minimal stand-in for the parts of the Glyphs object model that the
+importer uses, so that it can be tested and timed without Glyphs."""
+
+import json
+import os
+import subprocess
+import sys
+import types
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+RESOURCES = os.path.join(
+    os.path.dirname(TESTS), "MATHPlugin.glyphsPlugin", "Contents", "Resources"
+)
+
+
+class UserData(dict):
+    def __getitem__(self, key):
+        return self.get(key)
+
+
+class UndoManager:
+    def disableUndoRegistration(self):
+        pass
+
+    def enableUndoRegistration(self):
+        pass
+
+
+class GSAnchor:
+    def __init__(self, name=None, position=None):
+        self.name = name
+        self.position = position
+
+
+class GSGlyphReference:
+    def __init__(self, glyph):
+        self.glyph = glyph
+
+    def __str__(self):
+        return self.glyph.name
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+
+class GSLayer:
+    def __init__(self, width):
+        self.width = width
+        self.anchors = {}
+        self.userData = UserData()
+
+
+class GSGlyph:
+    def __init__(self, name, layers):
+        self.name = name
+        self.layers = layers
+        self.userData = UserData()
+
+    def undoManager(self):
+        return UndoManager()
+
+
+class GSFontMaster:
+    def __init__(self, id, ascender=800, descender=-200):
+        self.id = id
+        self.ascender = ascender
+        self.descender = descender
+        self.userData = UserData()
+
+
+class GlyphList(list):
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return next((g for g in self if g.name == key), None)
+        return super().__getitem__(key)
+
+
+class GSFont:
+    def __init__(self, glyphs, masters):
+        self.glyphs = GlyphList(glyphs)
+        self.masters = masters
+        self.userData = UserData()
+
+    def undoManager(self):
+        return UndoManager()
+
+    def disableUpdateInterface(self):
+        pass
+
+    def enableUpdateInterface(self):
+        pass
+
+
+def fontFromWidths(widths):
+    """A one master GSFont with a glyph of each of `widths`, a list of
+    (name, advance width)."""
+    master = GSFontMaster("m01")
+    glyphs = [GSGlyph(name, {master.id: GSLayer(width)}) for name, width in widths]
+    return GSFont(glyphs, [master])
+
+
+def install():
+    """Make `from GlyphsApp import …` find the stand-ins."""
+    module = types.ModuleType("GlyphsApp")
+    module.GSAnchor = GSAnchor
+    module.GSGlyphReference = GSGlyphReference
+    sys.modules.setdefault("GlyphsApp", module)
+
+
+class Anything:
+    """Any attribute or call of the Cocoa bridge, for loading plugin.py
+    outside of Glyphs. Called with a function, as a decorator, it returns the
+    function itself."""
+
+    def __getattr__(self, name):
+        return Anything()
+
+    def __call__(self, *args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return Anything()
+
+
+class GeneralPlugin:
+    pass
+
+
+def installApp():
+    """Like install(), with the rest of what plugin.py and the drawing code
+    import from Glyphs, AppKit, Quartz and PyObjC, so that they can be
+    imported and timed without them."""
+    install()
+    glyphsApp = sys.modules["GlyphsApp"]
+    for name in (
+        "DOCUMENTEXPORTED",
+        "DOCUMENTOPENED",
+        "DRAWBACKGROUND",
+        "EDIT_MENU",
+        "GLYPH_MENU",
+        "INSTANCETYPEVARIABLE",
+        "VIEW_MENU",
+    ):
+        setattr(glyphsApp, name, name)
+    glyphsApp.Glyphs = glyphsApp.GSCallbackHandler = glyphsApp.Message = Anything()
+    glyphsApp.__path__ = []
+    plugins = types.ModuleType("GlyphsApp.plugins")
+    plugins.GeneralPlugin = GeneralPlugin
+    sys.modules["GlyphsApp.plugins"] = plugins
+    drawingTools = types.ModuleType("GlyphsApp.drawingTools")
+    drawingTools.save = drawingTools.restore = drawingTools.translate = Anything()
+    sys.modules["GlyphsApp.drawingTools"] = drawingTools
+
+    for name in ("AppKit", "Quartz", "objc"):
+        module = types.ModuleType(name)
+        module.__getattr__ = Anything().__getattr__
+        sys.modules[name] = module
+
+
+def runWithApp(script):
+    """Run `script` in a new interpreter, so that nothing is imported yet,
+    after installApp(), and return what it prints as JSON."""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys\nsys.path[:0] = {[TESTS, RESOURCES]!r}\n"
+            f"import glyphs\nglyphs.installApp()\n{script}",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(result.stdout)
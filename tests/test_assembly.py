@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from OpenTypeMathPlugin.assembly import AssemblyEngine, AssemblyPart
+
+# Target sizes solved per second, at least.
+LAYOUT_RATE = 10000
+
+PAREN = [
+    AssemblyPart(500, 0, 150, False),
+    AssemblyPart(300, 150, 150, True),
+    AssemblyPart(500, 150, 0, False),
+]
+BRACE = [
+    AssemblyPart(400, 0, 100, False),
+    AssemblyPart(200, 80, 80, True),
+    AssemblyPart(450, 120, 120, False),
+    AssemblyPart(200, 60, 90, True),
+    AssemblyPart(400, 100, 0, False),
+]
+# Only an extender, whose connectors are shorter than MinConnectorOverlap.
+BAR = [AssemblyPart(400, 10, 10, True)]
+# Without extenders, the parts are placed once whatever the target.
+ARROW = [AssemblyPart(300, 0, 80, False), AssemblyPart(300, 80, 0, False)]
+
+ASSEMBLIES = [(PAREN, 20), (BRACE, 20), (BAR, 20), (ARROW, 20)]
+TARGETS = range(0, 5000, 37)
+
+
+def bruteForce(parts, minOverlap, target):
+    """The (repeats, overlap) of MathML Core, by trying all repeat counts
+    until the assembly is large enough."""
+    extenders = any(p.extender for p in parts)
+    repeats = 1 if all(p.extender for p in parts) else 0
+    while True:
+        sequence = [
+            i for i, p in enumerate(parts) for _ in range(repeats if p.extender else 1)
+        ]
+        count = len(sequence)
+        advance = sum(parts[i].advance for i in sequence)
+        if not extenders or advance - (count - 1) * minOverlap >= target:
+            break
+        repeats += 1
+
+    if count < 2:
+        return repeats, minOverlap
+    limit = min(
+        min(parts[a].end, parts[b].start) for a, b in zip(sequence, sequence[1:])
+    )
+    overlap = min((advance - target) / (count - 1), limit)
+    return repeats, max(minOverlap, overlap)
+
+
+@pytest.mark.parametrize("parts, minOverlap", ASSEMBLIES)
+def test_solve(parts, minOverlap):
+    engine = AssemblyEngine(parts, minOverlap)
+    for target in TARGETS:
+        repeats, overlap = engine.solve(target)
+        expected = bruteForce(parts, minOverlap, target)
+        assert repeats == expected[0]
+        assert overlap == pytest.approx(expected[1])
+
+
+@pytest.mark.parametrize("parts, minOverlap", ASSEMBLIES)
+def test_layout(parts, minOverlap):
+    engine = AssemblyEngine(parts, minOverlap)
+    for target in TARGETS:
+        layout = engine.layout(target)
+        assert layout.size >= target - 1e-9 or not engine.extenderCount
+
+        indices = [i for i, _ in layout.positions]
+        offsets = [offset for _, offset in layout.positions]
+        end = offsets[-1] + parts[indices[-1]].advance
+        assert end == pytest.approx(layout.size)
+
+        # Adjacent parts overlap by at least MinConnectorOverlap, and by no
+        # more than their connectors unless MinConnectorOverlap needs it.
+        for (a, x), (b, y) in zip(layout.positions, layout.positions[1:]):
+            overlap = x + parts[a].advance - y
+            assert overlap == pytest.approx(layout.overlap)
+            assert overlap >= minOverlap
+            assert overlap <= max(minOverlap, min(parts[a].end, parts[b].start))
+
+
+def test_notStretchable():
+    # Each repeat of the extender adds less than MinConnectorOverlap takes.
+    parts = [*PAREN[:1], AssemblyPart(50, 10, 10, True), *PAREN[2:]]
+    engine = AssemblyEngine(parts, 60)
+    assert not engine.stretchable
+    for target in (0, 900, 5000):
+        layout = engine.layout(target)
+        assert layout.repeats == 1
+        assert layout.overlap == 60
+        assert [i for i, _ in layout.positions] == [0, 1, 2]
+
+
+def test_layoutRate():
+    engine = AssemblyEngine(BRACE, 20)
+    targets = [t / 10 for t in range(50000)]
+    start = time.perf_counter()
+    for target in targets:
+        engine.layout(target)
+    rate = len(targets) / (time.perf_counter() - start)
+    print(f"{rate:.0f} assembly layouts per second")
+    assert rate > LAYOUT_RATE
@@ -0,0 +1,68 @@
+from glyphs import runWithApp
+
+SCRIPT = """
+import json
+from types import SimpleNamespace
+from glyphs import GSAnchor, GSFontMaster, GlyphList, UserData
+from OpenTypeMathPlugin import drawing
+from OpenTypeMathPlugin.canvas import Canvas, RecordingBackend
+from OpenTypeMathPlugin.drawing import MathDrawing
+
+# There is no graphics context to clip the outlines to.
+drawing._clipBounds = lambda: None
+
+def point(x, y):
+    return SimpleNamespace(x=x, y=y)
+
+master = GSFontMaster("m01")
+font = SimpleNamespace(glyphs=GlyphList(), tempData=UserData())
+glyph = SimpleNamespace(name="parenleft", lastChange=None, parent=font)
+layer = SimpleNamespace(
+    layerId=master.id,
+    master=master,
+    parent=glyph,
+    bounds=SimpleNamespace(origin=point(50, -100), size=SimpleNamespace(
+        width=200, height=800
+    )),
+    anchors=[
+        GSAnchor("math.ic", point(220, 0)),
+        GSAnchor("math.tr.0", point(210, 300)),
+        GSAnchor("math.tr.1", point(230, 500)),
+    ],
+)
+
+backend = RecordingBackend()
+canvas = Canvas(backend)
+MathDrawing.drawAnchors(layer, "math.ic", 1, canvas)
+MathDrawing.drawMathKern(layer, 1, canvas)
+MathDrawing.drawStretchPreview([], [], layer, 1, True, 1000, canvas)
+drawn = len(backend.strokes)
+canvas.draw()
+print(json.dumps([drawn, backend.paths, backend.strokes]))
+"""
+
+
+def test_drawPreview():
+    drawn, paths, strokes = runWithApp(SCRIPT)
+
+    # Nothing is stroked before canvas.draw(), and then once per style.
+    assert drawn == 0
+    assert paths == len(strokes) == 4
+    assert strokes == [
+        [["blue", 1, False], [["moveTo", [220, -200]], ["lineTo", [220, 800]]]],
+        [
+            ["green", 2, True],
+            [
+                ["moveTo", [210, -200]],
+                ["lineTo", [210, 300]],
+                ["moveTo", [230, 300]],
+                ["lineTo", [230, 800]],
+            ],
+        ],
+        [
+            ["green", 2, False],
+            [["moveTo", [210, 300]], ["lineTo", [210, 300]], ["lineTo", [230, 300]]],
+        ],
+        # The line of the preview size, centered on the glyph.
+        [["orange", 1, True], [["moveTo", [-50, -200]], ["lineTo", [-50, 800]]]],
+    ]
@@ -0,0 +1,36 @@
+from glyphs import runWithApp
+
+# Layers visible in the edit view, and frames to draw them in.
+LAYERS = 1000
+FRAMES = 20
+# Seconds that the background callbacks of one frame may take with all MATH
+# overlays off, a small part of a 60 Hz frame.
+FRAME_BUDGET = 0.002
+
+SCRIPT = f"""
+import json, time
+import plugin
+from glyphs import GSLayer, UserData
+
+instance = plugin.MATHPlugin()
+instance.drawingSettings = plugin.DrawingSettings(UserData())
+layers = [GSLayer(500) for _ in range({LAYERS})]
+options = {{"Scale": 1.0}}
+frames = []
+for _ in range({FRAMES}):
+    start = time.perf_counter()
+    for layer in layers:
+        instance.draw_(layer, options)
+    frames.append(time.perf_counter() - start)
+print(json.dumps([min(frames), sorted(sys.modules)]))
+"""
+
+
+def test_drawNothingShown():
+    elapsed, modules = runWithApp(SCRIPT)
+    print(f"{LAYERS} layers drawn in {elapsed * 1000:.3f} ms per frame")
+
+    # draw_() returns before it needs the drawing code.
+    assert "OpenTypeMathPlugin.canvas" not in modules
+    assert "OpenTypeMathPlugin.drawing" not in modules
+    assert elapsed < FRAME_BUDGET
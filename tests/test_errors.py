@@ -0,0 +1,28 @@
+from OpenTypeMathPlugin.errors import ErrorReporter
+
+
+def report(reporter, glyph):
+    try:
+        raise ValueError(glyph)
+    except ValueError:
+        reporter.report("Drawing", glyph)
+
+
+def test_reportOnce():
+    notes = []
+    reporter = ErrorReporter()
+    reporter.notify = notes.append
+    for _ in range(3):
+        report(reporter, "a")
+    assert len(reporter.log) == 1
+    assert len(notes) == 1
+    assert list(reporter.problems.values())[0][1] == 2
+
+
+def test_forgetProblems():
+    reporter = ErrorReporter(size=3)
+    for glyph in "abcad":
+        report(reporter, glyph)
+    # "a" was reported again after "b", so "b" is forgotten first.
+    assert [key[-1] for key in reporter.problems] == ["c", "a", "d"]
+    assert [record.glyph for record in reporter.log] == ["b", "c", "d"]
@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+
+import pytest
+
+from OpenTypeMathPlugin import guess
+from OpenTypeMathPlugin.guess import (
+    NameIndex,
+    _edgeLinesNumpy,
+    _edgeLinesPython,
+    guessVariants,
+)
+
+NAMES = [
+    "a",
+    "a.sc",
+    "a.ss01",
+    "b",
+    "b.s1",
+    "b.s2",
+    "b.sc",
+    "integral",
+    "integral.disp",
+    "parenleft",
+    "parenleft.size1",
+    "parenleft.size10",
+    "parenleft.size2",
+    "parenleftbig.size1",
+    "product",
+    "product.display",
+    "summation",
+    "summation.display",
+    "summation.s1",
+    "summation.size1",
+]
+
+# Vertical edges of three layers, the last one without segments.
+EDGES = [(0, 1000), (-100, 500), (0, 300)]
+# Segment bounds as _lineRecords() lists them: (layer index, shape index, x,
+# y, width, height).
+SEGMENTS = [
+    # A stem 150 units long at the bottom and 200 at the top.
+    (0, 0, 100, 0, 0, 200),
+    (0, 0, 250, 0, 0, 150),
+    (0, 0, 100, 800, 0, 200),
+    (0, 0, 250, 800, 0, 200),
+    # Neither lines in the direction of the assembly nor at an edge.
+    (0, 0, 100, 200, 150, 0),
+    (0, 0, 100, 200, 150, 600),
+    (0, 0, 100, 300, 0, 400),
+    # Collinear lines, an odd number at the bottom and a pair at the top.
+    (0, 1, 400, 0, 0, 100),
+    (0, 1, 400, 0, 0, 50),
+    (0, 1, 400, 0, 0, 80),
+    (0, 1, 400, 900, 0, 100),
+    (0, 1, 400, 700, 0, 300),
+    # The same lines twice, and lines shorter than a unit.
+    (1, 0, 0, -100, 0, 120),
+    (1, 0, 0, -100, 0, 120),
+    (1, 0, 0, 499.5, 0.5, 0.5),
+    (1, 0, 0, 499.5, 0.5, 0.5),
+    (1, 1, 50, 400, 0.5, 100),
+    (1, 1, 90, 400, 0.5, 100),
+]
+
+
+def nameIndex(names):
+    glyphs = [SimpleNamespace(name=name) for name in reversed(names)]
+    return NameIndex(SimpleNamespace(glyphs=glyphs))
+
+
+def test_nameIndex():
+    index = nameIndex(NAMES)
+    assert index.names == sorted(NAMES)
+    assert "b.s1" in index
+    assert "b.s" not in index
+    assert list(index.startingWith("parenleft.")) == [
+        "parenleft.size1",
+        "parenleft.size10",
+        "parenleft.size2",
+    ]
+
+
+def test_guessVariants():
+    index = nameIndex(NAMES)
+    # In the order of their numbers, not of their names.
+    assert guessVariants(index, "parenleft", True) == [
+        "parenleft",
+        "parenleft.size1",
+        "parenleft.size2",
+        "parenleft.size10",
+    ]
+    assert guessVariants(index, "b", False) == ["b", "b.s1", "b.s2"]
+    # .size is tried before .s, and display variants are only vertical.
+    assert guessVariants(index, "summation", True) == ["summation", "summation.size1"]
+    assert guessVariants(index, "integral", True) == ["integral", "integral.disp"]
+    assert guessVariants(index, "integral", False) is None
+    assert guessVariants(index, "product", True) == ["product", "product.display"]
+
+
+def test_guessVariantsNotMatching():
+    index = nameIndex(NAMES)
+    # Small capitals and stylistic sets start like .s variants.
+    assert guessVariants(index, "a", True) is None
+    assert guessVariants(index, "a", False) is None
+    assert guessVariants(index, "parenleftbig", True) == [
+        "parenleftbig",
+        "parenleftbig.size1",
+    ]
+    assert guessVariants(index, "parenleft.size1", True) is None
+
+
+@pytest.mark.skipif(guess.numpy is None, reason="NumPy is not installed")
+@pytest.mark.parametrize(
+    "records, edges, vertical",
+    [
+        (SEGMENTS, EDGES, True),
+        # The same segments turned on their side.
+        ([(i, j, y, x, h, w) for i, j, x, y, w, h in SEGMENTS], EDGES, False),
+        ([], EDGES, True),
+        ([], [], True),
+    ],
+)
+def test_edgeLines(records, edges, vertical):
+    starts, ends = _edgeLinesPython(records, edges, vertical)
+    assert _edgeLinesNumpy(records, edges, vertical) == (starts, ends)
+    if records:
+        assert (starts, ends) == ([150, 120, 0], [100, 100, 0])
@@ -0,0 +1,100 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from glyphs import fontFromWidths
+
+pytest.importorskip("glyphsLib")
+from fontTools.ttLib import TTFont  # noqa: E402
+
+from OpenTypeMathPlugin import headless  # noqa: E402
+from OpenTypeMathPlugin.constants import (  # noqa: E402
+    CONSTANTS_ID,
+    ITALIC_CORRECTION_ANCHOR,
+    KERN_TOP_RIGHT_ANCHOR,
+    VARIANTS_ID,
+    VARIANTS_INDEX_ID,
+    V_ASSEMBLY_ID,
+    V_VARIANTS_ID,
+)
+from OpenTypeMathPlugin.importer import MathImportTask, MathTableImporter  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture(scope="module")
+def mathFont(tmp_path_factory):
+    """TestMath-Regular.otf with the MATH table built from Test.glyphs."""
+    path = str(tmp_path_factory.mktemp("fonts") / "TestMath-Regular.otf")
+    shutil.copy(os.path.join(DATA, "TestMath-Regular.otf"), path)
+    source = os.path.join(DATA, "Test.glyphs")
+    assert headless.main([source, "--fonts", path, "--jobs", "1"]) == 0
+    return path
+
+
+def openedFont(ttFont):
+    """The font as Glyphs opens it: the glyphs in the same order, with nice
+    names instead of the production names."""
+    niceNames = {"uni0066": "f"}
+    hmtx = ttFont["hmtx"]
+    return fontFromWidths(
+        [(niceNames.get(n, n), hmtx[n][0]) for n in ttFont.getGlyphOrder()]
+    )
+
+
+def test_importMathTable(mathFont):
+    with TTFont(mathFont) as ttFont:
+        start = time.perf_counter()
+        data = MathTableImporter.parseMathTable(ttFont)
+        parsed = time.perf_counter()
+        font = openedFont(ttFont)
+        MathTableImporter.applyMathData(font, data)
+        applied = time.perf_counter()
+    print(f"parsed in {parsed - start:.4f} s, applied in {applied - parsed:.4f} s")
+
+    master = font.masters[0]
+    constants = master.userData[CONSTANTS_ID]
+    assert constants["AxisHeight"] == 250
+    assert constants["MinConnectorOverlap"] == 20
+
+    # Resolved by glyph ID, the compiled font calls it uni0066.
+    f = font.glyphs["f"].layers[master.id]
+    italic = f.anchors[ITALIC_CORRECTION_ANCHOR]
+    assert italic.position == (f.width + 50, 0)
+    kern = f.anchors[f"{KERN_TOP_RIGHT_ANCHOR}.0"]
+    assert kern.position == (f.width + 20, master.ascender)
+
+    parenleft = font.glyphs["parenleft"]
+    assert parenleft.userData[VARIANTS_ID][V_VARIANTS_ID] == [
+        "parenleft",
+        "parenleft.s1",
+    ]
+    assert parenleft.layers[master.id].userData[VARIANTS_ID][V_ASSEMBLY_ID] == [
+        ["parenleft.bot", 0, 0, 100],
+        ["parenleft.ext", 1, 100, 100],
+        ["parenleft.top", 0, 100, 0],
+    ]
+    assert [str(g) for g in font.userData[VARIANTS_INDEX_ID]] == ["parenleft"]
+
+
+def test_parseWithoutMathTable():
+    with TTFont(os.path.join(DATA, "TestMath-Regular.otf")) as ttFont:
+        assert MathTableImporter.parseMathTable(ttFont) is None
+
+
+def test_parseReportsProgress(mathFont):
+    progress = []
+    with TTFont(mathFont, lazy=True) as ttFont:
+        assert MathTableImporter.parseMathTable(ttFont, progress.append)
+    assert progress == sorted(progress)
+    assert progress[0] == 0 and progress[-1] == 1
+
+
+def test_cancelParsing(mathFont):
+    task = MathImportTask(None, mathFont)
+    task.cancel()
+    task.parse()
+    assert task.done
+    assert task.data is None and task.error is None
@@ -0,0 +1,189 @@
+import os
+import struct
+
+import pytest
+from fontTools.fontBuilder import FontBuilder
+from fontTools.otlLib.builder import buildMathTable
+from fontTools.pens.cu2quPen import Cu2QuPen
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTCollection, TTFont
+
+from OpenTypeMathPlugin.sfnt import facesWithTable, fontTables, spliceTable
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+SOURCE = os.path.join(DATA, "TestMath-Regular.otf")
+
+CHECKSUM_MAGIC = 0xB1B0AFBA
+
+
+def checksum(data):
+    data += b"\0" * (-len(data) % 4)
+    return sum(struct.unpack(f">{len(data) // 4}L", data)) & 0xFFFFFFFF
+
+
+def trueTypeFont(path):
+    """TestMath-Regular.otf with its outlines converted to TrueType."""
+    with TTFont(SOURCE) as otf:
+        glyphOrder = otf.getGlyphOrder()
+        glyphSet = otf.getGlyphSet()
+        glyphs = {}
+        for name in glyphOrder:
+            pen = TTGlyphPen(None)
+            glyphSet[name].draw(Cu2QuPen(pen, 1, reverse_direction=True))
+            glyphs[name] = pen.glyph()
+        hhea = otf["hhea"]
+
+        builder = FontBuilder(otf["head"].unitsPerEm, isTTF=True)
+        builder.setupGlyphOrder(glyphOrder)
+        builder.setupCharacterMap(otf.getBestCmap())
+        builder.setupGlyf(glyphs)
+        builder.setupHorizontalMetrics(dict(otf["hmtx"].metrics))
+        builder.setupHorizontalHeader(ascent=hhea.ascent, descent=hhea.descent)
+        builder.setupNameTable({"familyName": "TestMath", "styleName": "Regular"})
+        builder.setupOS2()
+        builder.setupPost()
+        builder.save(path)
+
+
+@pytest.fixture(params=["otf", "ttf", "otf.woff", "ttf.woff", "otf.woff2", "ttf.woff2"])
+def fontPath(request, tmp_path):
+    outlines, _, flavor = request.param.partition(".")
+    if flavor == "woff2":
+        pytest.importorskip("brotli")
+    path = str(tmp_path / f"TestMath-Regular.{outlines}")
+    if outlines == "ttf":
+        trueTypeFont(path)
+    else:
+        with TTFont(SOURCE) as ttFont:
+            ttFont.save(path)
+    if flavor:
+        with TTFont(path) as ttFont:
+            ttFont.flavor = flavor
+            path = f"{path}.{flavor}"
+            ttFont.save(path)
+    return path
+
+
+def mathTable(path, italicCorrection=50):
+    """A compiled MATH table for the font at `path`."""
+    with TTFont(path, lazy=True) as ttFont:
+        buildMathTable(
+            ttFont,
+            constants={"AxisHeight": 250, "MinConnectorOverlap": 20},
+            italicsCorrections={"uni0066": italicCorrection},
+        )
+        return ttFont["MATH"].compile(ttFont)
+
+
+def readTables(path):
+    """The raw data of every table of the font at `path`, with the checksum
+    adjustment of the head table zeroed."""
+    with TTFont(path, checkChecksums=2) as ttFont:
+        tables = {tag: ttFont.reader[tag] for tag in ttFont.reader.keys()}
+    head = tables["head"]
+    tables["head"] = head[:8] + b"\0\0\0\0" + head[12:]
+    return tables
+
+
+def decodedFont(path):
+    """The sfnt font that the font at `path` decodes to, with its tables in
+    tag order."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] not in (b"wOFF", b"wOF2"):
+        return data
+    with TTFont(path) as ttFont:
+        sfntVersion = ttFont.sfntVersion.encode("latin-1")
+        tables = {tag: ttFont.reader[tag] for tag in sorted(ttFont.reader.keys())}
+
+    numTables = len(tables)
+    entrySelector = numTables.bit_length() - 1
+    searchRange = 16 << entrySelector
+    directory = struct.pack(
+        ">4sHHHH",
+        sfntVersion,
+        numTables,
+        searchRange,
+        entrySelector,
+        numTables * 16 - searchRange,
+    )
+    offset = len(directory) + numTables * 16
+    tableData = b""
+    for tag, data in tables.items():
+        tableChecksum = checksum(data[:8] + b"\0\0\0\0" + data[12:])
+        if tag != "head":
+            tableChecksum = checksum(data)
+        directory += struct.pack(
+            ">4sLLL", tag.encode("latin-1"), tableChecksum, offset, len(data)
+        )
+        data += b"\0" * (-len(data) % 4)
+        tableData += data
+        offset += len(data)
+    return directory + tableData
+
+
+def assertSpliced(path, original, data):
+    tables = readTables(path)
+    assert tables.pop("MATH") == data
+    assert tables == {tag: d for tag, d in original.items() if tag != "MATH"}
+
+    with TTFont(path) as ttFont:
+        italics = ttFont["MATH"].table.MathGlyphInfo.MathItalicsCorrectionInfo
+        assert italics.Coverage.glyphs == ["uni0066"]
+        assert italics.ItalicsCorrection[0].Value == 50
+
+    assert checksum(decodedFont(path)) == CHECKSUM_MAGIC
+
+
+def test_spliceTable(fontPath):
+    original = readTables(fontPath)
+    data = mathTable(fontPath)
+    spliceTable(fontPath, "MATH", data)
+    assertSpliced(fontPath, original, data)
+
+
+def test_replaceTable(fontPath):
+    spliceTable(fontPath, "MATH", mathTable(fontPath, italicCorrection=10))
+    original = readTables(fontPath)
+    data = mathTable(fontPath)
+    spliceTable(fontPath, "MATH", data)
+    assertSpliced(fontPath, original, data)
+
+
+def test_fontTables(fontPath):
+    with TTFont(fontPath) as ttFont:
+        tags = {tag.encode("ascii") for tag in ttFont.reader.keys()}
+    assert b"MATH" not in tags
+    assert fontTables(fontPath) == [tags]
+    assert facesWithTable(fontPath, "MATH") == []
+
+    spliceTable(fontPath, "MATH", mathTable(fontPath))
+    assert fontTables(fontPath) == [tags | {b"MATH"}]
+    assert facesWithTable(fontPath, "MATH") == [0]
+
+
+def test_fontTablesCollection(tmp_path):
+    otf = str(tmp_path / "TestMath-Regular.otf")
+    ttf = str(tmp_path / "TestMath-Regular.ttf")
+    with TTFont(SOURCE) as ttFont:
+        ttFont.save(otf)
+    trueTypeFont(ttf)
+    spliceTable(ttf, "MATH", mathTable(ttf))
+
+    path = str(tmp_path / "TestMath.ttc")
+    collection = TTCollection()
+    collection.fonts = [TTFont(otf), TTFont(ttf)]
+    collection.save(path)
+    faces = fontTables(path)
+    assert [b"CFF " in tags for tags in faces] == [True, False]
+    assert facesWithTable(path, "MATH") == [1]
+    assert facesWithTable(path, b"glyf") == [1]
+
+
+def test_fontTablesNotFont(tmp_path):
+    empty = tmp_path / "empty.otf"
+    empty.write_bytes(b"")
+    missing = tmp_path / "missing.otf"
+    for path in (os.path.join(DATA, "Test.glyphs"), str(empty), str(missing)):
+        assert fontTables(path) == []
+        assert facesWithTable(path, "MATH") == []
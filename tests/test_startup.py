@@ -0,0 +1,35 @@
+from glyphs import runWithApp
+
+# Seconds that importing plugin.py may take when Glyphs starts.
+IMPORT_BUDGET = 0.1
+# What plugin.py must only import once it is needed.
+DEFERRED_MODULES = (
+    "fontTools",
+    "numpy",
+    "vanilla",
+    "OpenTypeMathPlugin.build",
+    "OpenTypeMathPlugin.drawing",
+    "OpenTypeMathPlugin.importer",
+    "OpenTypeMathPlugin.windows",
+)
+
+SCRIPT = """
+import json, time
+start = time.perf_counter()
+import plugin
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, sorted(sys.modules)]))
+"""
+
+
+def test_importPlugin():
+    elapsed, modules = runWithApp(SCRIPT)
+    print(f"plugin.py imported in {elapsed * 1000:.1f} ms")
+
+    loaded = [
+        m
+        for m in modules
+        if any(m == d or m.startswith(f"{d}.") for d in DEFERRED_MODULES)
+    ]
+    assert loaded == []
+    assert elapsed < IMPORT_BUDGET
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+
+import pytest
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables import otTables
+from fontTools.varLib.varStore import OnlineVarStoreBuilder, VarStoreInstancer
+
+from OpenTypeMathPlugin.build import MathTableBuilder
+from OpenTypeMathPlugin.variable import VariableMathBuilder, _alignValues
+
+GLYPH_ORDER = [".notdef", "f", "parenleft"]
+
+
+def mathData(axisHeight, italics=None, kerns=None):
+    """MATH data as MathTableBuilder.collectMathData() collects it."""
+    return dict(
+        constants={"AxisHeight": axisHeight},
+        italicsCorrections=italics or {},
+        topAccentAttachments={},
+        extendedShapes=set(),
+        mathKerns=kerns or {},
+        minConnectorOverlap=20,
+        vertGlyphVariants={},
+        horizGlyphVariants={},
+        vertGlyphAssembly={},
+        horizGlyphAssembly={},
+    )
+
+
+@pytest.fixture
+def fontPath(tmp_path):
+    """A variable font with a weight axis and no MATH table."""
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(GLYPH_ORDER)
+    builder.setupCharacterMap({ord("f"): "f", ord("("): "parenleft"})
+    builder.setupGlyf({name: TTGlyphPen(None).glyph() for name in GLYPH_ORDER})
+    builder.setupHorizontalMetrics({name: (500, 0) for name in GLYPH_ORDER})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({"familyName": "TestMath", "styleName": "Regular"})
+    builder.setupOS2()
+    builder.setupPost()
+    builder.setupFvar([("wght", 400, 400, 700, "Weight")], [])
+    path = str(tmp_path / "TestMath-VF.ttf")
+    builder.save(path)
+    return path
+
+
+def deltas(ttFont, record):
+    """The value of a MathValueRecord at the default and the bold end of the
+    weight axis."""
+    device = record.DeviceTable
+    if device is None:
+        return record.Value, record.Value
+    assert device.DeltaFormat == 0x8000
+    varIdx = (device.StartSize << 16) + device.EndSize
+    store = ttFont["GDEF"].table.VarStore
+    axes = ttFont["fvar"].axes
+    return tuple(
+        record.Value + VarStoreInstancer(store, axes, {"wght": wght})[varIdx]
+        for wght in (0, 1.0)
+    )
+
+
+def test_writeMathTable(fontPath):
+    variableData = (
+        [{"wght": 0}, {"wght": 1.0}],
+        [
+            mathData(250),
+            mathData(300, {"f": 60}, {"f": {"TopRight": ([100], [10, 20])}}),
+        ],
+    )
+    assert VariableMathBuilder.writeMathTable(variableData, fontPath)
+
+    with TTFont(fontPath) as ttFont:
+        table = ttFont["MATH"].table
+        assert deltas(ttFont, table.MathConstants.AxisHeight) == (250, 300)
+
+        info = table.MathGlyphInfo
+        italics = info.MathItalicsCorrectionInfo
+        assert italics.Coverage.glyphs == ["f"]
+        assert deltas(ttFont, italics.ItalicsCorrection[0]) == (0, 60)
+
+        # Set in the bold master only, the kern varies from nothing there.
+        kern = info.MathKernInfo.MathKernInfoRecords[0].TopRightMathKern
+        assert [deltas(ttFont, r) for r in kern.CorrectionHeight] == [(0, 100)]
+        assert [deltas(ttFont, r) for r in kern.KernValue] == [(0, 10), (0, 20)]
+
+
+def test_writeMathTableWithVarStore(fontPath):
+    # A GDEF variation store with deltas of its own, as GPOS would have.
+    with TTFont(fontPath) as ttFont:
+        builder = OnlineVarStoreBuilder(["wght"])
+        builder.setSupports([{"wght": (0, 1.0, 1.0)}])
+        varIdx = builder.storeDeltas([5])
+        ttFont["GDEF"] = newTable("GDEF")
+        gdef = ttFont["GDEF"].table = otTables.GDEF()
+        gdef.Version = 0x00010003
+        gdef.GlyphClassDef = gdef.AttachList = gdef.LigCaretList = None
+        gdef.MarkAttachClassDef = gdef.MarkGlyphSetsDef = None
+        gdef.VarStore = builder.finish()
+        ttFont.save(fontPath)
+
+    variableData = ([{"wght": 0}, {"wght": 1.0}], [mathData(250), mathData(300)])
+    assert VariableMathBuilder.writeMathTable(variableData, fontPath)
+
+    with TTFont(fontPath) as ttFont:
+        store = ttFont["GDEF"].table.VarStore
+        assert store.VarDataCount == 2
+        instancer = VarStoreInstancer(store, ttFont["fvar"].axes, {"wght": 1.0})
+        assert instancer[varIdx] == 5
+        axisHeight = ttFont["MATH"].table.MathConstants.AxisHeight
+        assert axisHeight.DeviceTable.StartSize == 1
+        assert deltas(ttFont, axisHeight) == (250, 300)
+
+
+def test_collectMathDataWithoutDefaultData(fontPath, monkeypatch):
+    masters = [
+        SimpleNamespace(id="m01", name="Regular", axes=[400]),
+        SimpleNamespace(id="m02", name="Bold", axes=[700]),
+    ]
+    font = SimpleNamespace(
+        masters=masters,
+        axes=[SimpleNamespace(axisTag="wght")],
+        customParameters={"Variable Font Origin": None},
+    )
+    masterData = {"m01": None, "m02": mathData(300, {"f": 60})}
+    monkeypatch.setattr(
+        MathTableBuilder,
+        "collectMathData",
+        lambda font, cache, context, master, instance: masterData[master.id],
+    )
+
+    variableData = VariableMathBuilder.collectMathData(font, None, context=object())
+    assert variableData == ([{"wght": 0}, {"wght": 1.0}], list(masterData.values()))
+    assert VariableMathBuilder.writeMathTable(variableData, fontPath)
+
+    with TTFont(fontPath) as ttFont:
+        table = ttFont["MATH"].table
+        assert deltas(ttFont, table.MathConstants.AxisHeight) == (0, 300)
+        italics = table.MathGlyphInfo.MathItalicsCorrectionInfo
+        assert deltas(ttFont, italics.ItalicsCorrection[0]) == (0, 60)
+
+
+def test_alignValuesRejectsShapes():
+    with pytest.raises(ValueError, match="mathKerns/f/TopRight"):
+        _alignValues(
+            [
+                {"mathKerns": {"f": {"TopRight": ([100], [10, 20])}}},
+                {"mathKerns": {"f": {"TopRight": ([], [10])}}},
+            ]
+        )